@@ -0,0 +1,113 @@
+"""Catalog analytics behind the Statistics tab.
+
+The dashboard is computed from one columnar snapshot: the catalog_cube
+summary table, which triggers keep at one row per (genre, year, month
+added) with its book count. Its size is the number of those combinations
+that have books: about 4,000 rows for 1M books added in one month, about
+300,000 if the same books had been added over ten years. It is read in
+one query and aggregated with vectorized pandas group-bys and pivots,
+each weighted by the count column:
+
+    decades            books per decade of publication, and the change on
+                       the decade before
+    genre_by_decade    genre x decade pivot
+    additions          books added per month, the running catalog size and
+                       its month-on-month growth
+    top_authors        from the author_counts summary table
+
+Results are cached per catalog version, so after the first view the tab
+costs a cache lookup until the catalog changes.
+
+    python analytics.py       # print the dashboard and how long it took
+"""
+import time
+from dataclasses import dataclass
+
+import pandas as pd
+
+import db
+import perf
+
+TOP_AUTHORS = 15
+
+
+@dataclass
+class Dashboard:
+    total_books: int
+    total_authors: int
+    genres: pd.Series  # books per genre, largest first
+    years: pd.Series  # books per publication year
+    decades: pd.DataFrame  # books, growth_pct; indexed by decade label
+    genre_by_decade: pd.DataFrame  # decades down, genres across
+    additions: pd.DataFrame  # added, total, growth_pct; indexed by month
+    top_authors: pd.DataFrame  # author, books
+
+
+def read_snapshot(conn):
+    """The catalog as (genre, year, month, count) cells, plus the top authors and author total."""
+    with db.snapshot(conn):
+        cells = pd.DataFrame(conn.execute("SELECT genre, year, month, count FROM catalog_cube").fetchall(),
+                             columns=["genre", "year", "month", "count"])
+        authors = pd.DataFrame(conn.execute(
+            "SELECT author, count FROM author_counts ORDER BY count DESC, author LIMIT ?", (TOP_AUTHORS,)
+        ).fetchall(), columns=["author", "books"])
+        total_authors = conn.execute("SELECT COUNT(*) FROM author_counts").fetchone()[0]
+    return cells, authors, total_authors
+
+
+def build_dashboard(cells, top_authors, total_authors):
+    cells = cells.astype({"year": "Int64", "count": "int64"})
+    cells["genre"] = cells["genre"].fillna("Unknown")
+    # "1950s" and so on, which sort in date order as text; "Unknown" sorts last
+    cells["decade"] = ((cells["year"] // 10 * 10).astype("string") + "s").fillna("Unknown")
+    counts = cells["count"]
+
+    genres = counts.groupby(cells["genre"]).sum().sort_values(ascending=False)
+    years = counts.groupby(cells["year"]).sum()
+
+    decades = counts.groupby(cells["decade"]).sum().rename("books").to_frame()
+    known = decades.index != "Unknown"
+    decades.loc[known, "growth_pct"] = decades.loc[known, "books"].pct_change() * 100
+    genre_by_decade = cells.pivot_table(index="decade", columns="genre", values="count",
+                                        aggfunc="sum", fill_value=0)
+
+    months = pd.PeriodIndex(cells["month"].dropna(), freq="M")
+    added = counts[cells["month"].notna()].groupby(months).sum()
+    if len(added):
+        # Months in which nothing was added still belong on the timeline
+        added = added.reindex(pd.period_range(added.index.min(), added.index.max(), freq="M"), fill_value=0)
+    additions = added.rename("added").to_frame()
+    additions["total"] = additions["added"].cumsum()
+    additions["growth_pct"] = additions["total"].pct_change() * 100
+    additions.index = additions.index.to_timestamp()
+
+    return Dashboard(
+        total_books=int(counts.sum()),
+        total_authors=total_authors,
+        genres=genres,
+        years=years,
+        decades=decades,
+        genre_by_decade=genre_by_decade,
+        additions=additions,
+        top_authors=top_authors,
+    )
+
+
+# Cached results are shared between sessions; treat them as read-only.
+@perf.instrument()
+@db.query_cache.cached(db.catalog_version)
+def get_dashboard():
+    with db.get_connection() as conn:
+        return build_dashboard(*read_snapshot(conn))
+
+
+if __name__ == "__main__":
+    db.init_db()
+    start = time.perf_counter()
+    dashboard = get_dashboard.uncached()
+    elapsed = time.perf_counter() - start
+    print(f"{dashboard.total_books:,} books, {dashboard.total_authors:,} authors")
+    print("\nBooks per decade\n", dashboard.decades.tail(10).round(1).to_string())
+    print("\nAdded per month\n", dashboard.additions.tail(6).round(1).to_string())
+    print("\nTop authors\n", dashboard.top_authors.head(5).to_string(index=False))
+    print(f"\nComputed in {elapsed * 1000:.1f} ms")
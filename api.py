@@ -0,0 +1,422 @@
+"""JSON API over the catalog, run as its own process next to the Streamlit app.
+
+    python api.py [--host 127.0.0.1] [--port 8080] [--pool-size 8] [--shards name=path,...]
+
+    GET    /books?sort=title&genre=Fantasy&limit=24&cursor=...
+    GET    /books/<id>
+    POST   /books                   {"title": ..., "author": ..., "year": ..., ...}
+    PUT    /books/<id>              fields to change, plus "version" to refuse stale writes
+    DELETE /books/<id>?version=3
+    GET    /search?q=tolkien&limit=20&fuzzy=1
+    GET    /genres
+    GET    /stats
+    GET    /health
+
+The server is a small asyncio HTTP/1.1 implementation with keep-alive, so
+it needs nothing outside the standard library. Requests are handled on a
+thread pool no larger than the SQLite connection pool, which bounds the
+number of queries in flight however many clients are connected; the event
+loop itself only reads and writes sockets. GET responses carry an ETag and
+answer a matching If-None-Match with 304, and larger bodies are gzipped for
+clients that accept it. /books pages are keyset-paginated: pass back the
+``next_cursor`` of one page as ``cursor`` to get the next.
+
+With --shards (or LIBRARY_SHARDS) the API serves several branch databases
+as one catalog: lists, search, genres and stats span every branch, books
+carry a "branch" field, and /books/<id> and POST /books take ``?branch=``.
+
+Writes made here move the catalog version stored in the database, so the
+Streamlit app's cached reads are refreshed on its next rerun.
+"""
+import argparse
+import asyncio
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+import db
+import perf
+from cache import QueryCache
+from importer import validate
+
+logger = logging.getLogger("library.api")
+
+HOST = os.environ.get("LIBRARY_API_HOST", "127.0.0.1")
+PORT = int(os.environ.get("LIBRARY_API_PORT", "8080"))
+MAX_PAGE_SIZE = 200
+MAX_BODY_BYTES = 1024 * 1024
+GZIP_MIN_BYTES = 1024
+KEEPALIVE_TIMEOUT = 15  # seconds an idle client connection is kept open
+
+# Short sort names for query strings -> the SORT_ORDERS labels used by the UI
+SORTS = {
+    "title": "Title (A-Z)",
+    "-title": "Title (Z-A)",
+    "author": "Author",
+    "-year": "Year (Newest)",
+    "year": "Year (Oldest)",
+}
+BOOK_FIELDS = ["title", "author", "genre", "year", "isbn", "description"]
+
+# Compressed bodies keyed by ETag, so a popular unchanged response is only
+# gzipped once
+_gzip_cache = QueryCache(max_entries=512, max_bytes=32 * 1024 * 1024, ttl=None)
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _int_param(query, name, default, low, high):
+    value = query.get(name)
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise HTTPError(400, f"{name} must be an integer") from None
+    if not low <= number <= high:
+        raise HTTPError(400, f"{name} must be between {low} and {high}")
+    return number
+
+
+def encode_cursor(cursor):
+    if cursor is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode().rstrip("=")
+
+
+def decode_cursor(token, branches=()):
+    # (sort key, id), or (sort key, branch, id) across branches
+    try:
+        key, *branch, book_id = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        if isinstance(key, (list, dict)) or len(branch) != (1 if branches else 0):
+            raise ValueError(key)
+        if branches and branch[0] not in branches:
+            raise ValueError(branch)
+        return (key, *branch, int(book_id))
+    except (ValueError, TypeError):
+        raise HTTPError(400, "invalid cursor") from None
+
+
+def book_json(book):
+    record = {name: getattr(book, name) for name in db.BOOK_COLUMNS}
+    if book.branch is not None:
+        record["branch"] = book.branch
+    return record
+
+
+def _body_json(body):
+    try:
+        record = json.loads(body or b"{}")
+    except ValueError:
+        raise HTTPError(400, "request body must be JSON") from None
+    if not isinstance(record, dict):
+        raise HTTPError(400, "request body must be a JSON object")
+    return record
+
+
+def _branch(query):
+    # Which branch a book is in; only asked for when serving several
+    branches = db.branches()
+    if not branches:
+        return None
+    branch = query.get("branch")
+    if branch not in branches:
+        raise HTTPError(400, f"branch must be one of {', '.join(branches)}")
+    return branch
+
+
+def _require_book(book_id, branch=None):
+    book = db.get_book(book_id, branch)
+    if book is None:
+        raise HTTPError(404, f"no book with id {book_id}")
+    return book
+
+
+# Handlers take the query parameters, the raw body and any path groups, and
+# return a payload (200) or a (status, payload, headers) tuple.
+
+def list_books(query, body):
+    sort = SORTS.get(query.get("sort", "title"))
+    if sort is None:
+        raise HTTPError(400, f"sort must be one of {', '.join(SORTS)}")
+    limit = _int_param(query, "limit", db.PAGE_SIZE, 1, MAX_PAGE_SIZE)
+    after = decode_cursor(query["cursor"], db.branches()) if query.get("cursor") else None
+    books, cursor = db.get_books_page(sort, query.get("genre"), after=after, limit=limit)
+    return {"items": [book_json(book) for book in books], "next_cursor": encode_cursor(cursor)}
+
+
+def get_book(query, body, book_id):
+    return book_json(_require_book(int(book_id), _branch(query)))
+
+
+def create_book(query, body):
+    branch = _branch(query)
+    row, reason = validate(_body_json(body))
+    if row is None:
+        raise HTTPError(400, reason)
+    try:
+        book = db.get_book(db.add_book(*row, branch=branch), branch)
+    except db.DuplicateISBNError as e:
+        raise HTTPError(409, str(e)) from None
+    location = f"/books/{book.id}" if branch is None else f"/books/{book.id}?branch={branch}"
+    return 201, book_json(book), {"Location": location}
+
+
+def _expected_version(value):
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise HTTPError(400, "version must be an integer") from None
+
+
+def update_book(query, body, book_id):
+    branch = _branch(query)
+    book = _require_book(int(book_id), branch)
+    changes = _body_json(body)
+    # Send back the version you read to have the update refused (409) if
+    # someone else changed the book since
+    expected_version = _expected_version(changes.pop("version", None))
+    unknown = set(changes) - set(BOOK_FIELDS)
+    if unknown:
+        raise HTTPError(400, f"unknown fields: {', '.join(sorted(unknown))}")
+    record = {name: getattr(book, name) for name in BOOK_FIELDS}
+    record.update(changes)
+    row, reason = validate(record, check_isbn="isbn" in changes)
+    if row is None:
+        raise HTTPError(400, reason)
+    try:
+        db.update_book(book.id, *row, expected_version=expected_version, branch=branch)
+    except db.BookNotFoundError as e:
+        raise HTTPError(404, str(e)) from None
+    except (db.ConflictError, db.DuplicateISBNError) as e:
+        raise HTTPError(409, str(e)) from None
+    return book_json(db.get_book(book.id, branch))
+
+
+def delete_book(query, body, book_id):
+    branch = _branch(query)
+    try:
+        db.delete_book(_require_book(int(book_id), branch).id, expected_version=_expected_version(query.get("version")),
+                       branch=branch)
+    except db.BookNotFoundError as e:
+        raise HTTPError(404, str(e)) from None
+    except db.ConflictError as e:
+        raise HTTPError(409, str(e)) from None
+    return 204, None, {}
+
+
+def search(query, body):
+    text = query.get("q", "").strip()
+    if not text:
+        raise HTTPError(400, "q is required")
+    limit = _int_param(query, "limit", db.SEARCH_LIMIT, 1, db.SEARCH_LIMIT)
+    fuzzy = query.get("fuzzy", "0").lower() in ("1", "true", "yes")
+    items = []
+    for book in db.search_books(text, limit, fuzzy):
+        item = book_json(book)
+        item["snippet"] = book.snippet  # HTML, with matches wrapped in <mark>
+        if fuzzy:
+            item["similarity"] = round(book.similarity, 4)
+        items.append(item)
+    return {"query": text, "fuzzy": fuzzy, "items": items}
+
+
+def genres(query, body):
+    return {"genres": db.get_genres()}
+
+
+def stats(query, body):
+    data = db.get_stats()
+    result = {
+        "total_books": data["total_books"],
+        "total_authors": data["total_authors"],
+        "genres": [{"genre": genre, "count": count} for genre, count in data["genre_data"]],
+        "years": [{"year": year, "count": count} for year, count in data["year_data"]],
+    }
+    if "branches" in data:
+        result["branches"] = [{"branch": name, "count": count} for name, count in data["branches"].items()]
+    return result
+
+
+def health(query, body):
+    return {"status": "ok", "catalog_version": db.catalog_version(), "pool": db.get_pool().stats()}
+
+
+ROUTES = [
+    (re.compile(r"/books"), {"GET": list_books, "POST": create_book}),
+    (re.compile(r"/books/(\d+)"), {"GET": get_book, "PUT": update_book, "DELETE": delete_book}),
+    (re.compile(r"/search"), {"GET": search}),
+    (re.compile(r"/genres"), {"GET": genres}),
+    (re.compile(r"/stats"), {"GET": stats}),
+    (re.compile(r"/health"), {"GET": health}),
+]
+
+
+def _etag_matches(header, etag):
+    if header is None:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    return etag.removeprefix("W/") in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+
+def handle(method, target, headers, body):
+    """Run one request and return ``(status, headers, body bytes)``.
+
+    Called on a worker thread; JSON encoding, hashing and compression happen
+    here too so none of it blocks the event loop.
+    """
+    url = urlsplit(target)
+    query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+    extra = {}
+    try:
+        for pattern, methods in ROUTES:
+            match = pattern.fullmatch(url.path.rstrip("/") or "/")
+            if match:
+                break
+        else:
+            raise HTTPError(404, "not found")
+        handler = methods.get("GET" if method == "HEAD" else method)
+        if handler is None:
+            raise HTTPError(405, f"{method} not allowed here")
+        with perf.timed(f"api.{handler.__name__}"):
+            result = handler(query, body, *match.groups())
+        status, payload, extra = result if isinstance(result, tuple) else (200, result, {})
+    except HTTPError as e:
+        status, payload = e.status, {"error": str(e)}
+    except Exception:
+        logger.exception("%s %s failed", method, target)
+        status, payload = 500, {"error": "internal server error"}
+
+    response_headers = {"Content-Type": "application/json", **extra}
+    if payload is None:
+        return status, response_headers, b""
+    data = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode()
+
+    if method in ("GET", "HEAD") and status == 200:
+        etag = f'W/"{hashlib.blake2b(data, digest_size=12).hexdigest()}"'
+        response_headers["ETag"] = etag
+        response_headers["Cache-Control"] = "no-cache"
+        response_headers["Vary"] = "Accept-Encoding"
+        if _etag_matches(headers.get("if-none-match"), etag):
+            return 304, response_headers, b""
+        if len(data) >= GZIP_MIN_BYTES and "gzip" in headers.get("accept-encoding", ""):
+            found, compressed = _gzip_cache.get(etag)
+            if not found:
+                compressed = gzip.compress(data, compresslevel=5)
+                _gzip_cache.put(etag, compressed)
+            response_headers["Content-Encoding"] = "gzip"
+            data = compressed
+    return status, response_headers, data
+
+
+class Server:
+    def __init__(self, host=HOST, port=PORT, workers=None):
+        self.host = host
+        self.port = port
+        # One worker per pooled connection, so the pool is never outgrown
+        self.executor = ThreadPoolExecutor(max_workers=workers or db.get_pool().size, thread_name_prefix="api")
+
+    async def serve_forever(self):
+        server = await asyncio.start_server(self._connection, self.host, self.port, backlog=1024)
+        logger.info("Listening on http://%s:%s", self.host, self.port)
+        async with server:
+            await server.serve_forever()
+
+    async def _connection(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), KEEPALIVE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                    headers = await self._read_headers(reader)
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    await self._send(writer, 400, {"Content-Type": "application/json"},
+                                     b'{"error":"bad request"}', False, False)
+                    break
+                if length > MAX_BODY_BYTES:
+                    await self._send(writer, 413, {"Content-Type": "application/json"},
+                                     b'{"error":"request body too large"}', False, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection == "keep-alive" or (version == "HTTP/1.1" and connection != "close")
+                status, response_headers, data = await loop.run_in_executor(
+                    self.executor, handle, method, target, headers, body)
+                await self._send(writer, status, response_headers, data, keep_alive, method == "HEAD")
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_headers(reader):
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                return headers
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+    @staticmethod
+    async def _send(writer, status, headers, data, keep_alive, head_only):
+        lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}"]
+        headers = {**headers, "Content-Length": str(len(data)), "Connection": "keep-alive" if keep_alive else "close"}
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        if not head_only:
+            writer.write(data)
+        await writer.drain()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the library catalog as a JSON API.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--pool-size", type=int, default=db.POOL_SIZE, help="SQLite connections (and worker threads)")
+    parser.add_argument("--shards", default=os.environ.get("LIBRARY_SHARDS", ""),
+                        help="serve branch databases as one catalog: name=path,name=path (default: LIBRARY_SHARDS)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    db.configure_pool(size=args.pool_size)
+    if args.shards:
+        try:
+            db.configure_shards(args.shards)
+        except ValueError as e:
+            parser.error(str(e))
+    else:
+        db.init_db()
+    try:
+        asyncio.run(Server(args.host, args.port, args.pool_size).serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""Batch updates and deletes over many books at once, with an undo log.
+
+    python batch.py update --genre Sci-Fi --set genre="Science Fiction" [--dry-run]
+    python batch.py delete --search "duplicate copy" [--dry-run]
+    python batch.py log
+    python batch.py undo 12
+
+A batch is one write on the single-writer queue (db.get_writer()): the
+affected rows are copied into the undo log (batch_log / batch_log_rows),
+changed with a single executemany, and the version each row ended up at is
+logged with it. With ``dry_run`` the batch runs in full inside a savepoint
+that is rolled back, so the preview counts are exactly what applying it
+would do. undo_batch restores the logged rows in one write too, skipping
+any book that has been edited or deleted since the batch. Only the most
+recent UNDO_KEEP batches are kept.
+"""
+import argparse
+import json
+import sys
+import time
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+
+import db
+import perf
+from isbn import isbn13_or_none, to_isbn13
+
+EDITABLE_FIELDS = ["title", "author", "genre", "year", "isbn", "description"]
+PREVIEW_ROWS = 20
+UNDO_KEEP = 20
+
+_SNAPSHOT_SQL = f'''
+INSERT INTO batch_log_rows (batch_id, book_id, data)
+SELECT ?, id, json_object({", ".join(f"'{name}', {name}" for name in db.BOOK_COLUMNS)})
+FROM books WHERE id = ?
+'''
+
+
+@dataclass
+class BatchResult:
+    action: str
+    batch_id: int = None
+    matched: int = 0
+    changed: int = 0
+    dry_run: bool = False
+    seconds: float = 0.0
+    preview: list = field(default_factory=list)  # (before, after) Books; after is None for deletes
+    skipped: list = field(default_factory=list)  # ids an undo left alone, as they changed after the batch
+
+    @property
+    def rows_per_second(self):
+        return self.matched / self.seconds if self.seconds else 0.0
+
+
+def select_book_ids(genre=None, search=None, limit=None):
+    """Ids of the books a filter selects, in title order."""
+    sql, params = db.build_book_query(genre, limit=limit, columns=["id"], search=search)
+    with db.get_connection() as conn:
+        return [row[0] for row in conn.execute(sql, params)]
+
+
+def count_books(genre=None, search=None):
+    """How many books a filter selects, without fetching their ids."""
+    sql, params = db.build_book_query(genre, columns=["id"], search=search)
+    with db.get_connection() as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
+
+
+def clean_changes(changes):
+    """Validate field updates; raises ValueError for anything unusable."""
+    unknown = set(changes) - set(EDITABLE_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    if not changes:
+        raise ValueError("No fields to change")
+    cleaned = {}
+    for name, value in changes.items():
+        value = value.strip() if isinstance(value, str) else value
+        if name in ("title", "author") and not value:
+            raise ValueError(f"{name} can't be empty")
+        if name == "isbn":
+            to_isbn13(value)  # raises InvalidISBN, a ValueError
+        if name == "year":
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"invalid year {value!r}") from None
+        cleaned[name] = value
+    return cleaned
+
+
+def _start_batch(conn, action, ids, changes=None):
+    batch_id = conn.execute(
+        "INSERT INTO batch_log (action, changes, created_at) VALUES (?, ?, ?)",
+        (action, json.dumps(changes) if changes else None, datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+    ).lastrowid
+    matched = conn.executemany(_SNAPSHOT_SQL, [(batch_id, book_id) for book_id in ids]).rowcount
+    conn.execute("UPDATE batch_log SET rows = ? WHERE id = ?", (matched, batch_id))
+    # Drop the rows of batches that have fallen out of the undo window
+    conn.execute('''
+    DELETE FROM batch_log_rows WHERE batch_id IN (
+        SELECT id FROM batch_log WHERE id <= ? - ?
+    )''', (batch_id, UNDO_KEEP))
+    conn.execute("DELETE FROM batch_log WHERE id <= ? - ?", (batch_id, UNDO_KEEP))
+    return batch_id, matched
+
+
+def _log_versions(conn, batch_id):
+    # What each book's version was once the batch was done; undo only
+    # touches books that are still at it
+    conn.execute('''
+    UPDATE batch_log_rows SET version_after = (SELECT version FROM books WHERE id = book_id)
+    WHERE batch_id = ?
+    ''', (batch_id,))
+
+
+def _run_batch(write, result, started):
+    # On the writer thread, so a batch queues behind other writes instead of
+    # contending for the file lock; the writer bumps the catalog version
+    def run(conn):
+        if not result.dry_run:
+            return write(conn)
+        conn.execute("SAVEPOINT dry_run")
+        try:
+            return write(conn)
+        finally:
+            conn.execute("ROLLBACK TO dry_run")
+            conn.execute("RELEASE dry_run")
+
+    db.get_writer().run(run, notify=not result.dry_run)
+    if result.dry_run:
+        result.batch_id = None
+    result.seconds = time.monotonic() - started
+    return result
+
+
+@perf.instrument()
+def batch_update(ids, changes, dry_run=False):
+    """Set the same field values on every book in ``ids``."""
+    changes = clean_changes(changes)
+    ids = list(dict.fromkeys(ids))
+    started = time.monotonic()
+    result = BatchResult("update", dry_run=dry_run)
+    result.preview = [(book, replace(book, **changes)) for book in db.get_books(ids[:PREVIEW_ROWS])]
+
+    columns = dict(changes)
+    if "isbn" in changes:
+        columns["isbn13"] = to_isbn13(changes["isbn"])
+        if columns["isbn13"] is not None and len(ids) > 1:
+            raise ValueError("An ISBN belongs to one book; it can't be set on several at once")
+    assignments = ", ".join(f"{name} = ?" for name in columns)
+    # Rows that already hold the new values are left alone, so their
+    # triggers (search index, summary counts) don't fire for nothing
+    differs = " OR ".join(f"{name} IS NOT ?" for name in changes)
+
+    def write(conn):
+        if "isbn" in changes:
+            db._claim_isbn(conn, changes["isbn"], ids[0] if ids else None)
+        result.batch_id, result.matched = _start_batch(conn, "update", ids, changes)
+        result.changed = conn.executemany(
+            f"UPDATE books SET {assignments} WHERE id = ? AND ({differs})",
+            [tuple(columns.values()) + (book_id,) + tuple(changes.values()) for book_id in ids],
+        ).rowcount
+        _log_versions(conn, result.batch_id)
+
+    return _run_batch(write, result, started)
+
+
+@perf.instrument()
+def batch_delete(ids, dry_run=False):
+    ids = list(dict.fromkeys(ids))
+    started = time.monotonic()
+    result = BatchResult("delete", dry_run=dry_run)
+    result.preview = [(book, None) for book in db.get_books(ids[:PREVIEW_ROWS])]
+
+    def write(conn):
+        result.batch_id, result.matched = _start_batch(conn, "delete", ids)
+        result.changed = conn.executemany("DELETE FROM books WHERE id = ?", [(book_id,) for book_id in ids]).rowcount
+
+    return _run_batch(write, result, started)
+
+
+def _restored_isbn13(conn, isbn, book_id):
+    # An ISBN another book has taken since the batch is restored as text but
+    # left out of idx_books_isbn13, rather than blocking the undo
+    isbn13 = isbn13_or_none(isbn)
+    if isbn13 and conn.execute("SELECT 1 FROM books WHERE isbn13 = ? AND id != ?", (isbn13, book_id)).fetchone():
+        return None
+    return isbn13
+
+
+@perf.instrument()
+def undo_batch(batch_id):
+    """Put back the rows a batch changed or deleted; returns a BatchResult.
+
+    An undone update restores only the fields the batch set, so edits made
+    to other fields since then are kept. A book that has been edited or
+    deleted since the batch is left as it is and listed in ``skipped``.
+    """
+    started = time.monotonic()
+    result = BatchResult("undo", batch_id=batch_id)
+
+    def write(conn):
+        batch = conn.execute("SELECT action, changes, undone_at FROM batch_log WHERE id = ?", (batch_id,)).fetchone()
+        if batch is None:
+            raise ValueError(f"Batch {batch_id} is not in the undo log")
+        action, changes, undone_at = batch
+        if undone_at:
+            raise ValueError(f"Batch {batch_id} was already undone at {undone_at}")
+
+        rows = [(json.loads(data), version_after) for data, version_after in conn.execute(
+            "SELECT data, version_after FROM batch_log_rows WHERE batch_id = ?", (batch_id,))]
+        # From scratch on every attempt: the writer runs this again if the
+        # lock was busy
+        result.matched, result.changed, result.skipped = len(rows), 0, []
+        # isbn13 isn't in the snapshots; it is worked out again from isbn
+        isbn13 = lambda row: _restored_isbn13(conn, row["isbn"], row["id"])
+        if action == "update":
+            fields = list(json.loads(changes))
+            columns = fields + (["isbn13"] if "isbn" in fields else [])
+            # Batches logged before version_after existed are restored unchecked
+            sql = (f"UPDATE books SET {', '.join(f'{name} = ?' for name in columns)} "
+                   "WHERE id = ? AND (? IS NULL OR version = ?)")
+            for row, version_after in rows:
+                params = (tuple(row[name] for name in fields) + ((isbn13(row),) if "isbn" in fields else ())
+                          + (row["id"], version_after, version_after))
+                if conn.execute(sql, params).rowcount:
+                    result.changed += 1
+                else:
+                    result.skipped.append(row["id"])
+        else:
+            # AUTOINCREMENT never reuses ids, so the originals are still free
+            columns = db.BOOK_COLUMNS + ["isbn13"]
+            result.changed = conn.executemany(
+                f"INSERT OR IGNORE INTO books ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                [tuple(row[name] for name in db.BOOK_COLUMNS) + (isbn13(row),) for row, _ in rows],
+            ).rowcount
+        conn.execute("UPDATE batch_log SET undone_at = ? WHERE id = ?",
+                     (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), batch_id))
+
+    db.get_writer().run(write)
+    result.seconds = time.monotonic() - started
+    return result
+
+
+def recent_batches(limit=UNDO_KEEP):
+    with db.get_connection() as conn:
+        rows = conn.execute('''
+        SELECT id, action, changes, rows, created_at, undone_at FROM batch_log ORDER BY id DESC LIMIT ?
+        ''', (limit,)).fetchall()
+    return [
+        {"id": row[0], "action": row[1], "changes": json.loads(row[2]) if row[2] else None,
+         "rows": row[3], "created_at": row[4], "undone_at": row[5]}
+        for row in rows
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch edit, delete and undo books.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name in ("update", "delete"):
+        command = commands.add_parser(name)
+        command.add_argument("--genre", help="only books in this genre")
+        command.add_argument("--search", help="only books matching this search")
+        command.add_argument("--dry-run", action="store_true", help="report what would change, change nothing")
+        if name == "update":
+            command.add_argument("--set", action="append", required=True, metavar="FIELD=VALUE",
+                                 help=f"field to change, one of {', '.join(EDITABLE_FIELDS)}; repeatable")
+    commands.add_parser("log")
+    commands.add_parser("undo").add_argument("batch_id", type=int)
+    args = parser.parse_args(argv)
+
+    db.init_db()
+    try:
+        if args.command == "log":
+            for batch in recent_batches():
+                undone = f" (undone {batch['undone_at']})" if batch["undone_at"] else ""
+                print(f"{batch['id']:>5}  {batch['created_at']}  {batch['action']:<6} {batch['rows']:>8,} rows  "
+                      f"{json.dumps(batch['changes']) if batch['changes'] else ''}{undone}")
+        elif args.command == "undo":
+            result = undo_batch(args.batch_id)
+            print(f"Restored {result.changed:,} books.")
+            if result.skipped:
+                print(f"Left {len(result.skipped):,} books that changed after the batch: "
+                      f"{', '.join(map(str, result.skipped))}")
+        else:
+            ids = select_book_ids(args.genre, args.search)
+            if args.command == "update":
+                changes = dict(item.split("=", 1) for item in args.set)
+                result = batch_update(ids, changes, args.dry_run)
+            else:
+                result = batch_delete(ids, args.dry_run)
+            verb = "Would change" if result.dry_run else "Changed"
+            print(f"{verb} {result.changed:,} of {result.matched:,} matched books "
+                  f"in {result.seconds:.2f}s ({result.rows_per_second:,.0f} rows/s).")
+            if result.batch_id:
+                print(f"Undo with: python batch.py undo {result.batch_id}")
+    except ValueError as e:
+        sys.exit(str(e))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""Benchmarks for the data layer, run outside Streamlit.
+
+    python benchmark.py [--sizes 10000,100000,1000000] [--repeat 50] [--output results.json]
+
+Each size gets a synthetic catalog built on the init_db schema, with genre
+and author popularity following a Zipf-like skew. Generated databases are
+kept in bench_data/ and reused on later runs unless --regenerate is given.
+Results are printed as a table and written as JSON with p50/p95/p99
+latencies so runs can be compared. Cases with a p50 target in TARGETS_MS
+are marked as having met or missed it.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import analytics
+import db
+from cards import grid_html
+from perf import percentile_summary
+
+DATA_DIR = "bench_data"
+SIZES = [10_000, 100_000, 1_000_000]
+REPEAT = 50
+# Whole-catalog reads are too slow to repeat as often as point queries
+SLOW_REPEAT = 5
+# p50 latency targets, in ms, that should hold at every catalog size
+TARGETS_MS = {
+    "search_books": 10,
+    "search_books_common": 10,
+    "search_books_fuzzy": 10,
+}
+# Cases that write. They run against a scratch copy of the catalog, so the
+# cached database in DATA_DIR stays exactly as generated for the next run.
+WRITE_CASES = {"add_book", "update_book_x8"}
+
+GENRES = ["Fiction", "Fantasy", "Mystery", "Romance", "Science Fiction", "Thriller", "History",
+          "Biography", "Non-Fiction", "Self-Help", "Classic", "Coming-of-age", "Dystopian",
+          "Magical Realism", "Psychological Fiction", "Poetry", "Horror", "Travel", "Other"]
+
+WORDS = ("the of and a night river house winter garden shadow light empire secret city dream war "
+         "ocean stone silver glass king queen lost last first journey storm fire forest mountain road "
+         "story letter memory child summer island star iron crown song bridge door mirror wolf "
+         "heart time world blood gold moon sun wind dark return").split()
+
+FIRST_NAMES = ["Anna", "Ben", "Clara", "David", "Elena", "Farid", "Grace", "Hiro", "Ines", "Jon",
+               "Kofi", "Lena", "Mateo", "Nora", "Omar", "Priya", "Quinn", "Rosa", "Sven", "Tara"]
+LAST_NAMES = ["Adams", "Baker", "Chen", "Dubois", "Evans", "Fischer", "Garcia", "Haddad", "Ivanova",
+              "Jensen", "Kim", "Lopez", "Moreau", "Nakamura", "Okafor", "Petrov", "Rossi", "Silva"]
+
+
+def zipf_weights(n, s=1.1):
+    return [1 / (rank ** s) for rank in range(1, n + 1)]
+
+
+def isbn13(n):
+    digits = f"978{n % 10**9:09d}"
+    check = (10 - sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits))) % 10
+    return f"{digits[:3]}-{digits[3:]}{check}"
+
+
+def generate_books(size, seed=42, start=0):
+    rng = random.Random(seed)
+    authors = [f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}" for i in range(max(size // 20, 1))]
+    author_cum = list(itertools.accumulate(zipf_weights(len(authors))))
+    genre_cum = list(itertools.accumulate(zipf_weights(len(GENRES))))
+    added_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for i in range(size):
+        title = " ".join(rng.choices(WORDS, k=rng.randint(2, 5))).title()
+        yield (
+            title,
+            rng.choices(authors, cum_weights=author_cum)[0],
+            rng.choices(GENRES, cum_weights=genre_cum)[0],
+            int(rng.triangular(1800, datetime.now().year, 2005)),
+            isbn13(start + i),
+            " ".join(rng.choices(WORDS, k=rng.randint(10, 30))).capitalize() + ".",
+            added_date,
+        )
+
+
+def generate_catalog(path, size, seed=42, batch_size=50_000):
+    """Create (or reuse) a synthetic catalog of ``size`` books at ``path``."""
+    db.configure_pool(path=path)
+    db.init_db()
+    with db.get_connection() as conn:
+        existing = conn.execute("SELECT COUNT(*) FROM books").fetchone()[0]
+        if existing >= size:
+            return existing
+        rows = generate_books(size - existing, seed, start=existing)
+        while True:
+            batch = [row for _, row in zip(range(batch_size), rows)]
+            if not batch:
+                break
+            with conn:
+                conn.executemany('''
+                INSERT INTO books (title, author, genre, year, isbn, description, added_date, isbn13)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', [row + (row[4].replace("-", ""),) for row in batch])
+        conn.execute("ANALYZE")
+    db.bump_catalog_version()
+    return size
+
+
+def remove_catalog(path):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def copy_catalog(path):
+    """Copy the catalog at ``path`` (via the pool) to a scratch file and return its path."""
+    scratch = f"{os.path.splitext(path)[0]}_scratch.db"
+    remove_catalog(scratch)
+    target = sqlite3.connect(scratch)
+    with db.get_connection() as conn:
+        conn.backup(target)
+    target.close()
+    return scratch
+
+
+def time_case(fn, repeat):
+    samples, rows = [], None
+    for _ in range(repeat):
+        args = fn.make_args() if hasattr(fn, "make_args") else ()
+        start = time.perf_counter()
+        result = fn(*args)
+        samples.append(time.perf_counter() - start)
+        rows = _row_count(result)
+    return {**percentile_summary(samples), "rows": rows}
+
+
+def _row_count(result):
+    if isinstance(result, tuple):
+        result = result[0]
+    try:
+        return len(result)
+    except TypeError:
+        return None
+
+
+def misspell(rng, text):
+    # Drop a letter or swap two neighbours, as a hurried typist would
+    i = rng.randrange(1, len(text) - 1)
+    if rng.random() < 0.5:
+        return text[:i] + text[i + 1:]
+    return text[:i - 1] + text[i] + text[i - 1] + text[i + 1:]
+
+
+def _with_args(fn, make_args):
+    def case(*args):
+        return fn(*args)
+
+    case.make_args = make_args
+    return case
+
+
+def browse_render_prep(sort, genre):
+    # What the Browse tab does before handing HTML to Streamlit
+    page, cursor = db.get_books_page(sort, genre)
+    return grid_html(page)
+
+
+def concurrent_updates(ids):
+    # Several sessions saving at once, each a compare-and-swap update
+    def save(book_id):
+        book = db.get_book(book_id)
+        return db.update_book(book.id, book.title, book.author, book.genre, book.year, book.isbn,
+                              book.description, expected_version=book.version)
+
+    with ThreadPoolExecutor(len(ids)) as pool:
+        return list(pool.map(save, ids))
+
+
+def build_cases(conn, rng, repeat):
+    max_id = conn.execute("SELECT MAX(id) FROM books").fetchone()[0]
+    authors = [row[0] for row in conn.execute("SELECT author FROM books ORDER BY RANDOM() LIMIT 50")]
+    titles = [row[0] for row in conn.execute("SELECT title FROM books ORDER BY RANDOM() LIMIT 50")]
+    genres = db.get_genres.uncached()
+    sorts = list(db.SORT_ORDERS)
+    queries = [rng.choice(WORDS)[:4] for _ in range(20)] + [a.split()[1] for a in authors[:10]] + ["silver moon"]
+    # Words in a third of all books, typed in full: the most matches to rank
+    common = ["the", "night", "silver moon", "the night river", "dark return", "king "]
+    typos = ([misspell(rng, " ".join(author.split()[:2])) for author in authors[:20]]
+             + [misspell(rng, " ".join(title.split()[:3])) for title in titles[:20]])
+
+    return {
+        "get_all_books": (db.get_all_books.uncached, SLOW_REPEAT),
+        "get_stats": (db.get_stats.uncached, repeat),
+        "get_genres": (db.get_genres.uncached, repeat),
+        "analytics_dashboard": (analytics.get_dashboard.uncached, repeat),
+        "get_book": (_with_args(db.get_book, lambda: (rng.randint(1, max_id),)), repeat),
+        "get_book_by_isbn": (_with_args(db.get_book_by_isbn, lambda: (isbn13(rng.randrange(max_id)),)), repeat),
+        "search_books": (_with_args(db.search_books, lambda: (rng.choice(queries),)), repeat),
+        "search_books_common": (_with_args(db.search_books, lambda: (rng.choice(common),)), repeat),
+        "search_books_fuzzy": (_with_args(db.search_books, lambda: (rng.choice(typos), db.SEARCH_LIMIT, True)), repeat),
+        "get_books_page": (_with_args(db.get_books_page, lambda: (rng.choice(sorts), rng.choice([None] + genres))), repeat),
+        "get_books_page_deep": (_with_args(
+            lambda title: db.get_books_page("Title (A-Z)", after=(title, 0)),
+            lambda: (rng.choice(titles),)), repeat),
+        "browse_render_prep": (_with_args(browse_render_prep, lambda: (rng.choice(sorts), rng.choice([None] + genres))), repeat),
+        "add_book": (_with_args(db.add_book, lambda: (
+            "Benchmark Book", rng.choice(authors), rng.choice(genres), 2000, "", "Inserted by benchmark.py")), repeat),
+        "update_book_x8": (_with_args(concurrent_updates, lambda: (rng.sample(range(1, max_id + 1), 8),)), repeat),
+    }
+
+
+def run(sizes, repeat, regenerate=False, only=None, seed=42):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    results = []
+    for size in sizes:
+        path = os.path.join(DATA_DIR, f"catalog_{size}.db")
+        if regenerate:
+            remove_catalog(path)
+        start = time.perf_counter()
+        generate_catalog(path, size, seed)
+        print(f"\n{size:,} books ({time.perf_counter() - start:.1f}s to prepare {path})")
+
+        rng = random.Random(seed)
+        with db.get_connection() as conn:
+            cases = build_cases(conn, rng, repeat)
+        scratch = None
+        for name, (fn, case_repeat) in cases.items():
+            if only and name not in only:
+                continue
+            if name in WRITE_CASES and scratch is None:
+                start = time.perf_counter()
+                scratch = copy_catalog(path)
+                db.configure_pool(path=scratch)
+                print(f"  (write cases run on {scratch}, copied in {time.perf_counter() - start:.1f}s)")
+            result = {"size": size, "case": name, **time_case(fn, case_repeat)}
+            results.append(result)
+            target = TARGETS_MS.get(name)
+            if target is not None:
+                result["target_ms"] = target
+            print(f"  {name:<22} p50 {result['p50_ms']:9.2f} ms   p95 {result['p95_ms']:9.2f} ms"
+                  f"   p99 {result['p99_ms']:9.2f} ms   rows {result['rows']}"
+                  + (f"   target {target} ms {'met' if result['p50_ms'] <= target else 'MISSED'}" if target else ""))
+        if scratch is not None:
+            db.configure_pool(path=path)
+            remove_catalog(scratch)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the library data layer.")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in SIZES), help="comma-separated catalog sizes")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="timed calls per case")
+    parser.add_argument("--cases", help="comma-separated subset of cases to run")
+    parser.add_argument("--regenerate", action="store_true", help="rebuild the synthetic catalogs")
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    only = set(args.cases.split(",")) if args.cases else None
+    results = run(sizes, args.repeat, args.regenerate, only)
+
+    if args.output:
+        report = {
+            "meta": {
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+                "platform": platform.platform(),
+                "repeat": args.repeat,
+            },
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
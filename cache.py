@@ -0,0 +1,104 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+import perf
+
+
+def _sizeof(value):
+    # DataFrames report their real footprint; everything else is approximate
+    if hasattr(value, "memory_usage"):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, list) and value and hasattr(value[0], "__slots__"):
+        # Lists of records: estimate from the first one rather than walking all
+        first = value[0]
+        per_record = sys.getsizeof(first) + sum(sys.getsizeof(getattr(first, name)) for name in first.__slots__)
+        return sys.getsizeof(value) + per_record * len(value)
+    return sys.getsizeof(value)
+
+
+class QueryCache:
+    """In-memory LRU cache for query results.
+
+    Entries are bounded by count and by approximate size in bytes, expire
+    after ``ttl`` seconds, and the least recently used entry is evicted
+    first when either limit is hit.
+    """
+
+    def __init__(self, max_entries=128, max_bytes=256 * 1024 * 1024, ttl=300):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (self.ttl is None or time.monotonic() - entry[2] < self.ttl):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[0]
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        size = _sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, time.monotonic())
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def cached(self, version_fn):
+        """Memoize a function on its arguments and the current ``version_fn()``."""
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                key = (fn.__name__, version_fn(), args, tuple(sorted(kwargs.items())))
+                found, value = self.get(key)
+                perf.note_cache(found)
+                if found:
+                    return value
+                value = fn(*args, **kwargs)
+                self.put(key, value)
+                return value
+
+            wrapper.uncached = fn
+            return wrapper
+
+        return decorator
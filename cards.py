@@ -0,0 +1,76 @@
+"""HTML for the book cards shown in the Browse, Search and Edit views.
+
+Card markup is built once per book and kept in a process-wide LRU, keyed
+by book id and checked against the row version, so an edited book never
+renders stale. Covers get a color derived from the book rather
+than a random one, which keeps them stable across reruns. A page of cards
+is joined into a single grid so Streamlit sends one markdown element
+instead of one per card.
+"""
+import html
+import threading
+import zlib
+from collections import OrderedDict
+
+COVER_COLORS = [
+    "#4F46E5", "#7C3AED", "#F43F5E", "#10B981",
+    "#3B82F6", "#F59E0B", "#EC4899", "#8B5CF6"
+]
+MAX_CARDS = 5000
+
+_cards = OrderedDict()  # (book id, with description) -> (version, head html, tail html)
+_lock = threading.Lock()
+
+
+def cover_color(book_id, title):
+    return COVER_COLORS[zlib.crc32(f"{book_id}:{title}".encode()) % len(COVER_COLORS)]
+
+
+def _build(book, description):
+    title = html.escape(book.title)
+    genre = html.escape(book.genre or "Other")
+    head = f"""<div class='book-card fade-in'>
+<div class='book-cover' style='background-color: {cover_color(book.id, book.title)};'>{title}</div>
+<div class='book-title'>{title}</div>
+<div class='book-author'>by {html.escape(book.author)}</div>
+<div class='book-details'><i>📅</i> {book.year}</div>
+<div class='book-details'><i>📚</i> {genre}</div>
+<div class='badge badge-{genre.lower().replace(" ", "")}'>{genre}</div>"""
+    tail = "</div>"
+    if description:
+        text = html.escape(book.description or "No description.").replace("\n", "<br>")
+        tail = f"<details class='book-description'><summary>View Description</summary><p>{text}</p></details></div>"
+    return head, tail
+
+
+def card_html(book, description=True):
+    """Card markup for one Book; search snippets are added per call, not cached."""
+    key = (book.id, description)
+    with _lock:
+        entry = _cards.get(key)
+        if entry is not None and entry[0] == book.version:
+            _cards.move_to_end(key)
+            head, tail = entry[1], entry[2]
+        else:
+            entry = None
+    if entry is None:
+        head, tail = _build(book, description)
+        with _lock:
+            _cards[key] = (book.version, head, tail)
+            while len(_cards) > MAX_CARDS:
+                _cards.popitem(last=False)
+    # Snippets come from highlight(), which has already escaped them
+    snippet = f"<div class='book-snippet'>{book.snippet}</div>" if book.snippet else ""
+    return head + snippet + tail
+
+
+def grid_html(books):
+    # The markdown renderer treats indented lines as code, so cards are joined flush-left
+    return "<div class='book-grid'>" + "".join(card_html(book) for book in books) + "</div>"
+
+
+def forget_card(book_id):
+    """Drop cached markup for a book after it is updated or deleted."""
+    with _lock:
+        _cards.pop((book_id, True), None)
+        _cards.pop((book_id, False), None)
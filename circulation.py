@@ -0,0 +1,409 @@
+"""Circulation: copies, patrons, loans and holds.
+
+    python circulation.py overdue [--date 2026-01-31]
+    python circulation.py loans 42
+    python circulation.py holds 17
+    python circulation.py bench [--clients 16] [--seconds 10] [--output circ.json]
+
+A book (a title) has any number of copies. A copy is available, on_loan or
+on_hold (set aside for a patron's hold). Checkout, return, placing and
+cancelling a hold each run as one transaction on the single writer queue,
+so concurrent desks can't lend the same copy twice; the open-loan index on
+copy_id would refuse it even if they tried. Holds are served first come,
+first served per title: a copy that comes back, or is added, goes to the
+oldest waiting hold, which then has PICKUP_DAYS to collect it.
+
+Circulation writes don't change the catalog, so they don't clear the
+catalog query cache.
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+
+import db
+import perf
+
+LOAN_DAYS = 21
+PICKUP_DAYS = 7
+MAX_LOANS = 20  # open loans per patron
+
+
+class CirculationError(Exception):
+    """A checkout, return or hold the circulation rules don't allow."""
+
+
+@dataclass(slots=True)
+class Loan:
+    id: int
+    copy_id: int
+    patron_id: int
+    book_id: int
+    title: str | None
+    checkout_date: str
+    due_date: str
+    return_date: str | None = None
+
+    def days_overdue(self, today=None):
+        end = date.fromisoformat(self.return_date) if self.return_date else today or date.today()
+        return max((end - date.fromisoformat(self.due_date)).days, 0)
+
+
+@dataclass(slots=True)
+class Hold:
+    id: int
+    book_id: int
+    patron_id: int
+    placed_date: str
+    status: str
+    copy_id: int | None = None
+    pickup_by: str | None = None
+
+
+_LOAN_SQL = '''
+SELECT l.id, l.copy_id, l.patron_id, c.book_id, b.title, l.checkout_date, l.due_date, l.return_date
+FROM loans l
+JOIN copies c ON c.id = l.copy_id
+LEFT JOIN books b ON b.id = c.book_id
+'''
+_HOLD_COLUMNS = "id, book_id, patron_id, placed_date, status, copy_id, pickup_by"
+
+
+def _loans(conn, where, params):
+    return [Loan(*row) for row in conn.execute(f"{_LOAN_SQL} {where}", params)]
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _require(conn, table, id):
+    if conn.execute(f"SELECT 1 FROM {table} WHERE id = ?", (id,)).fetchone() is None:
+        raise CirculationError(f"No {table[:-1]} with id {id}")
+
+
+def _set_aside(conn, copy_id, book_id, today):
+    # A copy that has come free goes to the oldest waiting hold on its title,
+    # or back on the shelf. Returns the hold it was set aside for, if any.
+    hold = conn.execute(
+        "SELECT id FROM holds WHERE book_id = ? AND status = 'waiting' ORDER BY id LIMIT 1", (book_id,)
+    ).fetchone()
+    if hold is None:
+        conn.execute("UPDATE copies SET status = 'available' WHERE id = ?", (copy_id,))
+        return None
+    conn.execute("UPDATE holds SET status = 'ready', copy_id = ?, pickup_by = ? WHERE id = ?",
+                 (copy_id, (today + timedelta(days=PICKUP_DAYS)).isoformat(), hold[0]))
+    conn.execute("UPDATE copies SET status = 'on_hold' WHERE id = ?", (copy_id,))
+    return hold[0]
+
+
+def _add_patron(conn, name, email):
+    try:
+        return conn.execute("INSERT INTO patrons (name, email, joined_date) VALUES (?, ?, ?)",
+                            (name, email, _now())).lastrowid
+    except sqlite3.IntegrityError:
+        raise CirculationError(f"A patron with email {email} already exists") from None
+
+
+def _add_copies(conn, book_id, count, today):
+    _require(conn, "books", book_id)
+    ids = []
+    for _ in range(count):
+        copy_id = conn.execute("INSERT INTO copies (book_id, status, added_date) VALUES (?, 'available', ?)",
+                               (book_id, _now())).lastrowid
+        _set_aside(conn, copy_id, book_id, today)
+        ids.append(copy_id)
+    return ids
+
+
+def _checkout(conn, copy_id, patron_id, today, days):
+    copy = conn.execute("SELECT book_id, status FROM copies WHERE id = ?", (copy_id,)).fetchone()
+    if copy is None:
+        raise CirculationError(f"No copy with id {copy_id}")
+    _require(conn, "patrons", patron_id)
+    book_id, status = copy
+    if status == "on_loan":
+        raise CirculationError(f"Copy {copy_id} is already on loan")
+    if status == "on_hold" and not conn.execute(
+            "UPDATE holds SET status = 'fulfilled' WHERE copy_id = ? AND status = 'ready' AND patron_id = ?",
+            (copy_id, patron_id)).rowcount:
+        raise CirculationError(f"Copy {copy_id} is set aside for another patron's hold")
+    open_loans = conn.execute("SELECT COUNT(*) FROM loans WHERE patron_id = ? AND return_date IS NULL",
+                              (patron_id,)).fetchone()[0]
+    if open_loans >= MAX_LOANS:
+        raise CirculationError(f"Patron {patron_id} already has {open_loans} books out")
+
+    conn.execute("UPDATE copies SET status = 'on_loan' WHERE id = ?", (copy_id,))
+    due_date = (today + timedelta(days=days)).isoformat()
+    loan_id = conn.execute(
+        "INSERT INTO loans (copy_id, patron_id, checkout_date, due_date) VALUES (?, ?, ?, ?)",
+        (copy_id, patron_id, today.isoformat(), due_date),
+    ).lastrowid
+    title = conn.execute("SELECT title FROM books WHERE id = ?", (book_id,)).fetchone()
+    return Loan(loan_id, copy_id, patron_id, book_id, title and title[0], today.isoformat(), due_date)
+
+
+def _return(conn, copy_id, today):
+    loans = _loans(conn, "WHERE l.copy_id = ? AND l.return_date IS NULL", (copy_id,))
+    if not loans:
+        raise CirculationError(f"Copy {copy_id} is not on loan")
+    loan = loans[0]
+    loan.return_date = today.isoformat()
+    conn.execute("UPDATE loans SET return_date = ? WHERE id = ?", (loan.return_date, loan.id))
+    return loan, _set_aside(conn, copy_id, loan.book_id, today)
+
+
+def _place_hold(conn, book_id, patron_id, today):
+    _require(conn, "books", book_id)
+    _require(conn, "patrons", patron_id)
+    try:
+        hold_id = conn.execute("INSERT INTO holds (book_id, patron_id, placed_date) VALUES (?, ?, ?)",
+                               (book_id, patron_id, today.isoformat())).lastrowid
+    except sqlite3.IntegrityError:
+        raise CirculationError(f"Patron {patron_id} already has a hold on book {book_id}") from None
+    # Copies are only ever on the shelf when nobody is waiting, so a shelved
+    # copy goes straight to this hold
+    copy = conn.execute("SELECT id FROM copies WHERE book_id = ? AND status = 'available' LIMIT 1",
+                        (book_id,)).fetchone()
+    if copy is not None:
+        _set_aside(conn, copy[0], book_id, today)
+    return hold_id
+
+
+def _close_hold(conn, hold_id, status, today):
+    hold = conn.execute("SELECT book_id, status, copy_id FROM holds WHERE id = ?", (hold_id,)).fetchone()
+    if hold is None or hold[1] not in ("waiting", "ready"):
+        raise CirculationError(f"Hold {hold_id} is not open")
+    book_id, previous, copy_id = hold
+    conn.execute("UPDATE holds SET status = ? WHERE id = ?", (status, hold_id))
+    if previous == "ready":
+        _set_aside(conn, copy_id, book_id, today)
+
+
+def _expire_holds(conn, today):
+    expired = [row[0] for row in conn.execute(
+        "SELECT id FROM holds WHERE status = 'ready' AND pickup_by < ? ORDER BY id", (today.isoformat(),))]
+    for hold_id in expired:
+        _close_hold(conn, hold_id, "expired", today)
+    return len(expired)
+
+
+def _write(fn, *args):
+    return db.get_writer().run(fn, *args, notify=False)
+
+
+# Writes. ``today`` defaults to the current date; tests and the benchmark pass their own.
+
+@perf.instrument()
+def add_patron(name, email=None):
+    return _write(_add_patron, name, email)
+
+
+@perf.instrument()
+def add_copies(book_id, count=1, today=None):
+    """Add copies of a book; returns their ids. New copies serve waiting holds first."""
+    return _write(_add_copies, book_id, count, today or date.today())
+
+
+@perf.instrument()
+def checkout(copy_id, patron_id, today=None, days=LOAN_DAYS):
+    """Lend a copy to a patron and return the Loan; raises CirculationError if it can't be lent."""
+    return _write(_checkout, copy_id, patron_id, today or date.today(), days)
+
+
+@perf.instrument()
+def return_copy(copy_id, today=None):
+    """Check a copy back in; returns ``(loan, hold id)``, the hold being whoever gets the copy next."""
+    return _write(_return, copy_id, today or date.today())
+
+
+@perf.instrument()
+def place_hold(book_id, patron_id, today=None):
+    return _write(_place_hold, book_id, patron_id, today or date.today())
+
+
+@perf.instrument()
+def cancel_hold(hold_id, today=None):
+    _write(_close_hold, hold_id, "cancelled", today or date.today())
+
+
+@perf.instrument()
+def expire_holds(today=None):
+    """Close ready holds nobody collected in time; returns how many expired."""
+    return _write(_expire_holds, today or date.today())
+
+
+# Reads
+
+@perf.instrument()
+def overdue_loans(today=None, limit=100):
+    """Open loans past their due date, longest overdue first."""
+    today = today or date.today()
+    with db.get_connection() as conn:
+        return _loans(conn, "WHERE l.return_date IS NULL AND l.due_date < ? ORDER BY l.due_date LIMIT ?",
+                      (today.isoformat(), limit))
+
+
+@perf.instrument()
+def patron_loans(patron_id):
+    """A patron's open loans, soonest due first."""
+    with db.get_connection() as conn:
+        return _loans(conn, "WHERE l.patron_id = ? AND l.return_date IS NULL ORDER BY l.due_date", (patron_id,))
+
+
+@perf.instrument()
+def hold_queue(book_id):
+    """Open holds on a title in the order they will be served."""
+    with db.get_connection() as conn:
+        return [Hold(*row) for row in conn.execute(
+            f"SELECT {_HOLD_COLUMNS} FROM holds WHERE book_id = ? AND status IN ('waiting', 'ready') ORDER BY id",
+            (book_id,))]
+
+
+def copy_counts(book_id):
+    with db.get_connection() as conn:
+        return dict(conn.execute("SELECT status, COUNT(*) FROM copies WHERE book_id = ? GROUP BY status", (book_id,)))
+
+
+def bench(books=10_000, copies=2, patrons=5_000, clients=16, seconds=10.0, seed=42):
+    """Simulate a busy circulation desk against a scratch catalog.
+
+    Each client is one desk: it checks copies out to random patrons, checks
+    back in copies it lent earlier and now and then places a hold. Returns
+    per-operation latencies and the overall rate.
+    """
+    from benchmark import generate_catalog
+
+    with tempfile.TemporaryDirectory() as scratch:
+        generate_catalog(os.path.join(scratch, "circulation.db"), books, seed)
+        with db.get_connection() as conn:
+            now = _now()
+            conn.executemany("INSERT INTO copies (book_id, status, added_date) VALUES (?, 'available', ?)",
+                             ((book_id, now) for book_id in range(1, books + 1) for _ in range(copies)))
+            conn.executemany("INSERT INTO patrons (name, joined_date) VALUES (?, ?)",
+                             ((f"Patron {i}", now) for i in range(patrons)))
+            conn.commit()
+        copy_total = books * copies
+
+        samples = defaultdict(list)
+        outcomes = Counter()
+        lock = threading.Lock()
+        deadline = time.monotonic() + seconds
+
+        def desk(number):
+            rng = random.Random(seed + number)
+            lent = []
+            mine_samples, mine_outcomes = defaultdict(list), Counter()
+            while time.monotonic() < deadline:
+                roll = rng.random()
+                if roll < 0.1:
+                    op, fn, args = "place_hold", place_hold, (rng.randint(1, books), rng.randint(1, patrons))
+                elif roll < 0.55 and lent:
+                    op, fn, args = "return_copy", return_copy, (lent.pop(rng.randrange(len(lent))),)
+                else:
+                    op, fn, args = "checkout", checkout, (rng.randint(1, copy_total), rng.randint(1, patrons))
+                start = time.perf_counter()
+                try:
+                    result = fn(*args)
+                except CirculationError:
+                    mine_outcomes[op, "refused"] += 1
+                else:
+                    mine_outcomes[op, "ok"] += 1
+                    if op == "checkout":
+                        lent.append(result.copy_id)
+                mine_samples[op].append(time.perf_counter() - start)
+            with lock:
+                for op, values in mine_samples.items():
+                    samples[op].extend(values)
+                outcomes.update(mine_outcomes)
+
+        started = time.monotonic()
+        threads = [threading.Thread(target=desk, args=(i,)) for i in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        results = {"clients": clients, "seconds": elapsed, "operations": {}}
+        for op, values in samples.items():
+            results["operations"][op] = {**perf.percentile_summary(values), "ok": outcomes[op, "ok"],
+                                         "refused": outcomes[op, "refused"], "per_second": len(values) / elapsed}
+        results["writes_per_commit"] = db.get_writer().stats()["writes_per_group"]
+
+        # The desk's lookups, once the loans table has filled up
+        rng = random.Random(seed)
+        later = date.today() + timedelta(days=LOAN_DAYS + 1)
+        for name, fn in (("overdue_loans", lambda: overdue_loans(later)),
+                         ("patron_loans", lambda: patron_loans(rng.randint(1, patrons)))):
+            times = []
+            for _ in range(200):
+                start = time.perf_counter()
+                fn()
+                times.append(time.perf_counter() - start)
+            results["operations"][name] = perf.percentile_summary(times)
+        db.get_writer().close()
+        db.get_pool().close()
+    return results
+
+
+def _print_loans(loans, today=None):
+    for loan in loans:
+        late = loan.days_overdue(today)
+        print(f"{loan.id:>8}  copy {loan.copy_id:>7}  patron {loan.patron_id:>7}  due {loan.due_date}"
+              f"{f'  {late} days late' if late else ''}  {loan.title or '(deleted book)'}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Circulation desk queries and load benchmark.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser("overdue", help="open loans past their due date")
+    command.add_argument("--date", type=date.fromisoformat, help="as of this date (default: today)")
+    command.add_argument("--limit", type=int, default=100)
+    commands.add_parser("loans", help="a patron's open loans").add_argument("patron_id", type=int)
+    commands.add_parser("holds", help="the hold queue for a book").add_argument("book_id", type=int)
+    command = commands.add_parser("bench", help="simulate a busy circulation desk on a scratch catalog")
+    command.add_argument("--books", type=int, default=10_000)
+    command.add_argument("--copies", type=int, default=2, help="copies per book")
+    command.add_argument("--patrons", type=int, default=5_000)
+    command.add_argument("--clients", type=int, default=16, help="desks working at once")
+    command.add_argument("--seconds", type=float, default=10.0)
+    command.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    if args.command == "bench":
+        results = bench(args.books, args.copies, args.patrons, args.clients, args.seconds)
+        print(f"{args.clients} desks for {results['seconds']:.1f}s, "
+              f"{results['writes_per_commit']:.1f} writes per commit")
+        for op, row in results["operations"].items():
+            rate = f"{row['per_second']:7.0f}/s  ok {row['ok']:>6}  refused {row['refused']:>6}" if "ok" in row else ""
+            print(f"  {op:<14} p50 {row['p50_ms']:7.2f} ms   p95 {row['p95_ms']:7.2f} ms   {rate}")
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+            print(f"\nResults written to {args.output}")
+        return
+
+    db.init_db()
+    if args.command == "overdue":
+        _print_loans(overdue_loans(args.date, args.limit), args.date)
+    elif args.command == "loans":
+        _print_loans(patron_loans(args.patron_id))
+    else:
+        holds = hold_queue(args.book_id)
+        for position, hold in enumerate(holds, 1):
+            ready = f"  copy {hold.copy_id} ready until {hold.pickup_by}" if hold.status == "ready" else ""
+            print(f"{position:>4}. hold {hold.id}  patron {hold.patron_id}  placed {hold.placed_date}{ready}")
+        if not holds:
+            print("No open holds.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,793 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import perf
+from cache import QueryCache
+from isbn import isbn13_or_none, to_isbn13
+from migrations import migrate
+from models import Book, book_factory
+from writer import WriteQueue
+from search import (CANDIDATE_SQL, SEARCH_CANDIDATES, MIN_SIMILARITY, build_match_query, candidate_queries,
+                    fuzzy_candidates, rank_matches, similarity)
+from stats import read_stats
+
+DB_PATH = os.environ.get("LIBRARY_DB", "library.db")
+POOL_SIZE = int(os.environ.get("LIBRARY_DB_POOL_SIZE", "5"))
+POOL_TIMEOUT = float(os.environ.get("LIBRARY_DB_POOL_TIMEOUT", "30"))  # seconds to wait for a free connection
+CACHE_MAX_ENTRIES = int(os.environ.get("LIBRARY_CACHE_MAX_ENTRIES", "128"))
+CACHE_MAX_BYTES = int(os.environ.get("LIBRARY_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+SEARCH_LIMIT = 100
+PAGE_SIZE = 24
+PICKER_LIMIT = 50
+
+BOOK_COLUMNS = ["id", "title", "author", "genre", "year", "isbn", "description", "added_date", "version"]
+
+# Browse sort orders: UI label -> (column, descending). Ties are broken on id
+# so every row has a unique position, which keyset pagination relies on.
+SORT_ORDERS = {
+    "Title (A-Z)": ("title", False),
+    "Title (Z-A)": ("title", True),
+    "Author": ("author", False),
+    "Year (Newest)": ("year", True),
+    "Year (Oldest)": ("year", False),
+}
+# Sort columns that can be NULL; title and author are NOT NULL
+NULLABLE_SORT_COLUMNS = {"year"}
+
+# Pragmas applied to every new connection. WAL lets readers run alongside a
+# writer, NORMAL sync is safe under WAL, and the cache/mmap sizes keep hot
+# pages in memory instead of going back to the file on every query.
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -20000,  # negative means KiB, so ~20 MB
+    "mmap_size": 268435456,  # 256 MB
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+}
+
+
+class PoolTimeout(Exception):
+    """Every connection in the pool stayed checked out for the whole wait."""
+
+
+class ConnectionPool:
+    """A small pool of reusable SQLite connections.
+
+    With ``thread_affinity`` each thread keeps its own connection for its
+    lifetime; otherwise idle connections are shared through a queue, which
+    suits Streamlit since it runs every rerun on a fresh thread. Either way
+    at most ``size`` connections are open at once: when they are all in use,
+    acquire waits up to ``timeout`` seconds for one and then raises
+    PoolTimeout. close() closes every connection the pool opened, including
+    ones still held by other threads.
+    """
+
+    def __init__(self, path=DB_PATH, size=POOL_SIZE, thread_affinity=False, pragmas=None, timeout=POOL_TIMEOUT):
+        self.path = path
+        self.size = size
+        self.thread_affinity = thread_affinity
+        self.pragmas = PRAGMAS if pragmas is None else pragmas
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self._open = {}  # every connection the pool opened -> the thread that opened it
+        self._closed = False
+        self.hits = 0
+        self.misses = 0
+        self.timeouts = 0
+
+    def _connect(self):
+        # A bare connection with the pool's settings, not counted against its
+        # size; the write queues use this for their own connection. Any thread
+        # may use it, so that close() can close connections other threads hold.
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.set_trace_callback(perf.note_sql)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _open_connection(self):
+        # Called holding a slot, which the connection keeps until it is closed
+        try:
+            conn = self._connect()
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._open[conn] = threading.current_thread()
+        return conn
+
+    def _discard(self, conn):
+        with self._lock:
+            owned = self._open.pop(conn, None) is not None
+        conn.close()
+        if owned:
+            self._slots.release()
+
+    def _reap(self):
+        # Connections of threads that have exited can't be handed to anyone
+        # else under thread affinity, so free their slots
+        with self._lock:
+            dead = [conn for conn, thread in self._open.items() if not thread.is_alive()]
+        for conn in dead:
+            self._discard(conn)
+
+    def _exhausted(self):
+        with self._lock:
+            self.timeouts += 1
+        return PoolTimeout(f"All {self.size} connections to {self.path} stayed in use for {self.timeout}s")
+
+    def acquire(self):
+        if self._closed:
+            raise sqlite3.ProgrammingError(f"The connection pool for {self.path} is closed")
+        if self.thread_affinity:
+            conn = getattr(self._local, "conn", None)
+            self._count(conn is not None)
+            if conn is None:
+                if not self._slots.acquire(blocking=False):
+                    self._reap()
+                    if not self._slots.acquire(timeout=self.timeout):
+                        raise self._exhausted()
+                conn = self._local.conn = self._open_connection()
+            return conn
+
+        try:
+            conn = self._idle.get_nowait()
+            self._count(True)
+        except queue.Empty:
+            if self._slots.acquire(blocking=False):
+                conn = self._open_connection()
+                self._count(False)
+            else:
+                # Every connection is checked out; wait for one to come back
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise self._exhausted() from None
+                self._count(True)
+        return conn
+
+    def release(self, conn):
+        if self._closed:
+            self._discard(conn)
+            return
+        if conn.in_transaction:
+            conn.rollback()
+        if self.thread_affinity:
+            return
+        self._idle.put_nowait(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        self._closed = True
+        with self._lock:
+            conns = list(self._open)
+        for conn in conns:
+            # Interrupt a query another thread is still running on it
+            conn.interrupt()
+            self._discard(conn)
+        while True:
+            try:
+                self._idle.get_nowait()
+            except queue.Empty:
+                break
+        self._local = threading.local()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": self.size,
+                "open": len(self._open),
+                "idle": self._idle.qsize(),
+                "hits": self.hits,
+                "misses": self.misses,
+                "timeouts": self.timeouts,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+# One pool per process. This module is imported once, so unlike main.py
+# (which Streamlit re-executes on every rerun) the pool survives reruns.
+_pool = ConnectionPool()
+
+
+def configure_pool(path=None, size=None, thread_affinity=None):
+    global _pool, _writer
+    _pool.close()
+    _pool = ConnectionPool(
+        path=_pool.path if path is None else path,
+        size=_pool.size if size is None else size,
+        thread_affinity=_pool.thread_affinity if thread_affinity is None else thread_affinity,
+    )
+    # The writer keeps its own connection, so start a fresh one on the new pool
+    _writer.close()
+    _writer = WriteQueue(lambda: _pool._connect(), on_commit=bump_catalog_version)
+    _reset_catalog_version()
+    return _pool
+
+
+def get_pool():
+    return _pool
+
+
+@contextmanager
+def get_connection():
+    with _pool.connection() as conn:
+        yield conn
+
+
+# Several branch databases served as one catalog, when configured
+_federation = None
+
+
+def configure_shards(spec):
+    """Serve the catalog from the branch databases in ``spec`` ("name=path,...").
+
+    Search, browse pages, genres and stats then span every branch, and
+    get_book, add_book, update_book and delete_book need the ``branch`` the
+    book lives in. Everything else still uses the one pool. An empty spec
+    goes back to the one database.
+    """
+    global _federation
+    import shards  # imports this module
+
+    if _federation is not None:
+        _federation.close()
+        _federation = None
+    if spec:
+        federation = shards.Federation(shards.parse_shards(spec), _pool.size, on_commit=bump_catalog_version)
+        federation.init()
+        _federation = federation
+    _reset_catalog_version()
+    return _federation
+
+
+def branches():
+    """Names of the configured branches; empty when there is one database."""
+    return _federation.branches if _federation is not None else []
+
+
+def _branch_shard(branch):
+    if _federation is None:
+        raise ValueError("No branches are configured")
+    if branch is None:
+        raise ValueError(f"Say which branch: one of {', '.join(_federation.branches)}")
+    return _federation.shard(branch)
+
+
+@contextmanager
+def snapshot(conn):
+    """Run several reads against one consistent view of the database.
+
+    Under WAL a read transaction sees the database as of its first read,
+    whatever is committed meanwhile, and never blocks the writer.
+    """
+    conn.execute("BEGIN")
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+
+
+# Read results are cached per catalog version: the catalog_meta row that
+# triggers bump on every change to books, whichever process made it, paired
+# with a counter bumped here after this process's own writes. A write from
+# the API or an import therefore invalidates the app's cache on its next
+# read. The stored version is read on a connection kept for just that.
+query_cache = QueryCache(max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES)
+_version_lock = threading.Lock()
+_version_conn = None
+_catalog_version = 0
+
+
+def stored_catalog_version():
+    global _version_conn
+    if _federation is not None:
+        return _federation.catalog_version()
+    with _version_lock:
+        if _version_conn is None:
+            _version_conn = sqlite3.connect(_pool.path, check_same_thread=False)
+        try:
+            return _version_conn.execute("SELECT version FROM catalog_meta").fetchone()[0]
+        except sqlite3.OperationalError:
+            # Not migrated yet; only this process's writes are tracked
+            return None
+
+
+def catalog_version():
+    return stored_catalog_version(), _catalog_version
+
+
+def bump_catalog_version():
+    global _catalog_version
+    with _version_lock:
+        _catalog_version += 1
+    query_cache.clear()
+
+
+def _reset_catalog_version():
+    # The database moved; watch the new one
+    global _version_conn
+    with _version_lock:
+        if _version_conn is not None:
+            _version_conn.close()
+            _version_conn = None
+    bump_catalog_version()
+
+
+_ready_paths = set()
+_ready_lock = threading.Lock()
+
+
+def ensure_db():
+    """Run init_db once per process for the current database.
+
+    The app calls this on every rerun; after the first call it is a set
+    lookup rather than a migration check and a COUNT(*).
+    """
+    if _pool.path in _ready_paths:
+        return
+    with _ready_lock:
+        if _pool.path not in _ready_paths:
+            init_db()
+            _ready_paths.add(_pool.path)
+
+
+# Initialize database
+@perf.instrument()
+def init_db():
+    with get_connection() as conn:
+        # Bring the schema up to date; a no-op once it is current
+        migrate(conn)
+
+        c = conn.cursor()
+        # Check if we need to add sample books
+        c.execute("SELECT COUNT(*) FROM books")
+        count = c.fetchone()[0]
+
+        if count == 0:
+            # Add sample books with more details
+            sample_books = [
+                ("To Kill a Mockingbird", "Harper Lee", "Fiction", 1960, "978-0061120084",
+                 "A classic of modern American literature about racial inequality in the American South.",
+                 datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+
+                ("1984", "George Orwell", "Dystopian", 1949, "978-0451524935",
+                 "A dystopian social science fiction novel about totalitarianism, mass surveillance, and repressive regimentation.",
+                 datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+
+                ("The Great Gatsby", "F. Scott Fitzgerald", "Classic", 1925, "978-0743273565",
+                 "A novel about the American Dream, decadence, resistance to change, and social upheaval set in the Roaring Twenties.",
+                 datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+
+                ("Pride and Prejudice", "Jane Austen", "Romance", 1813, "978-0141439518",
+                 "A romantic novel of manners that depicts the emotional development of Elizabeth Bennet, who learns about the repercussions of hasty judgments.",
+                 datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+
+                ("The Hobbit", "J.R.R. Tolkien", "Fantasy", 1937, "978-0547928227",
+                 "A fantasy novel about the adventures of hobbit Bilbo Baggins, who is hired by the wizard Gandalf as a burglar for a group of dwarves.",
+                 datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+
+                ("One Hundred Years of Solitude", "Gabriel García Márquez", "Magical Realism", 1967, "978-0060883287",
+                 "A landmark of magical realism that tells the multi-generational story of the Buendía family in the fictional town of Macondo.",
+                 datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+
+                ("The Alchemist", "Paulo Coelho", "Fiction", 1988, "978-0062315007",
+                 "A philosophical novel about a young Andalusian shepherd who dreams of finding worldly treasures and embarks on a journey to find them.",
+                 datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+
+                ("The Catcher in the Rye", "J.D. Salinger", "Coming-of-age", 1951, "978-0316769488",
+                 "A novel about teenage angst, alienation, and the loss of innocence, narrated by the protagonist Holden Caulfield.",
+                 datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+
+                ("The Lord of the Rings", "J.R.R. Tolkien", "Fantasy", 1954, "978-0618640157",
+                 "An epic high-fantasy novel that follows the quest to destroy the One Ring, which was created by the Dark Lord Sauron.",
+                 datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+
+                ("Crime and Punishment", "Fyodor Dostoevsky", "Psychological Fiction", 1866, "978-0143107637",
+                 "A novel that focuses on the mental anguish and moral dilemmas of Rodion Raskolnikov, an impoverished ex-student in Saint Petersburg.",
+                 datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+            ]
+
+            c.executemany('''
+            INSERT INTO books (title, author, genre, year, isbn, description, added_date, isbn13)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [book + (to_isbn13(book[4]),) for book in sample_books])
+            conn.commit()
+            bump_catalog_version()
+
+
+# Database operations
+def _books(conn, sql, params=()):
+    # Lazily yield Book records; the factory is set on the cursor only, since
+    # pooled connections are shared with code that expects plain tuples
+    cursor = conn.cursor()
+    cursor.row_factory = book_factory
+    yield from cursor.execute(sql, params)
+
+
+# Cached results are shared between reruns and sessions; treat them as read-only.
+@perf.instrument()
+@query_cache.cached(catalog_version)
+def get_all_books():
+    with get_connection() as conn:
+        return list(_books(conn, f"SELECT {', '.join(BOOK_COLUMNS)} FROM books ORDER BY title"))
+
+
+class ConflictError(Exception):
+    """A compare-and-swap write found the book changed since it was read."""
+
+    def __init__(self, book_id, current):
+        self.book_id = book_id
+        self.current = current  # the book as it is now
+        super().__init__(f"Book {book_id} was changed by someone else (now at version {current.version})")
+
+
+class BookNotFoundError(LookupError):
+    """An update or delete named a book that doesn't exist, or no longer does."""
+
+    def __init__(self, book_id):
+        self.book_id = book_id
+        super().__init__(f"Book {book_id} doesn't exist; it may have been deleted by someone else")
+
+
+class DuplicateISBNError(ValueError):
+    def __init__(self, isbn, book_id):
+        self.isbn = isbn
+        self.book_id = book_id  # the book that already has it
+        super().__init__(f"ISBN {isbn} already belongs to book {book_id}")
+
+
+def _claim_isbn(conn, isbn, id=None):
+    # The normalized ISBN for a write, checked against idx_books_isbn13. The
+    # unique index would refuse a duplicate anyway; this says whose it is.
+    isbn13 = to_isbn13(isbn)
+    if isbn13 is not None:
+        row = conn.execute("SELECT id FROM books WHERE isbn13 = ? AND id IS NOT ?", (isbn13, id)).fetchone()
+        if row:
+            raise DuplicateISBNError(isbn, row[0])
+    return isbn13
+
+
+def _insert_book(conn, title, author, genre, year, isbn, description):
+    isbn13 = _claim_isbn(conn, isbn)
+    return conn.execute('''
+    INSERT INTO books (title, author, genre, year, isbn, description, added_date, isbn13)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (title, author, genre, year, isbn, description, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), isbn13)).lastrowid
+
+
+def _check_version(conn, id, cursor):
+    # A write that matched no row either lost a compare-and-swap or named a
+    # book that isn't there
+    if cursor.rowcount == 0:
+        current = next(_books(conn, f"SELECT {', '.join(BOOK_COLUMNS)} FROM books WHERE id = ?", (id,)), None)
+        if current is None:
+            raise BookNotFoundError(id)
+        raise ConflictError(id, current)
+
+
+def _update_book(conn, id, title, author, genre, year, isbn, description, expected_version):
+    stored = conn.execute("SELECT isbn, isbn13 FROM books WHERE id = ?", (id,)).fetchone()
+    if stored is not None and stored[0] == isbn:
+        isbn13 = stored[1]  # unchanged, even if it predates validation
+    else:
+        isbn13 = _claim_isbn(conn, isbn, id)
+    sql = "UPDATE books SET title = ?, author = ?, genre = ?, year = ?, isbn = ?, description = ?, isbn13 = ? WHERE id = ?"
+    params = (title, author, genre, year, isbn, description, isbn13, id)
+    if expected_version is not None:
+        sql += " AND version = ?"
+        params += (expected_version,)
+    _check_version(conn, id, conn.execute(sql, params))
+    return conn.execute("SELECT version FROM books WHERE id = ?", (id,)).fetchone()[0]
+
+
+def _delete_book(conn, id, expected_version):
+    if expected_version is None:
+        cursor = conn.execute("DELETE FROM books WHERE id = ?", (id,))
+    else:
+        cursor = conn.execute("DELETE FROM books WHERE id = ? AND version = ?", (id, expected_version))
+    _check_version(conn, id, cursor)
+
+
+# Writes go through the single-writer queue, which groups concurrent writes
+# into one transaction and bumps the catalog version once per commit
+_writer = WriteQueue(lambda: _pool._connect(), on_commit=bump_catalog_version)
+
+
+def get_writer():
+    return _writer
+
+
+def _writer_for(branch):
+    return _writer if branch is None and _federation is None else _branch_shard(branch).writer
+
+
+@perf.instrument()
+def add_book(title, author, genre, year, isbn, description, branch=None):
+    """Add a book and return its id.
+
+    Raises InvalidISBN for an ISBN that fails validation and
+    DuplicateISBNError for one another book already has.
+    """
+    return _writer_for(branch).run(_insert_book, title, author, genre, year, isbn, description)
+
+
+@perf.instrument()
+def update_book(id, title, author, genre, year, isbn, description, expected_version=None, branch=None):
+    """Update a book and return its new version.
+
+    With ``expected_version`` the update only applies if the book is still
+    at that version; otherwise ConflictError is raised and nothing changes.
+    BookNotFoundError is raised if there is no book with this id.
+    """
+    return _writer_for(branch).run(_update_book, id, title, author, genre, year, isbn, description,
+                                   expected_version)
+
+
+@perf.instrument()
+def delete_book(id, expected_version=None, branch=None):
+    _writer_for(branch).run(_delete_book, id, expected_version)
+
+
+@perf.instrument()
+def get_book(id, branch=None):
+    if branch is not None or _federation is not None:
+        return _federation.get_book(_branch_shard(branch).name, id)
+    with get_connection() as conn:
+        return next(_books(conn, f"SELECT {', '.join(BOOK_COLUMNS)} FROM books WHERE id = ?", (id,)), None)
+
+
+@perf.instrument()
+def get_book_by_isbn(isbn):
+    """The book with this ISBN, in any of the forms to_isbn13 accepts, or None."""
+    with get_connection() as conn:
+        return _isbn_match(conn, to_isbn13(isbn))
+
+
+def _isbn_match(conn, isbn13):
+    # A seek on idx_books_isbn13
+    if isbn13 is None:
+        return None
+    return next(_books(conn, f"SELECT {', '.join(BOOK_COLUMNS)} FROM books WHERE isbn13 = ?", (isbn13,)), None)
+
+
+@perf.instrument()
+def get_books(ids):
+    """Books for ``ids`` in the order given; ids that don't exist are skipped."""
+    ids = list(ids)
+    books = {}
+    with get_connection() as conn, snapshot(conn):
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(ids), 10000):
+            chunk = ids[start:start + 10000]
+            sql = f"SELECT {', '.join(BOOK_COLUMNS)} FROM books WHERE id IN ({','.join('?' * len(chunk))})"
+            books.update((book.id, book) for book in _books(conn, sql, chunk))
+    return [books[book_id] for book_id in ids if book_id in books]
+
+
+@perf.instrument()
+def find_books(text, limit=PICKER_LIMIT):
+    """Books for a type-ahead picker: title prefix matches first, then full-text matches.
+
+    The prefix match is a range seek on idx_books_title_nocase, so it costs
+    O(log n + limit) however large the catalog is. Typing a number also
+    finds the book with that id, and typing an ISBN the book with that ISBN.
+    """
+    text = text.strip()
+    columns = ", ".join(BOOK_COLUMNS)
+    with get_connection() as conn:
+        books = []
+        if text.isdigit():
+            books.extend(_books(conn, f"SELECT {columns} FROM books WHERE id = ?", (int(text),)))
+        # A scanned or typed ISBN finds its book
+        book = _isbn_match(conn, isbn13_or_none(text))
+        if book is not None and book.id not in {b.id for b in books}:
+            books.append(book)
+        # Every title starting with text sorts between text and text + U+10FFFF
+        books.extend(_books(conn, f'''
+        SELECT {columns} FROM books
+        WHERE title >= ? COLLATE NOCASE AND title < ? COLLATE NOCASE
+        ORDER BY title COLLATE NOCASE, id LIMIT ?
+        ''', (text, text + "\U0010ffff", limit)))
+        if len(books) < limit and len(text) >= 2:
+            # Words later in the title, or the author's name
+            seen = {book.id for book in books}
+            books.extend(book for book in run_search(conn, text, limit) if book.id not in seen)
+    return books[:limit]
+
+
+def _keyset_clauses(column, descending, after):
+    """WHERE clauses, in page order, selecting the rows after a keyset cursor.
+
+    SQLite sorts NULL before every other value, and a row-value comparison
+    with NULL is never true, so a NULL sort key (a book without a year) gets
+    its own segment: ascending pages finish the NULL keys by id and then
+    start on the non-NULL ones, descending pages end with the NULL keys.
+    """
+    key, last_id = after
+    op = "<" if descending else ">"
+    if column not in NULLABLE_SORT_COLUMNS:
+        return [(f"({column}, id) {op} (?, ?)", [key, last_id])]
+    if key is None:
+        clauses = [(f"{column} IS NULL AND id {op} ?", [last_id])]
+        if not descending:
+            clauses.append((f"{column} IS NOT NULL", []))
+        return clauses
+    clauses = [(f"({column}, id) {op} (?, ?)", [key, last_id])]
+    if descending:
+        clauses.append((f"{column} IS NULL", []))
+    return clauses
+
+
+def build_book_query(genre=None, sort="Title (A-Z)", limit=None, offset=0, after=None, columns=None, search=None):
+    """Build a parameterized SELECT over books and return ``(sql, params)``.
+
+    ``after`` is a keyset cursor ``(sort key, id)``; ``offset`` is plain
+    OFFSET paging for callers that need random access to a page. ``search``
+    restricts the rows to full-text matches, as in the Search tab.
+    """
+    columns = columns or BOOK_COLUMNS
+    unknown = set(columns) - set(BOOK_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown book columns: {', '.join(sorted(unknown))}")
+    column, descending = SORT_ORDERS[sort]
+    direction = "DESC" if descending else "ASC"
+    clauses, params = [], []
+    if search:
+        match = build_match_query(search)
+        if match is None:
+            clauses.append("0")
+        else:
+            clauses.append("id IN (SELECT rowid FROM books_fts WHERE books_fts MATCH ?)")
+            params.append(match)
+    if genre is not None:
+        clauses.append("genre = ?")
+        params.append(genre)
+
+    def select(extra=None, extra_params=()):
+        where_clauses = clauses + ([extra] if extra else [])
+        where = f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+        sql = f"SELECT {', '.join(columns)} FROM books {where} ORDER BY {column} {direction}, id {direction}"
+        return sql, params + list(extra_params)
+
+    segments = [select(*clause) for clause in _keyset_clauses(column, descending, after)] if after else [select()]
+    if len(segments) == 1:
+        sql, params = segments[0]
+    else:
+        if column not in columns or "id" not in columns:
+            raise ValueError("Keyset paging needs the sort column and id in columns")
+        # Each segment is an ordered index seek cut off at the rows the page
+        # can use, so the outer ORDER BY only sorts those few rows. A compound
+        # SELECT orders by result column position.
+        bound = -1 if limit is None else limit + offset
+        sql = " UNION ALL ".join(f"SELECT * FROM ({part} LIMIT ?)" for part, _ in segments)
+        sql += f" ORDER BY {columns.index(column) + 1} {direction}, {columns.index('id') + 1} {direction}"
+        params = [param for _, part_params in segments for param in part_params + [bound]]
+    if limit is not None or offset:
+        sql += " LIMIT ? OFFSET ?"
+        params.extend([-1 if limit is None else limit, offset])
+    return sql, params
+
+
+@perf.instrument()
+def list_books(genre=None, sort="Title (A-Z)", limit=None, offset=0, after=None):
+    return list(iter_books(genre, sort, limit, offset, after))
+
+
+def iter_books(genre=None, sort="Title (A-Z)", limit=None, offset=0, after=None):
+    """Yield Book records one at a time, holding a pooled connection until exhausted."""
+    sql, params = build_book_query(genre, sort, limit, offset, after)
+    with get_connection() as conn:
+        yield from _books(conn, sql, params)
+
+
+@perf.instrument()
+def get_books_page(sort="Title (A-Z)", genre=None, after=None, limit=PAGE_SIZE):
+    """Return one page of books and the cursor for the next page.
+
+    ``after`` is the cursor returned for the previous page; the next cursor
+    is None once the last page has been reached. Each page is a seek on the
+    sort key, so its cost does not grow with how far into the catalog it is.
+    """
+    if _federation is not None:
+        # The cursor is (sort key, branch, id) here
+        return _federation.get_books_page(sort, genre, after, limit)
+    # Fetch one extra row to learn whether another page follows
+    sql, params = build_book_query(genre, sort, limit + 1, after=after)
+    with get_connection() as conn:
+        books = list(_books(conn, sql, params))
+
+    next_cursor = None
+    if len(books) > limit:
+        books = books[:limit]
+        last = books[-1]
+        next_cursor = (getattr(last, SORT_ORDERS[sort][0]), last.id)
+    return books, next_cursor
+
+
+@perf.instrument()
+@query_cache.cached(catalog_version)
+def get_genres():
+    if _federation is not None:
+        return _federation.get_genres()
+    # Answered from idx_books_genre_title alone, without touching the table
+    with get_connection() as conn:
+        rows = conn.execute("SELECT DISTINCT genre FROM books WHERE genre IS NOT NULL ORDER BY genre").fetchall()
+    return [row[0] for row in rows]
+
+
+@perf.instrument()
+def search_books(query, limit=SEARCH_LIMIT, fuzzy=False):
+    if _federation is not None:
+        return _federation.search_books(query, limit, fuzzy)
+    with get_connection() as conn:
+        return run_search(conn, query, limit, fuzzy)
+
+
+def run_search(conn, query, limit=SEARCH_LIMIT, fuzzy=False):
+    # Search on a caller-supplied connection, so the caller can interrupt it.
+    # An ISBN (say, from a barcode scanner) is looked up exactly first.
+    book = _isbn_match(conn, isbn13_or_none(query))
+    if book is not None:
+        book.rank, book.similarity = float("-inf"), 1.0
+        return [book]
+    if fuzzy:
+        return run_fuzzy_search(conn, query, limit)
+
+    ids = set()
+    for match in candidate_queries(query):
+        ids.update(row[0] for row in conn.execute(CANDIDATE_SQL, (match, SEARCH_CANDIDATES)))
+        if len(ids) >= SEARCH_CANDIDATES:
+            break
+    if not ids:
+        return []
+    sql = f"SELECT {', '.join(BOOK_COLUMNS)} FROM books WHERE id IN ({','.join('?' * len(ids))})"
+    return rank_matches(list(_books(conn, sql, list(ids))), query, limit)
+
+
+def run_fuzzy_search(conn, query, limit=SEARCH_LIMIT):
+    """Typo-tolerant title/author search, best trigram similarity first."""
+    query_grams, ids = fuzzy_candidates(conn, query)
+    scored = []
+    if ids:
+        sql = f"SELECT {', '.join(BOOK_COLUMNS)} FROM books WHERE id IN ({','.join('?' * len(ids))})"
+        for book in _books(conn, sql, ids):
+            book.similarity = max(similarity(query_grams, book.title), similarity(query_grams, book.author))
+            if book.similarity >= MIN_SIMILARITY:
+                scored.append(book)
+        scored.sort(key=lambda book: (-book.similarity, book.title))
+    return scored[:limit]
+
+
+@perf.instrument()
+@query_cache.cached(catalog_version)
+def get_stats():
+    # Reads the trigger-maintained summary tables, so the cost depends on
+    # the number of genres/years/authors rather than the number of books
+    if _federation is not None:
+        return _federation.get_stats()
+    with get_connection() as conn, snapshot(conn):
+        return read_stats(conn)
@@ -0,0 +1,116 @@
+"""Streaming export of the catalog to CSV, JSON Lines or Parquet.
+
+    python exporter.py books.csv [--format csv|jsonl|parquet] [--columns title,author]
+                                 [--genre Fantasy] [--search tolkien] [--sort "Author"]
+
+Rows are read from a single SQLite cursor in fixed-size chunks and written
+out as they arrive, so memory use stays flat whatever the catalog size.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+
+import db
+
+CHUNK_SIZE = 5000
+
+FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl", ".parquet": "parquet"}
+MIME_TYPES = {"csv": "text/csv", "jsonl": "application/x-ndjson", "parquet": "application/vnd.apache.parquet"}
+
+
+def detect_format(name):
+    fmt = FORMATS.get(os.path.splitext(name)[1].lower())
+    if fmt is None:
+        raise ValueError(f"Cannot tell the format of {name!r}; pass one of: csv, jsonl, parquet")
+    return fmt
+
+
+def iter_chunks(columns, genre=None, search=None, sort="Title (A-Z)", chunk_size=CHUNK_SIZE):
+    sql, params = db.build_book_query(genre, sort, columns=columns, search=search)
+    with db.get_connection() as conn:
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+
+
+def write_csv(chunks, columns, stream):
+    text = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+    writer = csv.writer(text)
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows(rows)
+    text.flush()
+    text.detach()
+
+
+def write_jsonl(chunks, columns, stream):
+    text = io.TextIOWrapper(stream, encoding="utf-8")
+    for rows in chunks:
+        text.writelines(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in rows)
+    text.flush()
+    text.detach()
+
+
+def write_parquet(chunks, columns, stream):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)") from None
+
+    types = {"id": pa.int64(), "year": pa.int64(), "version": pa.int64()}
+    schema = pa.schema([(column, types.get(column, pa.string())) for column in columns])
+    # One row group per chunk keeps only the current chunk in memory
+    with pq.ParquetWriter(stream, schema) as writer:
+        for rows in chunks:
+            data = {column: [row[i] for row in rows] for i, column in enumerate(columns)}
+            writer.write_table(pa.Table.from_pydict(data, schema=schema))
+
+
+WRITERS = {"csv": write_csv, "jsonl": write_jsonl, "parquet": write_parquet}
+
+
+def export_books(stream, fmt, columns=None, genre=None, search=None, sort="Title (A-Z)", chunk_size=CHUNK_SIZE):
+    """Write the matching books to a binary stream and return the row count."""
+    columns = list(columns or db.BOOK_COLUMNS)
+    count = 0
+
+    def counted(chunks):
+        nonlocal count
+        for rows in chunks:
+            count += len(rows)
+            yield rows
+
+    WRITERS[fmt](counted(iter_chunks(columns, genre, search, sort, chunk_size)), columns, stream)
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export books from the library database.")
+    parser.add_argument("path", help="output file, or - for stdout")
+    parser.add_argument("--format", choices=sorted(WRITERS), help="output format (default: from the file extension)")
+    parser.add_argument("--columns", help=f"comma-separated columns (default: {','.join(db.BOOK_COLUMNS)})")
+    parser.add_argument("--genre", help="only books in this genre")
+    parser.add_argument("--search", help="only books matching this search")
+    parser.add_argument("--sort", choices=list(db.SORT_ORDERS), default="Title (A-Z)")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ("csv" if args.path == "-" else detect_format(args.path))
+    columns = args.columns.split(",") if args.columns else None
+    db.init_db()
+    if args.path == "-":
+        count = export_books(sys.stdout.buffer, fmt, columns, args.genre, args.search, args.sort)
+    else:
+        with open(args.path, "wb") as stream:
+            count = export_books(stream, fmt, columns, args.genre, args.search, args.sort)
+    print(f"Exported {count:,} books.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
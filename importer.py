@@ -0,0 +1,388 @@
+"""Bulk import of books from CSV, JSON Lines and MARC 21 files.
+
+    python importer.py books.csv [--format csv|jsonl|marc] [--batch-size 5000]
+
+Records are streamed from the file in fixed-size batches, validated
+(ISBNs included, check digit and all), deduplicated on the normalized
+ISBN-13 and inserted with executemany, each batch one write on the
+single-writer queue (db.get_writer()). Each write also records how many
+records of the source have been processed, so an interrupted import picks
+up after the last committed batch when it is run again.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import db
+from isbn import InvalidISBN, to_isbn13
+
+BATCH_SIZE = 5000
+MAX_ERRORS = 20
+
+FORMATS = {
+    ".csv": "csv",
+    ".jsonl": "jsonl",
+    ".ndjson": "jsonl",
+    ".json": "jsonl",
+    ".mrc": "marc",
+    ".marc": "marc",
+}
+
+CHECKPOINT_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS import_checkpoints (
+    source TEXT PRIMARY KEY,
+    records_done INTEGER NOT NULL,
+    updated_at TEXT
+)
+'''
+
+
+@dataclass
+class ImportStats:
+    read: int = 0
+    inserted: int = 0
+    duplicates: int = 0
+    rejected: int = 0
+    resumed_from: int = 0
+    bytes_read: int = 0
+    total_bytes: int = 0
+    started: float = field(default_factory=time.monotonic)
+    errors: list = field(default_factory=list)
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def processed(self):
+        # Records handled in this run, not counting the ones skipped on resume
+        return max(self.read - self.resumed_from, 0)
+
+    @property
+    def rows_per_sec(self):
+        return self.processed / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def fraction_done(self):
+        return min(self.bytes_read / self.total_bytes, 1.0) if self.total_bytes else 0.0
+
+    def summary(self):
+        return (f"{self.read:,} records read, {self.inserted:,} inserted, "
+                f"{self.duplicates:,} duplicates, {self.rejected:,} rejected "
+                f"in {self.elapsed:.1f}s ({self.rows_per_sec:,.0f} rows/sec)")
+
+
+def detect_format(name):
+    fmt = FORMATS.get(os.path.splitext(name)[1].lower())
+    if fmt is None:
+        raise ValueError(f"Cannot tell the format of {name!r}; pass one of: csv, jsonl, marc")
+    return fmt
+
+
+# Readers. Each takes a binary stream and yields one dict per record.
+def read_csv(stream):
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    for row in csv.DictReader(text):
+        yield {(key or "").strip().lower(): value for key, value in row.items()}
+
+
+def read_jsonl(stream):
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig")
+    for line_number, line in enumerate(text, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield {"_error": f"line {line_number}: invalid JSON ({e.msg})"}
+            continue
+        yield record if isinstance(record, dict) else {"_error": f"line {line_number}: not an object"}
+
+
+# MARC 21 (ISO 2709) tag/subfield -> book field
+MARC_FIELDS = {
+    "title": [("245", "ab")],
+    "author": [("100", "a"), ("110", "a"), ("700", "a")],
+    "isbn": [("020", "a")],
+    "year": [("264", "c"), ("260", "c"), ("008", None)],
+    "genre": [("655", "a"), ("650", "a")],
+    "description": [("520", "a")],
+}
+
+
+def _parse_marc(data):
+    base = int(data[12:17])
+    directory = data[24:base - 1]
+    fields = {}
+    for i in range(0, len(directory), 12):
+        tag = directory[i:i + 3].decode("ascii")
+        length = int(directory[i + 3:i + 7])
+        start = int(directory[i + 7:i + 12])
+        value = data[base + start:base + start + length].rstrip(b"\x1e").decode("utf-8", "replace")
+        fields.setdefault(tag, value)
+    return fields
+
+
+def _marc_value(fields, tag, codes):
+    raw = fields.get(tag)
+    if raw is None:
+        return None
+    if codes is None:
+        # Control field 008 holds the publication year at positions 7-10
+        return raw[7:11]
+    parts = [part[1:] for part in raw.split("\x1f")[1:] if part[:1] in codes]
+    return " ".join(parts).strip(" /:;,.") or None
+
+
+def read_marc(stream):
+    buffer = b""
+    while True:
+        chunk = stream.read(1 << 16)
+        if not chunk and not buffer:
+            return
+        buffer += chunk
+        while b"\x1d" in buffer:
+            data, buffer = buffer.split(b"\x1d", 1)
+            if not data.strip():
+                continue
+            try:
+                fields = _parse_marc(data)
+            except (ValueError, UnicodeDecodeError) as e:
+                yield {"_error": f"unreadable MARC record ({e})"}
+                continue
+            record = {}
+            for name, sources in MARC_FIELDS.items():
+                for tag, codes in sources:
+                    value = _marc_value(fields, tag, codes)
+                    if value:
+                        record[name] = value
+                        break
+            yield record
+        if not chunk:
+            if buffer.strip():
+                yield {"_error": "truncated MARC record at end of file"}
+            return
+
+
+READERS = {"csv": read_csv, "jsonl": read_jsonl, "marc": read_marc}
+
+_YEAR = re.compile(r"\d{4}")
+
+
+def validate(record, check_isbn=True):
+    """Return ``(row, None)`` for a usable record or ``(None, reason)``.
+
+    ``check_isbn=False`` lets through an ISBN that fails validation, for
+    updates that leave an already stored ISBN as it is.
+    """
+    if "_error" in record:
+        return None, record["_error"]
+    title = str(record.get("title") or "").strip()
+    author = str(record.get("author") or "").strip()
+    if not title or not author:
+        return None, "title and author are required"
+    match = _YEAR.search(str(record.get("year") or ""))
+    year = int(match.group()) if match else None
+    if year is None or not 1000 <= year <= datetime.now().year:
+        return None, f"invalid year {record.get('year')!r}"
+    genre = str(record.get("genre") or "Other").strip()
+    isbn = str(record.get("isbn") or "").strip()
+    if check_isbn:
+        try:
+            to_isbn13(isbn)
+        except InvalidISBN as e:
+            return None, str(e)
+    description = str(record.get("description") or "").strip()
+    return (title, author, genre, year, isbn, description), None
+
+
+class _CountingReader(io.RawIOBase):
+    # Tracks how far into the source we are, for progress reporting
+    def __init__(self, stream):
+        self.stream = stream
+        self.count = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.stream.read(len(buffer))
+        buffer[:len(data)] = data
+        self.count += len(data)
+        return len(data)
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.count += len(data)
+        return data
+
+
+def _existing_isbns(conn, keys):
+    # One seek on idx_books_isbn13 per key
+    found = set()
+    keys = list(keys)
+    for i in range(0, len(keys), 500):
+        chunk = keys[i:i + 500]
+        rows = conn.execute(
+            f"SELECT isbn13 FROM books WHERE isbn13 IN ({','.join('?' * len(chunk))})", chunk,
+        ).fetchall()
+        found.update(row[0] for row in rows)
+    return found
+
+
+INSERT_SQL = '''
+INSERT INTO books (title, author, genre, year, isbn, description, added_date, isbn13)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def _reject(stats, position, error):
+    stats.rejected += 1
+    if len(stats.errors) < MAX_ERRORS:
+        stats.errors.append(f"record {position}: {error}")
+
+
+def _save_checkpoint(conn, source, records_done, updated_at):
+    conn.execute('''
+    INSERT INTO import_checkpoints (source, records_done, updated_at) VALUES (?, ?, ?)
+    ON CONFLICT(source) DO UPDATE SET records_done = excluded.records_done, updated_at = excluded.updated_at
+    ''', (source, records_done, updated_at))
+
+
+def _create_checkpoints(conn):
+    conn.execute(CHECKPOINT_SCHEMA)
+
+
+def _clear_checkpoint(conn, source):
+    conn.execute("DELETE FROM import_checkpoints WHERE source = ?", (source,))
+
+
+def _insert_batch(conn, batch, source, records_done):
+    # Runs on the writer thread. batch holds (position, row) pairs; validate
+    # has already checked every ISBN. Returns (inserted, duplicates,
+    # rejections) rather than adding to the running stats, since the writer
+    # runs the whole group again if another process held the lock.
+    keys = [to_isbn13(row[4]) for _, row in batch]
+    seen = _existing_isbns(conn, set(keys) - {None})
+    added_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    positions, rows, duplicates, rejections = [], [], 0, []
+    for (position, row), key in zip(batch, keys):
+        if key is not None:
+            if key in seen:
+                duplicates += 1
+                continue
+            seen.add(key)
+        positions.append(position)
+        rows.append(row + (added_date, key))
+
+    conn.execute("SAVEPOINT import_batch")
+    try:
+        conn.executemany(INSERT_SQL, rows)
+    except sqlite3.IntegrityError:
+        # A constraint the checks above can't see, such as an ISBN another
+        # process added in the meantime. Roll the batch back, insert it
+        # again row by row and reject just the rows that fail.
+        conn.execute("ROLLBACK TO import_batch")
+        for position, row in zip(positions, rows):
+            try:
+                conn.execute(INSERT_SQL, row)
+            except sqlite3.IntegrityError as e:
+                rejections.append((position, f"not inserted ({e})"))
+    conn.execute("RELEASE import_batch")
+    _save_checkpoint(conn, source, records_done, added_date)
+    return len(rows) - len(rejections), duplicates, rejections
+
+
+def _write_batch(writer, batch, source, records_done, stats):
+    # Counted only once the writer has committed the batch
+    inserted, duplicates, rejections = writer.run(_insert_batch, batch, source, records_done)
+    stats.inserted += inserted
+    stats.duplicates += duplicates
+    for position, error in rejections:
+        _reject(stats, position, error)
+
+
+def import_books(stream, fmt, source, batch_size=BATCH_SIZE, total_bytes=0, progress=None, resume=True):
+    """Stream records from a binary file object into the books table.
+
+    ``source`` names the input for resuming; ``progress`` is called with the
+    running ImportStats after every committed batch.
+    """
+    counter = _CountingReader(stream)
+    records = READERS[fmt](io.BufferedReader(counter) if fmt != "marc" else counter)
+    stats = ImportStats(total_bytes=total_bytes)
+    # Every write goes through the writer queue, which bumps the catalog
+    # version after each batch it commits
+    writer = db.get_writer()
+
+    writer.run(_create_checkpoints, notify=False)
+    with db.get_connection() as conn:
+        row = conn.execute("SELECT records_done FROM import_checkpoints WHERE source = ?", (source,)).fetchone()
+    stats.resumed_from = row[0] if row and resume else 0
+
+    batch = []
+    for position, record in enumerate(records, 1):
+        stats.read += 1
+        if position <= stats.resumed_from:
+            continue
+        values, error = validate(record)
+        if error:
+            _reject(stats, position, error)
+        else:
+            batch.append((position, values))
+        if len(batch) >= batch_size:
+            _write_batch(writer, batch, source, position, stats)
+            batch = []
+            stats.bytes_read = counter.count
+            if progress:
+                progress(stats)
+
+    _write_batch(writer, batch, source, stats.read, stats)
+    writer.run(_clear_checkpoint, source, notify=False)
+
+    stats.bytes_read = counter.count
+    if progress:
+        progress(stats)
+    return stats
+
+
+def import_file(path, fmt=None, **kwargs):
+    fmt = fmt or detect_format(path)
+    source = f"{os.path.abspath(path)}:{os.path.getsize(path)}"
+    with open(path, "rb") as stream:
+        return import_books(stream, fmt, source, total_bytes=os.path.getsize(path), **kwargs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import books into the library database.")
+    parser.add_argument("path", help="CSV, JSON Lines or MARC 21 file")
+    parser.add_argument("--format", choices=sorted(READERS), help="input format (default: from the file extension)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="records per transaction")
+    parser.add_argument("--restart", action="store_true", help="ignore any saved progress and start from the top")
+    args = parser.parse_args(argv)
+
+    def report(stats):
+        print(f"\r{stats.fraction_done:6.1%}  {stats.summary()}", end="", file=sys.stderr, flush=True)
+
+    db.init_db()
+    stats = import_file(args.path, args.format, batch_size=args.batch_size,
+                        progress=report, resume=not args.restart)
+    print(file=sys.stderr)
+    if stats.resumed_from:
+        print(f"Resumed after record {stats.resumed_from:,}.")
+    for error in stats.errors:
+        print(f"  {error}")
+    print(stats.summary())
+
+
+if __name__ == "__main__":
+    main()
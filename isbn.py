@@ -0,0 +1,65 @@
+"""ISBN validation and normalization.
+
+Books are matched on their ISBN-13 written as 13 bare digits. ISBN-10s are
+converted to that form (978 prefix, new check digit), and either form must
+carry a correct check digit. Input may be typed with hyphens or spaces,
+pasted with an "ISBN" or "ISBN-13:" label, or come from a barcode scanner,
+which sends the EAN-13 digits and sometimes a 2- or 5-digit add-on after
+them.
+"""
+import re
+
+
+class InvalidISBN(ValueError):
+    pass
+
+
+_LABEL = re.compile(r"^\s*ISBN(?:-1[03])?:?", re.IGNORECASE)
+_SEPARATORS = re.compile(r"[\s\-‐-―]")  # spaces and every kind of hyphen
+
+
+def check_digit_13(digits):
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits[:12]))
+    return str((10 - total % 10) % 10)
+
+
+def check_digit_10(digits):
+    total = sum(int(d) * (10 - i) for i, d in enumerate(digits[:9]))
+    check = (11 - total % 11) % 11
+    return "X" if check == 10 else str(check)
+
+
+def to_isbn13(text):
+    """Return ``text`` as 13 bare digits, or None if it is blank.
+
+    Raises InvalidISBN if it isn't a well-formed ISBN-10 or ISBN-13.
+    """
+    if text is None:
+        return None
+    compact = _SEPARATORS.sub("", _LABEL.sub("", str(text))).upper()
+    if not compact:
+        return None
+    # EAN-13 followed by a price or issue add-on
+    if len(compact) in (15, 18) and compact.isdigit() and compact[:3] in ("978", "979"):
+        compact = compact[:13]
+
+    if len(compact) == 10 and compact[:9].isdigit() and (compact[9].isdigit() or compact[9] == "X"):
+        if check_digit_10(compact) != compact[9]:
+            raise InvalidISBN(f"ISBN {text!r} has the wrong check digit")
+        digits = "978" + compact[:9]
+        return digits + check_digit_13(digits)
+    if len(compact) == 13 and compact.isdigit():
+        if compact[:3] not in ("978", "979"):
+            raise InvalidISBN(f"{text!r} is not an ISBN; ISBN-13s start with 978 or 979")
+        if check_digit_13(compact) != compact[12]:
+            raise InvalidISBN(f"ISBN {text!r} has the wrong check digit")
+        return compact
+    raise InvalidISBN(f"{text!r} is not an ISBN-10 or ISBN-13")
+
+
+def isbn13_or_none(text):
+    # For data that is already stored: a bad ISBN just isn't indexed
+    try:
+        return to_isbn13(text)
+    except InvalidISBN:
+        return None
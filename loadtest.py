@@ -0,0 +1,190 @@
+"""Load test for the JSON API in api.py.
+
+    python api.py &
+    python loadtest.py [--url http://127.0.0.1:8080] [--concurrency 32] [--duration 10]
+                       [--conditional 0.5] [--routes book,books_page] [--output results.json]
+
+Opens ``--concurrency`` keep-alive connections and has each send requests
+back to back for ``--duration`` seconds, drawn from a read-heavy mix of
+page, lookup, search, genre and stats requests. A ``--conditional``
+fraction of requests revalidate with the last ETag seen for that URL, as a
+caching client would. Prints throughput, status counts and p50/p95/p99
+latency per route.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import random
+import statistics
+import time
+from collections import Counter, defaultdict
+from urllib.parse import quote, urlsplit
+
+# Route -> relative weight in the request mix
+MIX = {
+    "books_page": 30,
+    "book": 35,
+    "search": 20,
+    "genres": 5,
+    "stats": 10,
+}
+SORTS = ["title", "-title", "author", "-year", "year"]
+
+
+class Client:
+    """One keep-alive HTTP/1.1 connection."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, path, headers=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        lines = [f"GET {path} HTTP/1.1", f"Host: {self.host}", "Accept-Encoding: gzip"]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+        body = await self.reader.readexactly(int(response_headers.get("content-length", 0)))
+        if response_headers.get("connection") == "close":
+            self.close()
+        return status, response_headers, body
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = self.reader = None
+
+
+def decode(headers, body):
+    if headers.get("content-encoding") == "gzip":
+        body = gzip.decompress(body)
+    return json.loads(body)
+
+
+async def sample_catalog(client):
+    # Ids, words and genres to build realistic requests from
+    status, headers, body = await client.request("/books?limit=200")
+    if status != 200:
+        raise SystemExit(f"GET /books returned {status}; is the API running?")
+    books = decode(headers, body)["items"]
+    status, headers, body = await client.request("/genres")
+    genres = decode(headers, body)["genres"]
+    words = sorted({word for book in books for word in book["title"].split() if len(word) > 3})
+    return [book["id"] for book in books], words or ["the"], genres
+
+
+def make_path(route, rng, ids, words, genres):
+    if route == "books_page":
+        genre = f"&genre={quote(rng.choice(genres))}" if genres and rng.random() < 0.5 else ""
+        return f"/books?sort={quote(rng.choice(SORTS))}&limit=24{genre}"
+    if route == "book":
+        return f"/books/{rng.choice(ids)}"
+    if route == "search":
+        return f"/search?q={quote(rng.choice(words))}&limit=20"
+    return f"/{route}"
+
+
+async def worker(host, port, deadline, rng, sample, mix, conditional, results, etags):
+    client = Client(host, port)
+    routes, weights = list(mix), list(mix.values())
+    try:
+        while time.perf_counter() < deadline:
+            route = rng.choices(routes, weights)[0]
+            path = make_path(route, rng, *sample)
+            headers = {}
+            if path in etags and rng.random() < conditional:
+                headers["If-None-Match"] = etags[path]
+            start = time.perf_counter()
+            try:
+                status, response_headers, body = await client.request(path, headers)
+            except (ConnectionError, asyncio.IncompleteReadError, IndexError, ValueError):
+                client.close()
+                status, response_headers, body = 0, {}, b""
+            results.append((route, status, time.perf_counter() - start, len(body)))
+            if "etag" in response_headers:
+                etags[path] = response_headers["etag"]
+    finally:
+        client.close()
+
+
+def summarize(results, elapsed):
+    by_route = defaultdict(list)
+    for route, status, seconds, size in results:
+        by_route[route].append((status, seconds, size))
+
+    def latency(samples):
+        times = sorted(seconds for _, seconds, _ in samples)
+        q = statistics.quantiles(times, n=100, method="inclusive") if len(times) > 1 else times * 99
+        return {"p50_ms": q[49] * 1000, "p95_ms": q[94] * 1000, "p99_ms": q[98] * 1000}
+
+    return {
+        "requests": len(results),
+        "seconds": elapsed,
+        "rps": len(results) / elapsed,
+        "bytes": sum(size for *_, size in results),
+        "statuses": dict(Counter(str(status) for _, status, _, _ in results)),
+        "latency": latency([sample[1:] for sample in results]) if results else {},
+        "routes": {
+            route: {"requests": len(samples), **latency(samples)}
+            for route, samples in sorted(by_route.items())
+        },
+    }
+
+
+async def run(url, concurrency, duration, conditional, seed, mix=MIX):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    setup = Client(host, port)
+    sample = await sample_catalog(setup)
+    setup.close()
+
+    results, etags = [], {}
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(
+        worker(host, port, deadline, random.Random(seed + i), sample, mix, conditional, results, etags)
+        for i in range(concurrency)
+    ))
+    return summarize(results, time.perf_counter() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure API throughput against a running api.py.")
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--concurrency", type=int, default=32, help="parallel keep-alive connections")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--conditional", type=float, default=0.5, help="fraction of repeat requests sent with If-None-Match")
+    parser.add_argument("--routes", help=f"comma-separated subset of the mix ({','.join(MIX)})")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    mix = {route: MIX[route] for route in args.routes.split(",")} if args.routes else MIX
+    report = asyncio.run(run(args.url, args.concurrency, args.duration, args.conditional, args.seed, mix))
+    print(f"{report['requests']:,} requests in {report['seconds']:.1f}s = {report['rps']:,.0f} req/s, "
+          f"{report['bytes'] / 1e6:.1f} MB received")
+    print(f"statuses: {report['statuses']}")
+    print(f"{'route':<12} {'requests':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for route, row in report["routes"].items():
+        print(f"{route:<12} {row['requests']:>9,} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,29 @@
+import time
+_script_started = time.perf_counter()
+
 import streamlit as st
-import sqlite3
-import pandas as pd
 from datetime import datetime
-import random
+import io
+import os
+import json
+
+from db import (ensure_db, get_book, get_books, get_books_page, get_genres, find_books, add_book, update_book, delete_book,
+                get_stats, catalog_version, BOOK_COLUMNS, SORT_ORDERS, PICKER_LIMIT)
+from importer import import_books, detect_format
+from exporter import export_books, WRITERS as EXPORT_FORMATS, MIME_TYPES
+from batch import batch_update, batch_delete, undo_batch, recent_batches, select_book_ids, count_books, EDITABLE_FIELDS
+from db import get_pool, get_writer, query_cache, BookNotFoundError, ConflictError
+from perf import recorder, instrument
+from search_worker import search_worker
+from cards import card_html, grid_html, forget_card, cover_color
+from startup import record_once, script_finished, stylesheet_html
+
+# pandas is imported inside the views that need it, to keep it off the cold-start path
+record_once("startup.imports", time.perf_counter() - _script_started)
+
+SEARCH_TIMEOUT = 30  # seconds
+SEARCH_WAIT = 0.5  # seconds a search is waited on before it is polled instead
+SEARCH_POLL = 0.25  # seconds between checks on a search still running
 
 # Set page configuration
 st.set_page_config(
@@ -12,691 +33,141 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Custom CSS with minimalist elegant design
-st.markdown("""
-<style>
-    @import url('https://fonts.googleapis.com/css2?family=Poppins:wght@300;400;500;600;700&family=Playfair+Display:wght@500;600;700;800&display=swap');
-    
-    :root {
-        --primary-color: #4F46E5;
-        --primary-light: #818CF8;
-        --primary-dark: #3730A3;
-        --secondary-color: #F43F5E;
-        --accent-color: #10B981;
-        --background-color: #F9FAFB;
-        --card-color: #FFFFFF;
-        --text-primary: #1F2937;
-        --text-secondary: #4B5563;
-        --text-tertiary: #9CA3AF;
-        --shadow: rgba(0, 0, 0, 0.05);
-        --shadow-hover: rgba(0, 0, 0, 0.1);
-        --border-color: #E5E7EB;
-        --gradient-primary: linear-gradient(135deg, #4F46E5, #818CF8);
-        --gradient-secondary: linear-gradient(135deg, #F43F5E, #FB7185);
-    }
-    
-    /* Dark mode variables */
-    .dark {
-        --primary-color: #818CF8;
-        --primary-light: #A5B4FC;
-        --primary-dark: #4F46E5;
-        --secondary-color: #FB7185;
-        --accent-color: #34D399;
-        --background-color: #111827;
-        --card-color: #1F2937;
-        --text-primary: #F9FAFB;
-        --text-secondary: #E5E7EB;
-        --text-tertiary: #9CA3AF;
-        --shadow: rgba(0, 0, 0, 0.2);
-        --shadow-hover: rgba(0, 0, 0, 0.3);
-        --border-color: #374151;
-    }
-    
-    html, body, [data-testid="stAppViewContainer"] {
-        background-color: var(--background-color);
-        font-family: 'Poppins', sans-serif;
-        color: var(--text-primary);
-        transition: all 0.3s ease;
-    }
-    
-    /* Main header styling */
-    .main-header {
-        font-family: 'Playfair Display', serif;
-        font-size: 3.5rem;
-        font-weight: 800;
-        color: var(--primary-color);
-        text-align: center;
-        margin: 2rem 0 3rem 0;
-        letter-spacing: -0.5px;
-        line-height: 1.2;
-    }
-    
-    .main-header span {
-        display: block;
-        font-size: 1.2rem;
-        font-weight: 400;
-        font-family: 'Poppins', sans-serif;
-        color: var(--text-secondary);
-        letter-spacing: 2px;
-        margin-top: 0.5rem;
-        text-transform: uppercase;
-    }
-    
-    /* Section header styling */
-    .section-header {
-        font-family: 'Playfair Display', serif;
-        font-size: 2rem;
-        font-weight: 700;
-        color: var(--primary-color);
-        margin: 2rem 0;
-        position: relative;
-        display: inline-block;
-        padding-bottom: 0.5rem;
-    }
-    
-    .section-header::after {
-        content: "";
-        position: absolute;
-        bottom: 0;
-        left: 0;
-        width: 60px;
-        height: 3px;
-        background: var(--secondary-color);
-        border-radius: 1.5px;
-    }
-    
-    /* Card styling */
-    .book-card {
-        background-color: var(--card-color);
-        border-radius: 12px;
-        padding: 1.75rem;
-        margin-bottom: 1.5rem;
-        box-shadow: 0 4px 12px var(--shadow);
-        transition: all 0.3s cubic-bezier(0.175, 0.885, 0.32, 1.275);
-        border: 1px solid var(--border-color);
-        position: relative;
-        overflow: hidden;
-    }
-    
-    .book-card:hover {
-        transform: translateY(-8px);
-        box-shadow: 0 12px 24px var(--shadow-hover);
-        border-color: var(--primary-light);
-    }
-    
-    /* Book cover styling */
-    .book-cover {
-        width: 100%;
-        height: 180px;
-        background: var(--gradient-primary);
-        border-radius: 8px;
-        display: flex;
-        align-items: center;
-        justify-content: center;
-        color: white;
-        font-family: 'Playfair Display', serif;
-        font-weight: 700;
-        font-size: 1.25rem;
-        text-align: center;
-        padding: 1rem;
-        margin-bottom: 1.25rem;
-        box-shadow: 0 4px 8px rgba(0, 0, 0, 0.15);
-        position: relative;
-        overflow: hidden;
-    }
-    
-    .book-cover::after {
-        content: "📖";
-        position: absolute;
-        bottom: 8px;
-        right: 8px;
-        font-size: 1.5rem;
-        opacity: 0.7;
-    }
-    
-    /* Book title styling */
-    .book-title {
-        font-family: 'Playfair Display', serif;
-        font-size: 1.4rem;
-        font-weight: 700;
-        color: var(--text-primary);
-        margin-bottom: 0.5rem;
-        line-height: 1.3;
-        overflow: hidden;
-        text-overflow: ellipsis;
-        display: -webkit-box;
-        -webkit-line-clamp: 2;
-        -webkit-box-orient: vertical;
-    }
-    
-    /* Book author styling */
-    .book-author {
-        font-size: 1rem;
-        font-weight: 500;
-        color: var(--secondary-color);
-        margin-bottom: 1rem;
-        font-style: italic;
-    }
-    
-    /* Book details styling */
-    .book-details {
-        font-size: 0.95rem;
-        font-weight: 500;
-        color: var(--text-secondary);
-        margin-bottom: 0.6rem;
-        display: flex;
-        align-items: center;
-    }
-    
-    .book-details i {
-        margin-right: 0.6rem;
-        color: var(--primary-color);
-        font-size: 1rem;
-        flex-shrink: 0;
-    }
-    
-    /* Badge styling */
-    .badge {
-        display: inline-flex;
-        align-items: center;
-        justify-content: center;
-        padding: 0.3rem 0.8rem;
-        border-radius: 20px;
-        font-size: 0.75rem;
-        font-weight: 600;
-        margin-right: 0.5rem;
-        margin-top: 0.75rem;
-        background-color: var(--primary-light);
-        color: white;
-        text-transform: uppercase;
-        letter-spacing: 0.5px;
-    }
-    
-    /* Genre specific badges */
-    .badge-fiction { background-color: #4F46E5; }
-    .badge-nonfiction { background-color: #10B981; }
-    .badge-scifi { background-color: #7C3AED; }
-    .badge-fantasy { background-color: #F59E0B; }
-    .badge-mystery { background-color: #8B5CF6; }
-    .badge-thriller { background-color: #EF4444; }
-    .badge-romance { background-color: #EC4899; }
-    .badge-biography { background-color: #10B981; }
-    .badge-history { background-color: #3B82F6; }
-    .badge-selfhelp { background-color: #8B5CF6; }
-    .badge-other { background-color: #6B7280; }
-    
-    /* Button styling */
-    .stButton button {
-        background-color: var(--primary-color);
-        color: white;
-        font-weight: 600;
-        border-radius: 8px;
-        padding: 0.7rem 1.2rem;
-        border: none;
-        transition: all 0.3s ease;
-        box-shadow: 0 4px 8px rgba(79, 70, 229, 0.2);
-        width: 100%;
-        text-transform: uppercase;
-        font-size: 0.875rem;
-        letter-spacing: 0.5px;
-    }
-    
-    .stButton button:hover {
-        background-color: var(--primary-dark);
-        box-shadow: 0 6px 12px rgba(79, 70, 229, 0.3);
-        transform: translateY(-2px);
-    }
-    
-    /* Delete button styling */
-    .delete-btn {
-        background-color: #EF4444 !important;
-        box-shadow: 0 4px 8px rgba(239, 68, 68, 0.2) !important;
-    }
-    
-    .delete-btn:hover {
-        background-color: #DC2626 !important;
-        box-shadow: 0 6px 12px rgba(239, 68, 68, 0.3) !important;
-    }
-    
-    /* Form styling */
-    .stTextInput input, .stTextArea textarea, .stNumberInput div[data-baseweb="input"] input {
-        background-color: var(--card-color);
-        border: 1px solid var(--border-color);
-        border-radius: 8px;
-        padding: 0.8rem 1rem;
-        font-family: 'Poppins', sans-serif;
-        font-weight: 400;
-        color: var(--text-primary);
-        transition: all 0.3s ease;
-        box-shadow: 0 2px 4px var(--shadow);
-    }
-    
-    .stTextInput input:focus, .stTextArea textarea:focus, .stNumberInput div[data-baseweb="input"] input:focus {
-        border-color: var(--primary-color);
-        box-shadow: 0 0 0 3px rgba(79, 70, 229, 0.2);
-    }
-    
-    /* Select box styling */
-    .stSelectbox div[data-baseweb="select"] {
-        background-color: var(--card-color);
-        border: 1px solid var(--border-color);
-        border-radius: 8px;
-        box-shadow: 0 2px 4px var(--shadow);
-        transition: all 0.3s ease;
-    }
-    
-    .stSelectbox div[data-baseweb="select"]:hover,
-    .stSelectbox div[data-baseweb="select"]:focus-within {
-        border-color: var(--primary-color);
-        box-shadow: 0 0 0 3px rgba(79, 70, 229, 0.2);
-    }
-    
-    /* Filter container styling */
-    .filter-container {
-        background-color: var(--card-color);
-        border-radius: 12px;
-        padding: 1.5rem;
-        margin-bottom: 2rem;
-        box-shadow: 0 4px 12px var(--shadow);
-        border: 1px solid var(--border-color);
-    }
-    
-    .filter-title {
-        font-weight: 600;
-        color: var(--primary-color);
-        font-size: 1.1rem;
-        margin-bottom: 1.25rem;
-        display: flex;
-        align-items: center;
-    }
-    
-    .filter-title svg {
-        margin-right: 0.5rem;
-        color: var(--primary-color);
-    }
-    
-    /* Expander styling */
-    .streamlit-expanderHeader {
-        font-weight: 600;
-        color: var(--primary-color);
-        background-color: var(--card-color);
-        border-radius: 8px;
-        padding: 0.6rem 1rem;
-        border: 1px solid var(--border-color);
-    }
-    
-    /* Animation classes */
-    .fade-in {
-        animation: fadeIn 0.6s ease-out;
-    }
-    
-    @keyframes fadeIn {
-        from { opacity: 0; transform: translateY(20px); }
-        to { opacity: 1; transform: translateY(0); }
-    }
-    
-    /* Stats card styling */
-    .stats-card {
-        background-color: var(--card-color);
-        border-radius: 12px;
-        padding: 1.75rem;
-        box-shadow: 0 4px 12px var(--shadow);
-        text-align: center;
-        transition: all 0.3s ease;
-        border: 1px solid var(--border-color);
-        border-left: 4px solid var(--primary-color);
-    }
-    
-    .stats-card:hover {
-        transform: translateY(-6px);
-        box-shadow: 0 8px 16px var(--shadow-hover);
-    }
-    
-    .stats-card.accent {
-        border-left-color: var(--secondary-color);
-    }
-    
-    .stats-number {
-        font-size: 2.75rem;
-        font-weight: 700;
-        color: var(--primary-color);
-        margin-bottom: 0.5rem;
-    }
-    
-    .stats-card.accent .stats-number {
-        color: var(--secondary-color);
-    }
-    
-    .stats-label {
-        font-size: 1rem;
-        font-weight: 500;
-        color: var(--text-secondary);
-        text-transform: uppercase;
-        letter-spacing: 1px;
-    }
-    
-    /* Search styling */
-    .search-container {
-        position: relative;
-        margin-bottom: 1.5rem;
-    }
-    
-    .search-input {
-        width: 100%;
-        border: 1px solid var(--border-color);
-        border-radius: 30px;
-        padding: 0.75rem 1rem 0.75rem 3rem;
-        font-family: 'Poppins', sans-serif;
-        font-size: 1rem;
-        color: var(--text-primary);
-        background-color: var(--card-color);
-        box-shadow: 0 2px 8px var(--shadow);
-        transition: all 0.3s ease;
-    }
-    
-    .search-input:focus {
-        outline: none;
-        border-color: var(--primary-color);
-        box-shadow: 0 0 0 3px rgba(79, 70, 229, 0.2);
-    }
-    
-    .search-icon {
-        position: absolute;
-        left: 1.25rem;
-        top: 50%;
-        transform: translateY(-50%);
-        color: var(--text-tertiary);
-    }
-    
-    /* Empty state styling */
-    .empty-state {
-        text-align: center;
-        padding: 3rem 2rem;
-        background-color: var(--card-color);
-        border-radius: 12px;
-        box-shadow: 0 4px 12px var(--shadow);
-        margin: 2rem 0;
-        border: 1px solid var(--border-color);
-    }
-    
-    .empty-state-icon {
-        font-size: 4rem;
-        color: var(--primary-color);
-        margin-bottom: 1.5rem;
-        opacity: 0.7;
-    }
-    
-    .empty-state-text {
-        font-size: 1.25rem;
-        font-weight: 600;
-        color: var(--text-secondary);
-        margin-bottom: 1rem;
-    }
-    
-    /* Footer styling */
-    .footer {
-        text-align: center;
-        padding: 2.5rem 0;
-        color: var(--text-tertiary);
-        font-size: 0.875rem;
-        font-weight: 400;
-        margin-top: 3rem;
-    }
-    
-    .footer-brand {
-        font-weight: 600;
-        font-size: 1rem;
-        color: var(--primary-color);
-        margin-bottom: 0.5rem;
-    }
-    
-    /* Tab styling */
-    .stTabs [data-baseweb="tab-list"] {
-        gap: 4px;
-        border-bottom: 1px solid var(--border-color);
-        padding-bottom: 0.5rem;
-    }
-    
-    .stTabs [data-baseweb="tab"] {
-        background-color: transparent;
-        border-radius: 6px;
-        padding: 0.6rem 1rem;
-        font-weight: 500;
-        font-size: 0.95rem;
-        color: var(--text-secondary);
-        border: none;
-    }
-    
-    .stTabs [aria-selected="true"] {
-        background-color: var(--primary-color);
-        color: white;
-        font-weight: 600;
-    }
-            
-    .stTextInput input, 
-    .stTextArea textarea, 
-    .stNumberInput div[data-baseweb="input"] input,
-    .stSelectbox div[data-baseweb="select"] {
-        color: #000000 !important; /* Force black text color */
-    }
-
-    .stTextInput label, 
-    .stTextArea label, 
-    .stNumberInput label,
-    .stSelectbox label {
-        color: #000000 !important; /* Force black text color */
-    }
-
-    .stTextInput input::placeholder, 
-    .stTextArea textarea::placeholder, 
-    .stNumberInput div[data-baseweb="input"] input::placeholder {
-        color: #666666 !important; /* Gray placeholder text */
-    }
-    
-    /* Chart styling */
-    [data-testid="stVegaLiteChart"] {
-        background-color: var(--card-color);
-        border-radius: 12px;
-        padding: 1.5rem;
-        box-shadow: 0 4px 12px var(--shadow);
-        border: 1px solid var(--border-color);
-    }
-</style>
-""", unsafe_allow_html=True)
+# Styles live in static/library.css; see startup.stylesheet_html
+st.markdown(stylesheet_html(st.get_option("server.enableStaticServing")), unsafe_allow_html=True)
 
-# Initialize database
-def init_db():
-    conn = sqlite3.connect('library.db')
-    c = conn.cursor()
-    c.execute('''
-    CREATE TABLE IF NOT EXISTS books (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        title TEXT NOT NULL,
-        author TEXT NOT NULL,
-        genre TEXT,
-        year INTEGER,
-        isbn TEXT,
-        description TEXT,
-        added_date TEXT
-    )
-    ''')
-    conn.commit()
-    
-    # Check if we need to add sample books
-    c.execute("SELECT COUNT(*) FROM books")
-    count = c.fetchone()[0]
-    
-    if count == 0:
-        # Add sample books with more details
-        sample_books = [
-            ("To Kill a Mockingbird", "Harper Lee", "Fiction", 1960, "978-0061120084", 
-             "A classic of modern American literature about racial inequality in the American South.", 
-             datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
-            
-            ("1984", "George Orwell", "Dystopian", 1949, "978-0451524935", 
-             "A dystopian social science fiction novel about totalitarianism, mass surveillance, and repressive regimentation.", 
-             datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
-            
-            ("The Great Gatsby", "F. Scott Fitzgerald", "Classic", 1925, "978-0743273565", 
-             "A novel about the American Dream, decadence, resistance to change, and social upheaval set in the Roaring Twenties.", 
-             datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
-            
-            ("Pride and Prejudice", "Jane Austen", "Romance", 1813, "978-0141439518", 
-             "A romantic novel of manners that depicts the emotional development of Elizabeth Bennet, who learns about the repercussions of hasty judgments.", 
-             datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
-            
-            ("The Hobbit", "J.R.R. Tolkien", "Fantasy", 1937, "978-0547928227", 
-             "A fantasy novel about the adventures of hobbit Bilbo Baggins, who is hired by the wizard Gandalf as a burglar for a group of dwarves.", 
-             datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
-            
-            ("One Hundred Years of Solitude", "Gabriel García Márquez", "Magical Realism", 1967, "978-0060883287", 
-             "A landmark of magical realism that tells the multi-generational story of the Buendía family in the fictional town of Macondo.", 
-             datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
-            
-            ("The Alchemist", "Paulo Coelho", "Fiction", 1988, "978-0062315007", 
-             "A philosophical novel about a young Andalusian shepherd who dreams of finding worldly treasures and embarks on a journey to find them.", 
-             datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
-            
-            ("The Catcher in the Rye", "J.D. Salinger", "Coming-of-age", 1951, "978-0316769488", 
-             "A novel about teenage angst, alienation, and the loss of innocence, narrated by the protagonist Holden Caulfield.", 
-             datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
-            
-            ("The Lord of the Rings", "J.R.R. Tolkien", "Fantasy", 1954, "978-0618640157", 
-             "An epic high-fantasy novel that follows the quest to destroy the One Ring, which was created by the Dark Lord Sauron.", 
-             datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
-            
-            ("Crime and Punishment", "Fyodor Dostoevsky", "Psychological Fiction", 1866, "978-0143107637", 
-             "A novel that focuses on the mental anguish and moral dilemmas of Rodion Raskolnikov, an impoverished ex-student in Saint Petersburg.", 
-             datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
-        ]
-        
-        c.executemany('''
-        INSERT INTO books (title, author, genre, year, isbn, description, added_date)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', sample_books)
-        conn.commit()
-    
-    conn.close()
+# Initialize the database (once per process)
+ensure_db()
 
-# Database operations
-def get_all_books():
-    conn = sqlite3.connect('library.db')
-    books = pd.read_sql_query("SELECT * FROM books ORDER BY title", conn)
-    conn.close()
-    return books
+# Export panel shared by the Browse and Search tabs. The file is only built
+# when asked for, so the panel costs nothing on ordinary reruns.
+def render_export(key, genre=None, search=None, sort="Title (A-Z)"):
+    with st.expander("Export"):
+        col1, col2 = st.columns([1, 3])
+        with col1:
+            fmt = st.selectbox("Format", list(EXPORT_FORMATS), format_func=str.upper, key=f"{key}_export_format")
+        with col2:
+            columns = st.multiselect("Columns", BOOK_COLUMNS, default=BOOK_COLUMNS, key=f"{key}_export_columns")
+        if st.button("Prepare Export", disabled=not columns, key=f"{key}_export_button"):
+            out = io.BytesIO()
+            count = export_books(out, fmt, columns, genre=genre, search=search, sort=sort)
+            st.download_button(f"Download {count:,} books", out.getvalue(), file_name=f"books.{fmt}",
+                               mime=MIME_TYPES[fmt], key=f"{key}_export_download")
 
-def add_book(title, author, genre, year, isbn, description):
-    conn = sqlite3.connect('library.db')
-    c = conn.cursor()
-    c.execute('''
-    INSERT INTO books (title, author, genre, year, isbn, description, added_date)
-    VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (title, author, genre, year, isbn, description, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
-    conn.commit()
-    conn.close()
+# Batch edit panel for the Edit tab. Books are picked by filter, optionally
+# narrowed with checkboxes, and changed in one transaction that can be undone.
+BATCH_GRID_ROWS = 500
 
-def update_book(id, title, author, genre, year, isbn, description):
-    conn = sqlite3.connect('library.db')
-    c = conn.cursor()
-    c.execute('''
-    UPDATE books
-    SET title = ?, author = ?, genre = ?, year = ?, isbn = ?, description = ?
-    WHERE id = ?
-    ''', (title, author, genre, year, isbn, description, id))
-    conn.commit()
-    conn.close()
+def render_batch_edit():
+    # The expander's body runs even while it is closed, so pandas is only
+    # imported where a table is actually built
+    with st.expander("Batch Edit and Delete"):
+        col1, col2 = st.columns(2)
+        with col1:
+            genre = st.selectbox("Genre", ["All"] + get_genres(), key="batch_genre")
+        with col2:
+            text = st.text_input("Matching", placeholder="Search terms (optional)", key="batch_search")
+        genre, text = None if genre == "All" else genre, text.strip() or None
+        # Only a count while the filter is being edited; the ids themselves
+        # are fetched when the batch is previewed or applied
+        matches = count_books(genre, text)
+        picked = None
 
-def delete_book(id):
-    conn = sqlite3.connect('library.db')
-    c = conn.cursor()
-    c.execute("DELETE FROM books WHERE id = ?", (id,))
-    conn.commit()
-    conn.close()
+        if st.toggle("Pick individual books", key="batch_pick", disabled=not matches):
+            import pandas as pd
+            shown = get_books(select_book_ids(genre, text, limit=BATCH_GRID_ROWS))
+            if matches > BATCH_GRID_ROWS:
+                st.caption(f"Showing the first {BATCH_GRID_ROWS} of {matches:,} matches; narrow the filter to see the rest.")
+            grid = st.data_editor(
+                pd.DataFrame({"Select": False, "id": [b.id for b in shown], "Title": [b.title for b in shown],
+                              "Author": [b.author for b in shown], "Genre": [b.genre for b in shown],
+                              "Year": [b.year for b in shown]}),
+                disabled=["id", "Title", "Author", "Genre", "Year"], hide_index=True,
+                use_container_width=True, key="batch_grid")
+            picked = grid.loc[grid["Select"], "id"].tolist()
+        selected = matches if picked is None else len(picked)
+        st.write(f"**{selected:,}** books selected")
 
-def get_book(id):
-    conn = sqlite3.connect('library.db')
-    c = conn.cursor()
-    c.execute("SELECT * FROM books WHERE id = ?", (id,))
-    book = c.fetchone()
-    conn.close()
-    
-    if book:
-        return {
-            "id": book[0],
-            "title": book[1],
-            "author": book[2],
-            "genre": book[3],
-            "year": book[4],
-            "isbn": book[5],
-            "description": book[6],
-            "added_date": book[7]
-        }
-    return None
-
-def search_books(query):
-    conn = sqlite3.connect('library.db')
-    c = conn.cursor()
-    c.execute("""
-    SELECT * FROM books 
-    WHERE title LIKE ? OR author LIKE ? OR genre LIKE ? OR isbn LIKE ?
-    ORDER BY title
-    """, (f"%{query}%", f"%{query}%", f"%{query}%", f"%{query}%"))
-    books = c.fetchall()
-    conn.close()
-    
-    return pd.DataFrame(books, columns=["id", "title", "author", "genre", "year", "isbn", "description", "added_date"])
-
-def get_stats():
-    conn = sqlite3.connect('library.db')
-    c = conn.cursor()
-    
-    # Total books
-    c.execute("SELECT COUNT(*) FROM books")
-    total_books = c.fetchone()[0]
-    
-    # Total authors
-    c.execute("SELECT COUNT(DISTINCT author) FROM books")
-    total_authors = c.fetchone()[0]
-    
-    # Genre distribution
-    c.execute("SELECT genre, COUNT(*) FROM books GROUP BY genre ORDER BY COUNT(*) DESC")
-    genre_data = c.fetchall()
-    
-    # Year distribution
-    c.execute("SELECT year, COUNT(*) FROM books GROUP BY year ORDER BY year")
-    year_data = c.fetchall()
-    
-    conn.close()
-    
-    return {
-        "total_books": total_books,
-        "total_authors": total_authors,
-        "genre_data": genre_data,
-        "year_data": year_data
-    }
+        action = st.radio("Action", ["Update fields", "Delete"], horizontal=True, key="batch_action")
+        changes = {}
+        if action == "Update fields":
+            fields = st.multiselect("Fields to set", EDITABLE_FIELDS, key="batch_fields")
+            for field in fields:
+                if field == "year":
+                    changes[field] = st.number_input("New year", min_value=1000, max_value=datetime.now().year,
+                                                     value=2000, step=1, key="batch_value_year")
+                elif field == "description":
+                    changes[field] = st.text_area("New description", key="batch_value_description")
+                else:
+                    changes[field] = st.text_input(f"New {field}", key=f"batch_value_{field}")
 
-# Initialize the database
-init_db()
+        col1, col2 = st.columns(2)
+        ready = bool(selected) and (action == "Delete" or bool(changes))
+        preview = col1.button("Preview", disabled=not ready, key="batch_preview", use_container_width=True)
+        apply = col2.button(f"{action.split()[0]} {selected:,} books", disabled=not ready, type="primary",
+                            key="batch_apply", use_container_width=True)
+        if preview or apply:
+            ids = select_book_ids(genre, text) if picked is None else picked
+            try:
+                if action == "Delete":
+                    result = batch_delete(ids, dry_run=preview)
+                else:
+                    result = batch_update(ids, changes, dry_run=preview)
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                if result.dry_run:
+                    import pandas as pd
+                    st.info(f"Would {'delete' if action == 'Delete' else 'change'} {result.changed:,} of "
+                            f"{result.matched:,} selected books. Nothing has been changed yet.")
+                    rows = []
+                    for before, after in result.preview:
+                        row = {"id": before.id, "Title": before.title}
+                        for field in changes:
+                            row[f"{field} (now)"] = getattr(before, field)
+                            row[f"{field} (new)"] = getattr(after, field)
+                        rows.append(row)
+                    st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+                else:
+                    st.success(f"{'Deleted' if action == 'Delete' else 'Updated'} {result.changed:,} books in "
+                               f"{result.seconds:.2f}s as batch #{result.batch_id}. It can be undone below.")
 
-# Generate a random gradient for book covers
-def get_random_cover_color():
-    colors = [
-        "#4F46E5", "#7C3AED", "#F43F5E", "#10B981",
-        "#3B82F6", "#F59E0B", "#EC4899", "#8B5CF6"
-    ]
-    return random.choice(colors)
+        batches = recent_batches()
+        if batches:
+            import pandas as pd
+            st.markdown("<p style='font-weight: 600; margin-top: 1rem;'>Recent batches</p>", unsafe_allow_html=True)
+            st.dataframe(pd.DataFrame(batches), hide_index=True, use_container_width=True)
+            undoable = [b["id"] for b in batches if not b["undone_at"]]
+            if undoable:
+                col1, col2 = st.columns([1, 1])
+                with col1:
+                    batch_id = st.selectbox("Batch to undo", undoable, format_func=lambda i: f"#{i}",
+                                            label_visibility="collapsed", key="batch_undo_id")
+                with col2:
+                    if st.button("Undo batch", key="batch_undo", use_container_width=True):
+                        try:
+                            result = undo_batch(batch_id)
+                        except ValueError as e:
+                            st.error(str(e))
+                        else:
+                            st.success(f"Restored {result.changed:,} books from batch #{batch_id}.")
+                            if result.skipped:
+                                shown = ", ".join(f"#{book_id}" for book_id in result.skipped[:20])
+                                more = f" and {len(result.skipped) - 20:,} more" if len(result.skipped) > 20 else ""
+                                st.warning(f"{len(result.skipped):,} books were edited or deleted after the batch "
+                                           f"and were left as they are: {shown}{more}.")
 
 # Main content
 st.markdown("<h1 class='main-header'>📚 BOOKVERSE<span>Personal Library Management</span></h1>", unsafe_allow_html=True)
 
-# Create tabs with better styling
-tabs = st.tabs(["📚 Browse", "➕ Add Book", "✏️ Edit Books", "🔍 Search", "📊 Statistics"])
+# The Performance tab is for admins: enable it with LIBRARY_ADMIN=1 or ?admin=1
+show_admin = os.environ.get("LIBRARY_ADMIN") == "1" or st.query_params.get("admin") == "1"
 
-with tabs[0]:  # Browse Books
+@st.fragment
+@instrument("render.browse")
+def render_browse():  # Browse Books
     st.markdown("<h2 class='section-header fade-in'>Book Collection</h2>", unsafe_allow_html=True)
     
-    books = get_all_books()
-    
     # Filter options with completely redesigned styling
     st.markdown("""
     <div class="filter-container fade-in">
@@ -708,53 +179,41 @@ with tabs[0]:  # Browse Books
         </div>
     """, unsafe_allow_html=True)
     
-    col1, col2 = st.columns(2)
+    col1, col2, col3 = st.columns([2, 2, 1])
     with col1:
-        genre_filter = st.selectbox("Filter by Genre", ["All"] + sorted(books["genre"].unique().tolist()), label_visibility="collapsed", key="genre_filter")
+        genre_filter = st.selectbox("Filter by Genre", ["All"] + get_genres(), label_visibility="collapsed", key="genre_filter")
     with col2:
-        sort_by = st.selectbox("Sort by", ["Title (A-Z)", "Title (Z-A)", "Author", "Year (Newest)", "Year (Oldest)"], label_visibility="collapsed", key="sort_by")
+        sort_by = st.selectbox("Sort by", list(SORT_ORDERS), label_visibility="collapsed", key="sort_by")
+    with col3:
+        page_size = st.selectbox("Books per page", [12, 24, 48, 96], index=1, label_visibility="collapsed", key="page_size",
+                                 format_func=lambda n: f"{n} per page")
     
     st.markdown("</div>", unsafe_allow_html=True)
     
-    # Apply filters
-    if genre_filter != "All":
-        filtered_books = books[books["genre"] == genre_filter]
-    else:
-        filtered_books = books
+    # Load pages from SQL one at a time; earlier pages stay in session state so
+    # "Load more" only fetches the next page instead of re-reading the catalog.
+    # Any write bumps the catalog version, which starts the list over.
+    browse_key = (genre_filter, sort_by, page_size, catalog_version())
+    browse = st.session_state.get("browse")
+    if browse is None or browse["key"] != browse_key:
+        page, cursor = get_books_page(sort_by, None if genre_filter == "All" else genre_filter, limit=page_size)
+        browse = st.session_state["browse"] = {"key": browse_key, "pages": [page], "cursor": cursor}
     
-    # Apply sorting
-    if sort_by == "Title (A-Z)":
-        filtered_books = filtered_books.sort_values("title")
-    elif sort_by == "Title (Z-A)":
-        filtered_books = filtered_books.sort_values("title", ascending=False)
-    elif sort_by == "Author":
-        filtered_books = filtered_books.sort_values("author")
-    elif sort_by == "Year (Newest)":
-        filtered_books = filtered_books.sort_values("year", ascending=False)
-    elif sort_by == "Year (Oldest)":
-        filtered_books = filtered_books.sort_values("year")
+    def load_more_books():
+        page, cursor = get_books_page(sort_by, None if genre_filter == "All" else genre_filter,
+                                      after=browse["cursor"], limit=page_size)
+        browse["pages"].append(page)
+        browse["cursor"] = cursor
+    
+    render_export("browse", genre=None if genre_filter == "All" else genre_filter, sort=sort_by)
     
     # Display books in a grid with enhanced cards
-    if not filtered_books.empty:
-        cols = st.columns(3)
-        for i, (_, book) in enumerate(filtered_books.iterrows()):
-            with cols[i % 3]:
-                cover_color = get_random_cover_color()
-                st.markdown(f"""
-                <div class='book-card fade-in'>
-                    <div class='book-cover' style='background-color: {cover_color};'>
-                        {book['title']}
-                    </div>
-                    <div class='book-title'>{book['title']}</div>
-                    <div class='book-author'>by {book['author']}</div>
-                    <div class='book-details'><i>📅</i> {book['year']}</div>
-                    <div class='book-details'><i>📚</i> {book['genre']}</div>
-                    <div class='badge badge-{book["genre"].lower().replace(" ", "")}'>{book['genre']}</div>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                with st.expander("View Description"):
-                    st.write(book['description'])
+    if browse["pages"][0]:
+        # One markdown element for the whole list; card HTML is cached per book
+        st.markdown(grid_html(book for page in browse["pages"] for book in page), unsafe_allow_html=True)
+        
+        if browse["cursor"] is not None:
+            st.button("Load more", on_click=load_more_books, key="browse_load_more", use_container_width=True)
     else:
         st.markdown("""
         <div class='empty-state'>
@@ -764,7 +223,9 @@ with tabs[0]:  # Browse Books
         </div>
         """, unsafe_allow_html=True)
 
-with tabs[1]:  # Add Book
+@st.fragment
+@instrument("render.add")
+def render_add():  # Add Book
     st.markdown("<h2 class='section-header fade-in'>Add New Book</h2>", unsafe_allow_html=True)
     
     # Enhanced form with better styling
@@ -784,34 +245,66 @@ with tabs[1]:  # Add Book
         
         if submitted:
             if title and author:
-                add_book(title, author, genre, year, isbn, description)
-                st.success(f"Book '{title}' has been added successfully!")
-                st.balloons()
+                try:
+                    book_id = add_book(title, author, genre, year, isbn, description)
+                except ValueError as e:
+                    # An invalid ISBN, or one another book already has
+                    st.error(str(e))
+                else:
+                    st.success(f"Book '{title}' has been added successfully!")
+                    st.balloons()
                 
-                # Show success card with enhanced styling
-                cover_color = get_random_cover_color()
-                st.markdown(f"""
-                <div class='book-card fade-in'>
-                    <div class='book-cover' style='background-color: {cover_color};'>
-                        {title}
+                    # Show success card with enhanced styling
+                    color = cover_color(book_id, title)
+                    st.markdown(f"""
+                    <div class='book-card fade-in'>
+                        <div class='book-cover' style='background-color: {color};'>
+                            {title}
+                        </div>
+                        <div class='book-title'>{title}</div>
+                        <div class='book-author'>by {author}</div>
+                        <div class='book-details'><i>📅</i> {year}</div>
+                        <div class='book-details'><i>📚</i> {genre}</div>
+                        <div class='badge badge-{genre.lower().replace(" ", "")}'>{genre}</div>
+                        <p style="font-weight: 600; color: #10B981; margin-top: 12px; font-size: 0.95rem;">✓ Successfully added to your library</p>
                     </div>
-                    <div class='book-title'>{title}</div>
-                    <div class='book-author'>by {author}</div>
-                    <div class='book-details'><i>📅</i> {year}</div>
-                    <div class='book-details'><i>📚</i> {genre}</div>
-                    <div class='badge badge-{genre.lower().replace(" ", "")}'>{genre}</div>
-                    <p style="font-weight: 600; color: #10B981; margin-top: 12px; font-size: 0.95rem;">✓ Successfully added to your library</p>
-                </div>
-                """, unsafe_allow_html=True)
+                    """, unsafe_allow_html=True)
             else:
                 st.error("Title and Author are required fields.")
+    
+    # Bulk import from a file
+    with st.expander("Bulk Import (CSV, JSON Lines, MARC)"):
+        st.caption("CSV and JSON Lines need title, author and year fields; genre, isbn and description are optional. "
+                   "Books whose ISBN is already in the library are skipped.")
+        upload = st.file_uploader("Import file", type=["csv", "jsonl", "ndjson", "json", "mrc", "marc"],
+                                  label_visibility="collapsed", key="import_file")
+        if upload is not None and st.button("Import Books", key="import_button"):
+            progress_bar = st.progress(0.0)
+            progress_text = st.empty()
+            
+            def show_import_progress(stats):
+                progress_bar.progress(stats.fraction_done)
+                progress_text.caption(stats.summary())
+            
+            try:
+                stats = import_books(upload, detect_format(upload.name), f"upload:{upload.name}:{upload.size}",
+                                     total_bytes=upload.size, progress=show_import_progress)
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                if stats.resumed_from:
+                    st.info(f"Resumed an earlier import of this file after record {stats.resumed_from:,}.")
+                st.success(stats.summary())
+                if stats.errors:
+                    st.warning("Some records were rejected:\n\n" + "\n".join(f"- {error}" for error in stats.errors))
 
-with tabs[2]:  # Edit Books
+@st.fragment
+@instrument("render.edit")
+def render_edit():  # Edit Books
     st.markdown("<h2 class='section-header fade-in'>Manage Your Books</h2>", unsafe_allow_html=True)
     
-    books = get_all_books()
-    if not books.empty:
-        # Searchable dropdown
+    if get_stats()["total_books"]:
+        # Type-ahead picker: only the matching titles are fetched and sent
         st.markdown("""
         <div class="filter-container fade-in">
             <div class="filter-title">
@@ -823,34 +316,40 @@ with tabs[2]:  # Edit Books
             </div>
         """, unsafe_allow_html=True)
         
-        book_options = books['title'].tolist()
-        selected_book_title = st.selectbox("Select Book", book_options, label_visibility="collapsed", key="edit_book_select")
+        query = st.text_input("Find a book", placeholder="Start typing a title, an author or a book id...",
+                              label_visibility="collapsed", key="edit_query")
+        matches = find_books(query)
+        labels = {book.id: f"{book.title} — {book.author} ({book.year})" for book in matches}
+        if st.session_state.get("edit_book_select") not in labels:
+            # The previous pick is no longer among the matches; start from the first
+            st.session_state.pop("edit_book_select", None)
+        book_id = st.selectbox("Select Book", list(labels), format_func=labels.get, label_visibility="collapsed",
+                               key="edit_book_select", placeholder="No matching books")
+        if len(matches) == PICKER_LIMIT:
+            st.caption(f"Showing the first {PICKER_LIMIT} matches; keep typing to narrow them down.")
         
         st.markdown("</div>", unsafe_allow_html=True)
         
-        selected_book = books[books['title'] == selected_book_title].iloc[0]
-        book_id = selected_book['id']
+        selected_book = get_book(book_id) if book_id is not None else None
+        if selected_book is None:
+            st.info("No book matches that search.")
+            render_batch_edit()
+            return
+        
+        # Remember the version this session started editing from, so saving
+        # can tell whether someone else changed the book in the meantime
+        editing = st.session_state.setdefault("editing", {})
+        if editing.get("id") != book_id:
+            editing.update(id=book_id, version=selected_book.version)
         
         # Display book details
-        cover_color = get_random_cover_color()
-        st.markdown(f"""
-        <div class='book-card fade-in'>
-            <div class='book-cover' style='background-color: {cover_color};'>
-                {selected_book['title']}
-            </div>
-            <div class='book-title'>{selected_book['title']}</div>
-            <div class='book-author'>by {selected_book['author']}</div>
-            <div class='book-details'><i>📅</i> {selected_book['year']}</div>
-            <div class='book-details'><i>📚</i> {selected_book['genre']}</div>
-            <div class='badge badge-{selected_book["genre"].lower().replace(" ", "")}'>{selected_book['genre']}</div>
-        </div>
-        """, unsafe_allow_html=True)
+        st.markdown(card_html(selected_book, description=False), unsafe_allow_html=True)
         
         # Edit form
         with st.form("edit_book_form"):
             st.markdown("<p style='font-weight: 600; color: var(--primary-color); margin-bottom: 1rem; font-size: 1.1rem;'>Edit Book Details</p>", unsafe_allow_html=True)
-            edit_title = st.text_input("Title", value=selected_book['title'], max_chars=100)
-            edit_author = st.text_input("Author", value=selected_book['author'], max_chars=100)
+            edit_title = st.text_input("Title", value=selected_book.title, max_chars=100)
+            edit_author = st.text_input("Author", value=selected_book.author, max_chars=100)
             edit_genre = st.selectbox("Genre", ["Fiction", "Non-Fiction", "Science Fiction", "Fantasy", 
                                               "Mystery", "Thriller", "Romance", "Biography", 
                                               "History", "Self-Help", "Magical Realism", "Coming-of-age",
@@ -858,23 +357,34 @@ with tabs[2]:  # Edit Books
                                      index=["Fiction", "Non-Fiction", "Science Fiction", "Fantasy", 
                                             "Mystery", "Thriller", "Romance", "Biography", 
                                             "History", "Self-Help", "Magical Realism", "Coming-of-age",
-                                            "Psychological Fiction", "Other"].index(selected_book['genre']) 
-                                            if selected_book['genre'] in ["Fiction", "Non-Fiction", "Science Fiction", "Fantasy", 
+                                            "Psychological Fiction", "Other"].index(selected_book.genre) 
+                                            if selected_book.genre in ["Fiction", "Non-Fiction", "Science Fiction", "Fantasy", 
                                                                         "Mystery", "Thriller", "Romance", "Biography", 
                                                                         "History", "Self-Help", "Magical Realism", "Coming-of-age",
                                                                         "Psychological Fiction", "Other"] else 0)
             edit_year = st.number_input("Publication Year", min_value=1000, max_value=datetime.now().year, 
-                                       value=int(selected_book['year']), step=1)
-            edit_isbn = st.text_input("ISBN", value=selected_book['isbn'] if selected_book['isbn'] else "", max_chars=20)
-            edit_description = st.text_area("Description", value=selected_book['description'] if selected_book['description'] else "", height=150)
+                                       value=int(selected_book.year), step=1)
+            edit_isbn = st.text_input("ISBN", value=selected_book.isbn if selected_book.isbn else "", max_chars=20)
+            edit_description = st.text_area("Description", value=selected_book.description if selected_book.description else "", height=150)
             
             update_button = st.form_submit_button("Update Book")
             
             if update_button:
                 if edit_title and edit_author:
-                    update_book(book_id, edit_title, edit_author, edit_genre, edit_year, 
-                               edit_isbn, edit_description)
-                    st.success(f"Book '{edit_title}' has been updated successfully!")
+                    try:
+                        editing["version"] = update_book(book_id, edit_title, edit_author, edit_genre, edit_year, 
+                                                         edit_isbn, edit_description, expected_version=editing["version"])
+                        forget_card(book_id)
+                        st.success(f"Book '{edit_title}' has been updated successfully!")
+                    except BookNotFoundError as e:
+                        forget_card(book_id)
+                        st.error(f"{e}. Your changes were not saved.")
+                    except ConflictError as e:
+                        # Saving again applies these values over the other edit
+                        editing["version"] = e.current.version
+                        st.error(f"{e}, so your changes were not saved. Check its current details and save again to overwrite them.")
+                    except ValueError as e:
+                        st.error(str(e))
                 else:
                     st.error("Title and Author are required fields.")
         
@@ -891,14 +401,26 @@ with tabs[2]:  # Edit Books
             col1, col2 = st.columns(2)
             with col1:
                 if st.button("Yes, delete it"):
-                    delete_book(book_id)
-                    st.success(f"Book '{selected_book['title']}' has been deleted successfully!")
-                    del st.session_state['show_confirm']
-                    st.rerun()
+                    try:
+                        delete_book(book_id, expected_version=editing["version"])
+                        forget_card(book_id)
+                        st.success(f"Book '{selected_book.title}' has been deleted successfully!")
+                        del st.session_state['show_confirm']
+                        st.rerun()
+                    except BookNotFoundError as e:
+                        forget_card(book_id)
+                        del st.session_state['show_confirm']
+                        st.error(f"{e}.")
+                    except ConflictError as e:
+                        editing["version"] = e.current.version
+                        st.error(f"{e}, so it was not deleted. Check its current details first.")
             with col2:
                 if st.button("Cancel"):
                     del st.session_state['show_confirm']
                     st.rerun()
+        
+        st.markdown("<hr style='margin: 2rem 0;' />", unsafe_allow_html=True)
+        render_batch_edit()
     else:
         st.markdown("""
         <div class='empty-state'>
@@ -908,7 +430,46 @@ with tabs[2]:  # Edit Books
         </div>
         """, unsafe_allow_html=True)
         
-with tabs[3]:  # Search
+def show_search_results(ticket, search_query, fuzzy):
+    if ticket.error is not None:
+        st.error(f"Search failed: {ticket.error}")
+    elif ticket.results is None:
+        st.warning("The search took too long and was stopped. Try a more specific term.")
+    elif ticket.results:
+        st.success(f"Found {len(ticket.results)} {'similar ' if fuzzy else ''}results for '{search_query}'")
+        # Display search results in enhanced cards
+        st.markdown(grid_html(ticket.results), unsafe_allow_html=True)
+        if not fuzzy:
+            render_export("search", search=search_query)
+    else:
+        # Enhanced empty search results
+        st.markdown("""
+        <div class='empty-state'>
+            <div class='empty-state-icon'>🔍</div>
+            <div class='empty-state-text'>No matching books found</div>
+            <p style="font-weight: 500; font-size: 0.95rem; color: var(--text-secondary);">Try a different search term or browse all books.</p>
+        </div>
+        """, unsafe_allow_html=True)
+        if not fuzzy:
+            st.button("Try typo-tolerant matching", key="search_try_fuzzy",
+                      on_click=lambda: st.session_state.update(search_fuzzy=True))
+
+
+@st.fragment(run_every=SEARCH_POLL)
+def poll_search(ticket):
+    # Reruns on its own until the search is done, then redraws the page with
+    # the results
+    if ticket.done:
+        st.rerun()
+    if time.monotonic() - ticket.started > SEARCH_TIMEOUT:
+        ticket.cancel()
+        st.rerun()
+    st.caption("Searching...")
+
+
+@st.fragment
+@instrument("render.search")
+def render_search():  # Search
     st.markdown("<h2 class='section-header fade-in'>Search Your Library</h2>", unsafe_allow_html=True)
     
     # Enhanced search box
@@ -923,47 +484,38 @@ with tabs[3]:  # Search
         </div>
     """, unsafe_allow_html=True)
     
-    search_query = st.text_input("Search", placeholder="Search by title, author, genre, or ISBN...", 
+    search_query = st.text_input("Search", placeholder="Search by title, author, genre, ISBN or description...", 
                                 help="Enter your search term and press Enter", label_visibility="collapsed", key="search_input")
+    fuzzy = st.toggle("Typo-tolerant matching", key="search_fuzzy",
+                      help="Match titles and authors that are spelled a little differently, e.g. \"Tolkein\" or \"Dostoyevsky\"")
     
     st.markdown("</div>", unsafe_allow_html=True)
     
     if search_query:
-        results = search_books(search_query)
+        # Searches run on a background worker. A new query cancels the one it
+        # replaces.
+        ticket = st.session_state.get("search_ticket")
+        search_key = (search_query, fuzzy, catalog_version())
+        if ticket is None or st.session_state.get("search_key") != search_key:
+            if ticket is not None:
+                ticket.cancel()
+            ticket = st.session_state["search_ticket"] = search_worker.submit(search_query, fuzzy=fuzzy)
+            st.session_state["search_key"] = search_key
         
-        if not results.empty:
-            st.success(f"Found {len(results)} results for '{search_query}'")
-            
-            # Display search results in enhanced cards
-            cols = st.columns(3)
-            for i, (_, book) in enumerate(results.iterrows()):
-                with cols[i % 3]:
-                    cover_color = get_random_cover_color()
-                    st.markdown(f"""
-                    <div class='book-card fade-in'>
-                        <div class='book-cover' style='background-color: {cover_color};'>
-                            {book['title']}
-                        </div>
-                        <div class='book-title'>{book['title']}</div>
-                        <div class='book-author'>by {book['author']}</div>
-                        <div class='book-details'><i>📅</i> {book['year']}</div>
-                        <div class='book-details'><i>📚</i> {book['genre']}</div>
-                        <div class='badge badge-{book["genre"].lower().replace(" ", "")}'>{book['genre']}</div>
-                    </div>
-                    """, unsafe_allow_html=True)
-                    
-                    with st.expander("View Description"):
-                        st.write(book['description'])
+        # Most searches finish within the wait and are shown in this run. A
+        # slower one is polled instead of waited on, which leaves the script
+        # free to take (and cancel it for) a newer query.
+        ticket.wait(timeout=SEARCH_WAIT)
+        if ticket.done:
+            show_search_results(ticket, search_query, fuzzy)
         else:
-            # Enhanced empty search results
-            st.markdown("""
-            <div class='empty-state'>
-                <div class='empty-state-icon'>🔍</div>
-                <div class='empty-state-text'>No matching books found</div>
-                <p style="font-weight: 500; font-size: 0.95rem; color: var(--text-secondary);">Try a different search term or browse all books.</p>
-            </div>
-            """, unsafe_allow_html=True)
+            poll_search(ticket)
     else:
+        # The query was cleared; stop whatever was still running for it
+        ticket = st.session_state.pop("search_ticket", None)
+        if ticket is not None:
+            ticket.cancel()
+        st.session_state.pop("search_key", None)
         # Enhanced search tips
         st.markdown("""
         <div style="background-color: var(--card-color); border-radius: 12px; padding: 1.5rem; box-shadow: 0 4px 12px var(--shadow); margin-top: 1.5rem; border: 1px solid var(--border-color);">
@@ -973,48 +525,130 @@ with tabs[3]:  # Search
                 <li>Search by author: "Tolkien"</li>
                 <li>Search by genre: "Fantasy"</li>
                 <li>Search by ISBN: "978-0"</li>
+                <li>Partial words match too: "dysto" finds "Dystopian"</li>
             </ul>
         </div>
         """, unsafe_allow_html=True)
 
-with tabs[4]:  # Statistics
+@st.fragment
+@instrument("render.statistics")
+def render_statistics():  # Statistics
+    # pandas comes in with analytics, only once this tab is opened
+    from analytics import get_dashboard
     st.markdown("<h2 class='section-header fade-in'>Library Statistics</h2>", unsafe_allow_html=True)
     
-    # Get statistics
-    stats = get_stats()
+    # Computed once per catalog version, then served from the query cache
+    dashboard = get_dashboard()
+    additions = dashboard.additions
+    # The last month in which books were added, which need not be this month
+    latest = additions.index[-1].strftime(", %b %Y") if len(additions) else ""
+    growth = f" ({additions['growth_pct'].iloc[-1]:+.1f}%)" if len(additions) > 1 else ""
     
     # Display enhanced stats cards
+    cards = [
+        ("", f"{dashboard.total_books:,}", "Total Books"),
+        ("accent", f"{dashboard.total_authors:,}", "Unique Authors"),
+        ("", f"{len(dashboard.genres):,}", "Genres"),
+        ("accent", f"{additions['added'].iloc[-1] if len(additions) else 0:,}", f"Latest additions{latest}{growth}"),
+    ]
+    for col, (style, number, label) in zip(st.columns(len(cards)), cards):
+        with col:
+            st.markdown(f"""
+            <div class='stats-card {style}'>
+                <div class='stats-number'>{number}</div>
+                <div class='stats-label'>{label}</div>
+            </div>
+            """, unsafe_allow_html=True)
+    
+    if not dashboard.total_books:
+        return
     col1, col2 = st.columns(2)
     with col1:
-        st.markdown(f"""
-        <div class='stats-card'>
-            <div class='stats-number'>{stats['total_books']}</div>
-            <div class='stats-label'>Total Books</div>
-        </div>
-        """, unsafe_allow_html=True)
-    
+        st.markdown("<h3 style='font-weight: 600; color: var(--primary-color); margin: 2rem 0 1rem 0; font-size: 1.25rem;'>Genre Distribution</h3>", unsafe_allow_html=True)
+        st.bar_chart(dashboard.genres.rename("Books"))
     with col2:
-        st.markdown(f"""
-        <div class='stats-card accent'>
-            <div class='stats-number'>{stats['total_authors']}</div>
-            <div class='stats-label'>Unique Authors</div>
-        </div>
-        """, unsafe_allow_html=True)
+        st.markdown("<h3 style='font-weight: 600; color: var(--primary-color); margin: 2rem 0 1rem 0; font-size: 1.25rem;'>Top Authors</h3>", unsafe_allow_html=True)
+        st.bar_chart(dashboard.top_authors.set_index("author")["books"].rename("Books"), horizontal=True)
     
-    # Display genre distribution with better styling
-    st.markdown("<h3 style='font-weight: 600; color: var(--primary-color); margin: 2rem 0 1rem 0; font-size: 1.25rem;'>Genre Distribution</h3>", unsafe_allow_html=True)
-    if stats['genre_data']:
-        # Create a simple bar chart with better styling
-        genre_df = pd.DataFrame(stats['genre_data'], columns=['Genre', 'Count'])
-        st.bar_chart(genre_df.set_index('Genre'))
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("<h3 style='font-weight: 600; color: var(--primary-color); margin: 2rem 0 1rem 0; font-size: 1.25rem;'>Books by Decade</h3>", unsafe_allow_html=True)
+        st.bar_chart(dashboard.decades["books"].rename("Books"))
+    with col2:
+        st.markdown("<h3 style='font-weight: 600; color: var(--primary-color); margin: 2rem 0 1rem 0; font-size: 1.25rem;'>Genres by Decade</h3>", unsafe_allow_html=True)
+        st.bar_chart(dashboard.genre_by_decade)
     
-    # Display year distribution with better styling
     st.markdown("<h3 style='font-weight: 600; color: var(--primary-color); margin: 2rem 0 1rem 0; font-size: 1.25rem;'>Publication Years</h3>", unsafe_allow_html=True)
-    if stats['year_data']:
-        # Create a simple line chart with better styling
-        year_df = pd.DataFrame(stats['year_data'], columns=['Year', 'Count'])
-        year_df['Year'] = year_df['Year'].astype(str)
-        st.line_chart(year_df.set_index('Year'))
+    years = dashboard.years.dropna()
+    st.line_chart(years.rename("Books").set_axis(years.index.astype(str)))
+    
+    st.markdown("<h3 style='font-weight: 600; color: var(--primary-color); margin: 2rem 0 1rem 0; font-size: 1.25rem;'>Catalog Growth</h3>", unsafe_allow_html=True)
+    col1, col2 = st.columns(2)
+    with col1:
+        st.caption("Books in the catalog")
+        st.line_chart(additions["total"].rename("Books"))
+    with col2:
+        st.caption("Books added per month")
+        st.bar_chart(additions["added"].rename("Added"))
+
+@instrument("render.performance")
+def render_performance():  # Performance
+    import pandas as pd
+    st.markdown("<h2 class='section-header fade-in'>Performance</h2>", unsafe_allow_html=True)
+    
+    pool_stats = get_pool().stats()
+    cache_stats = query_cache.stats()
+    writer_stats = get_writer().stats()
+    col1, col2, col3, col4, col5 = st.columns(5)
+    col1.metric("Pool hit rate", f"{pool_stats['hit_rate']:.0%}",
+                help=f"{pool_stats['open']} open and {pool_stats['idle']} idle of {pool_stats['size']}, "
+                     f"{pool_stats['timeouts']} timed out waiting for one")
+    col2.metric("Cache hit rate", f"{cache_stats['hit_rate']:.0%}", help=f"{cache_stats['hits']} hits, {cache_stats['misses']} misses")
+    col3.metric("Cache entries", cache_stats["entries"], help=f"{cache_stats['evictions']} evictions")
+    col4.metric("Cache size", f"{cache_stats['bytes'] / 1024 / 1024:.1f} MB")
+    col5.metric("Writes per commit", f"{writer_stats['writes_per_group']:.1f}",
+                help=f"{writer_stats['writes']} writes in {writer_stats['groups']} commits, "
+                     f"{writer_stats['failed']} failed, {writer_stats['retries']} lock retries")
+    
+    recorder.slow_ms = st.number_input("Slow call threshold (ms)", min_value=1.0, value=float(recorder.slow_ms), step=50.0)
+    
+    st.markdown("<h3 style='font-weight: 600; color: var(--primary-color); margin: 2rem 0 1rem 0; font-size: 1.25rem;'>Calls</h3>", unsafe_allow_html=True)
+    snapshot = recorder.snapshot()
+    if snapshot:
+        st.dataframe(pd.DataFrame(snapshot).round(2), hide_index=True, use_container_width=True)
+    
+    st.markdown("<h3 style='font-weight: 600; color: var(--primary-color); margin: 2rem 0 1rem 0; font-size: 1.25rem;'>Slow Calls</h3>", unsafe_allow_html=True)
+    slow_calls = recorder.slow_log()
+    if slow_calls:
+        st.dataframe(pd.DataFrame(slow_calls), hide_index=True, use_container_width=True)
+    else:
+        st.caption(f"No calls slower than {recorder.slow_ms:g} ms yet.")
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.download_button("Download Prometheus metrics", recorder.to_prometheus(), file_name="library.prom", mime="text/plain")
+    with col2:
+        st.download_button("Download JSON", json.dumps({"calls": snapshot, "slow": slow_calls}, indent=2),
+                           file_name="library-perf.json", mime="application/json")
+    with col3:
+        if st.button("Reset metrics"):
+            recorder.reset()
+            st.rerun()
+
+# Only the selected view runs. Each view is a fragment, so interacting with
+# a widget reruns that view alone rather than the whole page.
+views = {
+    "📚 Browse": render_browse,
+    "➕ Add Book": render_add,
+    "✏️ Edit Books": render_edit,
+    "🔍 Search": render_search,
+    "📊 Statistics": render_statistics,
+}
+if show_admin:
+    views["⚙️ Performance"] = render_performance
+
+view = st.radio("View", list(views), horizontal=True, label_visibility="collapsed", key="view")
+views[view]()
 
 # Enhanced footer
 st.markdown("""
@@ -1022,4 +656,6 @@ st.markdown("""
     <div class='footer-brand'>BookVerse Library System</div>
     <p>Elegantly organize your personal book collection</p>
 </div>
-""", unsafe_allow_html=True)  
\ No newline at end of file
+""", unsafe_allow_html=True)  
+
+script_finished(st.session_state, time.perf_counter() - _script_started)
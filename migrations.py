@@ -0,0 +1,353 @@
+"""Versioned schema migrations.
+
+The schema version is stored in SQLite's ``PRAGMA user_version``. Each
+migration moves the database up one version, and init_db runs any that are
+still pending. Databases created before versioning existed report version
+0; the first migration is written with IF NOT EXISTS throughout, so it
+adopts them without changes.
+
+    python migrations.py          # show the current and latest version
+    python migrations.py up       # apply pending migrations
+"""
+import sys
+import threading
+
+from isbn import isbn13_or_none
+from search import create_search_index, recreate_search_index
+from stats import CUBE_ADD_RANGE, CUBE_TABLE, CUBE_TRIGGER_NAMES, create_stats_tables, cube_triggers
+
+# The ISBN key of migration 1's idx_books_isbn_key, which migration 7
+# replaced with the isbn13 column
+ISBN_KEY_SQL = "REPLACE(REPLACE(UPPER(isbn), '-', ''), ' ', '')"
+
+BACKFILL_BATCH = 5000
+
+MIGRATIONS = []
+_lock = threading.Lock()
+
+
+def migration(version, description):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+
+    return register
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def migrate(conn, target=None, progress=None):
+    """Apply pending migrations up to ``target`` (default: all); return the new version."""
+    target = latest_version() if target is None else target
+    with _lock:
+        version = current_version(conn)
+        for number, description, fn in MIGRATIONS:
+            if version < number <= target:
+                if progress:
+                    progress(f"Migrating to version {number}: {description}")
+                fn(conn, progress)
+                # PRAGMA statements can't take parameters; number is an int
+                conn.execute(f"PRAGMA user_version = {int(number)}")
+                conn.commit()
+                version = number
+    return version
+
+
+def backfill(conn, statements, batch_size=BACKFILL_BATCH, progress=None, label="rows"):
+    """Run ``statements`` over books in id ranges of ``batch_size``, one commit per range.
+
+    Each statement takes two parameters, the exclusive lower and inclusive
+    upper id of the range. Committing per range keeps write locks short so
+    the app stays usable while a large catalog is upgraded.
+    """
+    max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM books").fetchone()[0]
+    for low in range(0, max_id, batch_size):
+        high = min(low + batch_size, max_id)
+        with conn:
+            for statement in statements:
+                conn.execute(statement, (low, high))
+        if progress:
+            progress(f"  {label}: {high:,} / {max_id:,}")
+
+
+@migration(1, "books table, indexes, search index and summary tables")
+def _baseline(conn, progress):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS books (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        author TEXT NOT NULL,
+        genre TEXT,
+        year INTEGER,
+        isbn TEXT,
+        description TEXT,
+        added_date TEXT
+    )
+    ''')
+
+    # Indexes behind the Browse filter and sort orders and ISBN lookups
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_books_genre_title ON books(genre, title)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_books_title ON books(title)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_books_author ON books(author)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_books_year ON books(year)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_books_isbn_key ON books({ISBN_KEY_SQL})")
+    conn.commit()
+
+    # Full-text search index, kept in sync with books by triggers
+    create_search_index(conn)
+
+    # Per-genre/year/author counts for the Statistics tab, kept by triggers
+    create_stats_tables(conn)
+
+
+# Version 2 was a normalization of authors and genres into their own tables
+# with integer keys. It was withdrawn before release and no migration takes
+# its number: every reader filters and sorts on the books.author and
+# books.genre text, and the distinct-author and per-genre counts come from
+# the trigger-maintained summary tables, so nothing would have read the ids.
+
+
+@migration(3, "undo log for batch edits and deletes")
+def _batch_log(conn, progress):
+    # One batch_log row per batch; batch_log_rows holds each affected book as
+    # it was before the batch, as a JSON object of its columns
+    conn.executescript('''
+    CREATE TABLE IF NOT EXISTS batch_log (
+        id INTEGER PRIMARY KEY,
+        action TEXT NOT NULL,
+        changes TEXT,
+        rows INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT NOT NULL,
+        undone_at TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS batch_log_rows (
+        batch_id INTEGER NOT NULL,
+        book_id INTEGER NOT NULL,
+        data TEXT NOT NULL,
+        PRIMARY KEY (batch_id, book_id)
+    ) WITHOUT ROWID;
+    ''')
+
+
+
+@migration(4, "row version column for optimistic concurrency")
+def _row_versions(conn, progress):
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(books)")}
+    if "version" not in columns:
+        conn.execute("ALTER TABLE books ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+    # Every change to a book's fields moves its version on, whoever makes it,
+    # so compare-and-swap updates also notice edits from batches or the API.
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS books_version_update
+    AFTER UPDATE OF title, author, genre, year, isbn, description ON books
+    WHEN new.version = old.version BEGIN
+        UPDATE books SET version = old.version + 1 WHERE id = new.id;
+    END
+    ''')
+
+
+
+@migration(5, "case-insensitive title index for the Edit picker")
+def _title_nocase_index(conn, progress):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_books_title_nocase ON books(title COLLATE NOCASE, id)")
+
+
+@migration(6, "circulation: copies, patrons, loans and holds")
+def _circulation(conn, progress):
+    # A loan stays in loans once returned, so loans is also the returns
+    # history. The open-loan indexes are partial: they only hold loans still
+    # out, so "overdue today" and "a patron's current loans" are seeks on a
+    # small index however long the history grows. Dates are ISO strings,
+    # which sort correctly as text.
+    conn.executescript('''
+    CREATE TABLE IF NOT EXISTS copies (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        book_id INTEGER NOT NULL REFERENCES books(id),
+        status TEXT NOT NULL DEFAULT 'available',  -- available, on_loan, on_hold
+        added_date TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_copies_book_status ON copies(book_id, status);
+
+    CREATE TABLE IF NOT EXISTS patrons (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        email TEXT UNIQUE,
+        joined_date TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS loans (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        copy_id INTEGER NOT NULL REFERENCES copies(id),
+        patron_id INTEGER NOT NULL REFERENCES patrons(id),
+        checkout_date TEXT NOT NULL,
+        due_date TEXT NOT NULL,
+        return_date TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_loans_open_due ON loans(due_date) WHERE return_date IS NULL;
+    CREATE INDEX IF NOT EXISTS idx_loans_open_patron ON loans(patron_id, due_date) WHERE return_date IS NULL;
+    -- A copy can only be out on one loan at a time
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_loans_open_copy ON loans(copy_id) WHERE return_date IS NULL;
+
+    -- Holds queue per title in id order. A hold is waiting until a copy is
+    -- set aside for it (ready), then fulfilled, cancelled or expired.
+    CREATE TABLE IF NOT EXISTS holds (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        book_id INTEGER NOT NULL REFERENCES books(id),
+        patron_id INTEGER NOT NULL REFERENCES patrons(id),
+        placed_date TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'waiting',
+        copy_id INTEGER REFERENCES copies(id),
+        pickup_by TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_holds_waiting ON holds(book_id, id) WHERE status = 'waiting';
+    CREATE INDEX IF NOT EXISTS idx_holds_ready ON holds(pickup_by) WHERE status = 'ready';
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_holds_open_patron ON holds(patron_id, book_id)
+        WHERE status IN ('waiting', 'ready');
+    ''')
+
+
+
+@migration(7, "normalized ISBN-13 column with a unique index")
+def _isbn13(conn, progress):
+    # isbn keeps the text as entered; isbn13 holds it as 13 validated digits
+    # for exact lookups and duplicate checks. A unique index allows any number
+    # of NULLs, which covers books without a (valid) ISBN.
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(books)")}
+    if "isbn13" not in columns:
+        conn.execute("ALTER TABLE books ADD COLUMN isbn13 TEXT")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_books_isbn13 ON books(isbn13)")
+    conn.execute("DROP INDEX IF EXISTS idx_books_isbn_key")
+    conn.commit()
+
+    # Only this connection knows the function, so it is used here and nowhere
+    # else. OR IGNORE: when books share an ISBN, the first one added keeps it.
+    conn.create_function("normalize_isbn", 1, isbn13_or_none, deterministic=True)
+    backfill(conn, [
+        "UPDATE OR IGNORE books SET isbn13 = normalize_isbn(isbn) "
+        "WHERE id > ? AND id <= ? AND isbn13 IS NULL AND isbn IS NOT NULL AND isbn != ''",
+    ], progress=progress, label="ISBNs normalized")
+    if progress:
+        left = conn.execute(
+            "SELECT COUNT(*) FROM books WHERE isbn13 IS NULL AND isbn IS NOT NULL AND isbn != ''").fetchone()[0]
+        if left:
+            progress(f"  {left:,} books have an invalid or duplicate ISBN and are not in idx_books_isbn13")
+
+
+
+@migration(8, "genre/year/month-added summary for the analytics dashboard")
+def _catalog_cube(conn, progress):
+    # Filled in id ranges. Until the backfill is done the triggers only
+    # follow books in ranges already counted; later ranges are counted as
+    # they stand when their turn comes.
+    for name in CUBE_TRIGGER_NAMES:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    conn.executescript(CUBE_TABLE + '''
+    CREATE TABLE IF NOT EXISTS catalog_cube_backfill (done INTEGER NOT NULL);
+    DELETE FROM catalog_cube_backfill;
+    INSERT INTO catalog_cube_backfill (done) VALUES (0);
+    DELETE FROM catalog_cube;
+    ''')
+    for trigger in cube_triggers(backfilling=True):
+        conn.execute(trigger)
+    conn.commit()
+
+    backfill(conn, CUBE_ADD_RANGE + ["UPDATE catalog_cube_backfill SET done = ?2"],
+             progress=progress, label="books counted")
+
+    # Books added since the backfill started have ids past its last range.
+    # Count them and switch to the plain triggers in one transaction.
+    with conn:
+        done = conn.execute("SELECT done FROM catalog_cube_backfill").fetchone()[0]
+        for statement in CUBE_ADD_RANGE:
+            conn.execute(statement, (done, 2 ** 63 - 1))
+        for name in CUBE_TRIGGER_NAMES:
+            conn.execute(f"DROP TRIGGER {name}")
+        for trigger in cube_triggers():
+            conn.execute(trigger)
+        conn.execute("DROP TABLE catalog_cube_backfill")
+
+
+@migration(9, "catalog version row for cross-process cache invalidation")
+def _catalog_version(conn, progress):
+    # Bumped by every change to books, from any connection in any process.
+    # db.catalog_version() reads it, so results the app cached are dropped
+    # when the API, an import or a CLI command changes the catalog.
+    conn.executescript('''
+    CREATE TABLE IF NOT EXISTS catalog_meta (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO catalog_meta (id, version) VALUES (1, 0);
+
+    CREATE TRIGGER IF NOT EXISTS catalog_version_insert AFTER INSERT ON books BEGIN
+        UPDATE catalog_meta SET version = version + 1 WHERE id = 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS catalog_version_delete AFTER DELETE ON books BEGIN
+        UPDATE catalog_meta SET version = version + 1 WHERE id = 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS catalog_version_update AFTER UPDATE ON books BEGIN
+        UPDATE catalog_meta SET version = version + 1 WHERE id = 1;
+    END;
+    ''')
+
+
+@migration(10, "four- and five-character prefix indexes for search")
+def _search_prefixes(conn, progress):
+    # The prefix option can't be changed in place, so the index is rebuilt
+    # from books in one transaction; that takes about 40 s per million books
+    if progress:
+        progress("  rebuilding the search index")
+    recreate_search_index(conn)
+
+
+# Version 11 removed what version 2 had created, and went with it.
+
+
+@migration(12, "book versions after each logged batch, for undo")
+def _batch_log_versions(conn, progress):
+    # undo_batch only restores a book still at the version the batch left
+    # it at, so a later edit isn't overwritten
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(batch_log_rows)")}
+    if "version_after" not in columns:
+        conn.execute("ALTER TABLE batch_log_rows ADD COLUMN version_after INTEGER")
+
+
+@migration(13, "genre + author and genre + year indexes for Browse")
+def _genre_sort_indexes(conn, progress):
+    # A genre filter with the Author or Year sort otherwise sorted every
+    # book in the genre to show one page
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_books_genre_author ON books(genre, author, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_books_genre_year ON books(genre, year, id)")
+    # In a database that has been ANALYZEd, an index without statistics
+    # looks more selective than it is, and the planner would pick one of
+    # these for the Title sort too and sort the genre after all
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+        conn.execute("ANALYZE idx_books_genre_author")
+        conn.execute("ANALYZE idx_books_genre_year")
+
+
+@migration(14, "drop the unused trigram vocabulary table")
+def _drop_trigram_vocab(conn, progress):
+    # An fts5vocab view over books_trigram that fuzzy search no longer reads
+    conn.execute("DROP TABLE IF EXISTS books_trigram_vocab")
+
+
+if __name__ == "__main__":
+    import db
+
+    if sys.argv[1:] not in ([], ["up"]):
+        sys.exit("usage: python migrations.py [up]")
+    with db.get_connection() as conn:
+        if sys.argv[1:] == ["up"]:
+            migrate(conn, progress=print)
+        print(f"Schema version {current_version(conn)} (latest {latest_version()}).")
@@ -0,0 +1,28 @@
+from dataclasses import asdict, dataclass
+
+
+@dataclass(slots=True)
+class Book:
+    """One row of the books table, plus search-only extras."""
+
+    id: int
+    title: str
+    author: str
+    genre: str | None
+    year: int | None
+    isbn: str | None
+    description: str | None
+    added_date: str | None
+    version: int = 1
+    snippet: str = ""
+    similarity: float | None = None
+    rank: float | None = None  # minus the relevance of a full-text match, lower is better
+    branch: str | None = None  # shard the book was read from, for federated queries
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def book_factory(cursor, row):
+    # sqlite3 row factory: columns must be selected in Book field order
+    return Book(*row)
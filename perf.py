@@ -0,0 +1,251 @@
+"""Lightweight instrumentation for the data layer and the UI.
+
+Wrap a function with ``@instrument()`` or a block with ``timed(name)`` to
+record its wall time, rows returned, SQL statements executed and query
+cache hits. Spans nest: a tab's render span includes the database calls made
+inside it. Calls slower than ``LIBRARY_SLOW_MS`` are logged to the
+"library.perf" logger. Every span is also logged at DEBUG level as one JSON
+line. Metrics can be exported in Prometheus text format; set
+``LIBRARY_PROMETHEUS_FILE`` to have them written there periodically.
+"""
+import contextvars
+import json
+import logging
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+logger = logging.getLogger("library.perf")
+
+SLOW_MS = float(os.environ.get("LIBRARY_SLOW_MS", "200"))
+PROMETHEUS_FILE = os.environ.get("LIBRARY_PROMETHEUS_FILE")
+PROMETHEUS_INTERVAL = 15  # seconds between writes of PROMETHEUS_FILE
+SAMPLES = 512  # recent durations kept per name for percentiles
+
+_current = contextvars.ContextVar("perf_span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "parent", "start", "rows", "sql", "cache_hits", "cache_misses")
+
+    def __init__(self, name, parent):
+        self.name = name
+        self.parent = parent
+        self.start = time.perf_counter()
+        self.rows = 0
+        self.sql = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+class Metric:
+    __slots__ = ("calls", "total", "max", "rows", "sql", "cache_hits", "cache_misses", "slow", "samples")
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.sql = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.slow = 0
+        self.samples = deque(maxlen=SAMPLES)
+
+
+class Recorder:
+    def __init__(self, slow_ms=SLOW_MS, history=200):
+        self.slow_ms = slow_ms
+        self._metrics = {}
+        self._slow_log = deque(maxlen=history)
+        self._lock = threading.Lock()
+        self._last_export = 0.0
+
+    def record(self, span, elapsed):
+        slow = elapsed * 1000 >= self.slow_ms
+        with self._lock:
+            metric = self._metrics.get(span.name)
+            if metric is None:
+                metric = self._metrics[span.name] = Metric()
+            metric.calls += 1
+            metric.total += elapsed
+            metric.max = max(metric.max, elapsed)
+            metric.rows += span.rows
+            metric.sql += span.sql
+            metric.cache_hits += span.cache_hits
+            metric.cache_misses += span.cache_misses
+            metric.samples.append(elapsed)
+            if slow:
+                metric.slow += 1
+                self._slow_log.append(self._event(span, elapsed))
+
+        if slow:
+            logger.warning("slow call %s", json.dumps(self._event(span, elapsed)))
+        elif logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps(self._event(span, elapsed)))
+        if PROMETHEUS_FILE and span.parent is None and time.monotonic() - self._last_export > PROMETHEUS_INTERVAL:
+            self._last_export = time.monotonic()
+            self.write_prometheus(PROMETHEUS_FILE)
+
+    @staticmethod
+    def _event(span, elapsed):
+        return {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "name": span.name,
+            "ms": round(elapsed * 1000, 3),
+            "rows": span.rows,
+            "sql": span.sql,
+            "cache_hits": span.cache_hits,
+            "cache_misses": span.cache_misses,
+        }
+
+    def snapshot(self):
+        """Per-name metrics as a list of dicts, slowest total time first."""
+        with self._lock:
+            items = [(name, m, sorted(m.samples)) for name, m in self._metrics.items()]
+        rows = []
+        for name, m, samples in items:
+            q = statistics.quantiles(samples, n=100, method="inclusive") if len(samples) > 1 else samples * 99
+            rows.append({
+                "name": name,
+                "calls": m.calls,
+                "total_ms": m.total * 1000,
+                "mean_ms": m.total / m.calls * 1000,
+                "p50_ms": q[49] * 1000,
+                "p95_ms": q[94] * 1000,
+                "max_ms": m.max * 1000,
+                "rows": m.rows,
+                "sql": m.sql,
+                "cache_hits": m.cache_hits,
+                "cache_misses": m.cache_misses,
+                "slow": m.slow,
+            })
+        return sorted(rows, key=lambda row: row["total_ms"], reverse=True)
+
+    def slow_log(self):
+        with self._lock:
+            return list(reversed(self._slow_log))
+
+    def reset(self):
+        with self._lock:
+            self._metrics.clear()
+            self._slow_log.clear()
+
+    def to_prometheus(self):
+        with self._lock:
+            items = sorted(self._metrics.items())
+        series = [
+            ("library_calls_total", "counter", "Instrumented calls.", lambda m: m.calls),
+            ("library_duration_seconds_sum", "counter", "Total wall time.", lambda m: m.total),
+            ("library_duration_seconds_max", "gauge", "Slowest call.", lambda m: m.max),
+            ("library_rows_total", "counter", "Rows returned.", lambda m: m.rows),
+            ("library_sql_statements_total", "counter", "SQL statements executed.", lambda m: m.sql),
+            ("library_cache_hits_total", "counter", "Query cache hits.", lambda m: m.cache_hits),
+            ("library_cache_misses_total", "counter", "Query cache misses.", lambda m: m.cache_misses),
+            ("library_slow_calls_total", "counter", f"Calls slower than {self.slow_ms:g} ms.", lambda m: m.slow),
+        ]
+        lines = []
+        for metric_name, kind, help_text, value in series:
+            lines.append(f"# HELP {metric_name} {help_text}")
+            lines.append(f"# TYPE {metric_name} {kind}")
+            for name, m in items:
+                lines.append(f'{metric_name}{{name="{name}"}} {value(m):g}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        # Write-then-rename so a scraper never reads a half-written file
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp, path)
+
+
+recorder = Recorder()
+
+
+@contextmanager
+def timed(name):
+    parent = _current.get()
+    span = Span(name, parent)
+    token = _current.set(span)
+    try:
+        yield span
+    finally:
+        elapsed = time.perf_counter() - span.start
+        _current.reset(token)
+        if parent is not None:
+            parent.sql += span.sql
+            parent.cache_hits += span.cache_hits
+            parent.cache_misses += span.cache_misses
+        recorder.record(span, elapsed)
+
+
+def observe(name, seconds):
+    """Record a duration measured some other way, such as across a whole script run."""
+    recorder.record(Span(name, None), seconds)
+
+
+def percentile_summary(samples):
+    """n, mean, p50/p95/p99 and max of a list of durations in seconds, in milliseconds."""
+    samples = sorted(samples)
+    if len(samples) > 1:
+        q = statistics.quantiles(samples, n=100, method="inclusive")
+        p50, p95, p99 = q[49], q[94], q[98]
+    else:
+        p50 = p95 = p99 = samples[0]
+    return {
+        "n": len(samples),
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p50_ms": p50 * 1000,
+        "p95_ms": p95 * 1000,
+        "p99_ms": p99 * 1000,
+        "max_ms": samples[-1] * 1000,
+    }
+
+
+def instrument(name=None):
+    def decorator(fn):
+        span_name = name or f"{fn.__module__}.{fn.__name__}"
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(span_name) as span:
+                result = fn(*args, **kwargs)
+                span.rows = _row_count(result)
+                return result
+
+        return wrapper
+
+    return decorator
+
+
+def _row_count(result):
+    if isinstance(result, tuple):
+        result = result[0]
+    if isinstance(result, dict) or result is None:
+        return 1 if result else 0
+    try:
+        return len(result)
+    except TypeError:
+        # A single record, such as the Book returned by get_book
+        return 1 if hasattr(result, "__slots__") else 0
+
+
+def note_sql(statement):
+    # sqlite3 trace callback; statements run by triggers arrive as comments
+    span = _current.get()
+    if span is not None and not statement.startswith("--"):
+        span.sql += 1
+
+
+def note_cache(hit):
+    span = _current.get()
+    if span is not None:
+        if hit:
+            span.cache_hits += 1
+        else:
+            span.cache_misses += 1
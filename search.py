@@ -0,0 +1,338 @@
+import html
+import itertools
+import re
+import sys
+import unicodedata
+
+# Full-text index over the searchable book columns. It is an external-content
+# table, so the text lives only in `books` and the index stores just the
+# postings; the triggers below keep it in step with every insert, update and
+# delete. Prefix indexes for two to five characters make "tolk*" style
+# queries an index lookup. A longer prefix is answered by merging the
+# posting lists of every term it covers, which costs more the more books
+# those terms are in.
+SEARCH_COLUMNS = ["title", "author", "genre", "isbn", "description"]
+
+# bm25 weights, in SEARCH_COLUMNS order: a hit in the title counts far more
+# than the same word buried in a description.
+COLUMN_WEIGHTS = {"title": 10.0, "author": 5.0, "genre": 2.0, "isbn": 2.0, "description": 1.0}
+
+SCHEMA = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+    title, author, genre, isbn, description,
+    content='books', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2',
+    prefix='2 3 4 5'
+);
+
+CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN
+    INSERT INTO books_fts(rowid, title, author, genre, isbn, description)
+    VALUES (new.id, new.title, new.author, new.genre, new.isbn, new.description);
+END;
+
+CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN
+    INSERT INTO books_fts(books_fts, rowid, title, author, genre, isbn, description)
+    VALUES ('delete', old.id, old.title, old.author, old.genre, old.isbn, old.description);
+END;
+
+CREATE TRIGGER IF NOT EXISTS books_fts_update AFTER UPDATE OF title, author, genre, isbn, description ON books BEGIN
+    INSERT INTO books_fts(books_fts, rowid, title, author, genre, isbn, description)
+    VALUES ('delete', old.id, old.title, old.author, old.genre, old.isbn, old.description);
+    INSERT INTO books_fts(rowid, title, author, genre, isbn, description)
+    VALUES (new.id, new.title, new.author, new.genre, new.isbn, new.description);
+END;
+'''
+
+# Trigram index over titles and authors for typo-tolerant search. Every
+# three-character substring is a term, so "Tolkein" still shares "tol" and
+# "olk" with "Tolkien".
+FUZZY_SCHEMA = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS books_trigram USING fts5(
+    title, author,
+    content='books', content_rowid='id',
+    tokenize='trigram'
+);
+
+CREATE TRIGGER IF NOT EXISTS books_trigram_insert AFTER INSERT ON books BEGIN
+    INSERT INTO books_trigram(rowid, title, author) VALUES (new.id, new.title, new.author);
+END;
+
+CREATE TRIGGER IF NOT EXISTS books_trigram_delete AFTER DELETE ON books BEGIN
+    INSERT INTO books_trigram(books_trigram, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+END;
+
+CREATE TRIGGER IF NOT EXISTS books_trigram_update AFTER UPDATE OF title, author ON books BEGIN
+    INSERT INTO books_trigram(books_trigram, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+    INSERT INTO books_trigram(rowid, title, author) VALUES (new.id, new.title, new.author);
+END;
+'''
+
+# A fuzzy lookup never ranks a plain OR of the query's trigrams, which
+# matches (and would score) most of the catalog for a common trigram.
+# Candidates must instead contain several of the probe trigrams at once:
+# the query asks for books with all of them, then all but one, and so on
+# down to FUZZY_MIN_SHARED, stopping as soon as FUZZY_CANDIDATES books are
+# found. Each step is an OR of AND-ed trigram sets, so FTS5 only visits
+# rows where the posting lists intersect. Books sharing the most trigrams
+# are found first, and only the candidates are scored in Python.
+FUZZY_PROBES = 4  # query trigrams used to find candidates
+FUZZY_MIN_SHARED = 2  # fewest probe trigrams a candidate must contain
+FUZZY_CANDIDATES = 60  # candidates re-scored in Python
+# Postings counted per trigram when picking the rarest ones, so a common
+# trigram costs no more to rule out than a rare one
+FUZZY_RARITY_LIMIT = 200
+MIN_SIMILARITY = 0.3
+
+# Control characters used as highlight markers so the surrounding text can be
+# HTML-escaped before the markers are turned into <mark> tags.
+_OPEN, _CLOSE = "\x02", "\x03"
+
+# Full-text search ranks a bounded set of candidates rather than every
+# match. FTS5's own bm25 ranking has to score every matching row, and it
+# counts each term's documents by walking that term's whole posting list,
+# so a common word cost more the bigger the catalog got. Instead the scan
+# stops after SEARCH_CANDIDATES matches, and only those rows are read and
+# scored, in Python, so a search costs about the same at any catalog size.
+# Matches in CANDIDATE_COLUMNS are collected first and the rest of the
+# index only fills what is left, so a title or author match is never
+# crowded out by books that mention the words in their descriptions. For a
+# word in thousands of titles, the results are the best of the first
+# SEARCH_CANDIDATES of them rather than of every one.
+SEARCH_CANDIDATES = 200
+CANDIDATE_COLUMNS = ["title", "author"]
+PREFIX_INDEX_MAX = 5  # longest prefix in books_fts's prefix indexes
+
+CANDIDATE_SQL = "SELECT rowid FROM books_fts WHERE books_fts MATCH ? LIMIT ?"
+
+# BM25 term-frequency saturation and length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+SNIPPET_WORDS = 16
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+_WINDOW = re.compile(rf"(?:\W*\w+){{1,{SNIPPET_WORDS}}}")
+
+
+def _table_exists(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+
+def create_search_index(conn):
+    """Create the FTS tables and triggers, indexing existing rows if they are new."""
+    fts_exists = _table_exists(conn, "books_fts")
+    trigram_exists = _table_exists(conn, "books_trigram")
+    conn.executescript(SCHEMA + FUZZY_SCHEMA)
+    if not fts_exists:
+        rebuild_search_index(conn)
+    if not trigram_exists:
+        conn.execute("INSERT INTO books_trigram(books_trigram) VALUES ('rebuild')")
+    conn.commit()
+
+
+def recreate_search_index(conn):
+    """Drop books_fts and build it again from books, for a change to its definition."""
+    for trigger in ("insert", "delete", "update"):
+        conn.execute(f"DROP TRIGGER IF EXISTS books_fts_{trigger}")
+    conn.execute("DROP TABLE IF EXISTS books_fts")
+    conn.executescript(SCHEMA)
+    conn.execute("INSERT INTO books_fts(books_fts) VALUES ('rebuild')")
+    conn.execute("INSERT INTO books_fts(books_fts) VALUES ('optimize')")
+
+
+def rebuild_search_index(conn):
+    conn.execute("INSERT INTO books_fts(books_fts) VALUES ('rebuild')")
+    conn.execute("INSERT INTO books_fts(books_fts) VALUES ('optimize')")
+    if _table_exists(conn, "books_trigram"):
+        conn.execute("INSERT INTO books_trigram(books_trigram) VALUES ('rebuild')")
+        conn.execute("INSERT INTO books_trigram(books_trigram) VALUES ('optimize')")
+    conn.commit()
+
+
+def build_match_query(query, prefix=True):
+    """Turn free text into an FTS5 query: every word must match.
+
+    The last word is matched as a prefix, since it may still be being typed,
+    unless the query ends with a space.
+    """
+    tokens = _TOKEN.findall(query)
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in tokens]
+    if prefix and not query[-1].isspace():
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def candidate_queries(query):
+    """The FTS5 queries that find a search's candidates, to run in order until SEARCH_CANDIDATES are found.
+
+    Each query is tried against CANDIDATE_COLUMNS before every column. When
+    the last word is longer than the prefix indexes go, the whole word is
+    tried before the prefix, as it usually finds enough books on its own.
+    """
+    match = build_match_query(query)
+    if match is None:
+        return []
+    matches = [match]
+    if match.endswith("*") and len(_TOKEN.findall(query)[-1]) > PREFIX_INDEX_MAX:
+        matches.insert(0, build_match_query(query, prefix=False))
+    columns = " ".join(CANDIDATE_COLUMNS)
+    return [f"{{{columns}}} : ({match})" for match in matches] + matches
+
+
+def query_terms(query):
+    """The folded words of ``query`` as ``(word, is prefix)``, matching build_match_query."""
+    words = _TOKEN.findall(fold(query))
+    prefix = bool(query) and not query[-1].isspace()
+    return [(word, prefix and i == len(words) - 1) for i, word in enumerate(words)]
+
+
+def _term_patterns(terms):
+    # One regex per term, matching where a word equal to (or starting with) it begins
+    return [re.compile(rf"\b{re.escape(term)}" + (r"\w*" if is_prefix else r"\b")) for term, is_prefix in terms]
+
+
+def rank_matches(books, query, limit):
+    """Score full-text candidates against ``query``; return the best ``limit``, best first.
+
+    The score is BM25's per-column term weighting: each term's frequency in
+    a column saturates (BM25_K1) and is scaled by how long the column is
+    against its average over the candidates (BM25_B), and columns count by
+    COLUMN_WEIGHTS. Every term weighs the same, as the document counts BM25
+    weighs terms by are what costs a scan of each posting list. ``rank`` is
+    set to minus the score, so lower is better as with FTS5's rank.
+    """
+    patterns = _term_patterns(query_terms(query))
+    if not books or not patterns:
+        return []
+    average = {column: max(sum(len(getattr(book, column) or "") for book in books) / len(books), 1.0)
+               for column in SEARCH_COLUMNS}
+    for book in books:
+        score = 0.0
+        for column in SEARCH_COLUMNS:
+            text = getattr(book, column)
+            if not text:
+                continue
+            folded = fold(text)
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * len(text) / average[column])
+            for pattern in patterns:
+                tf = len(pattern.findall(folded))
+                if tf:
+                    score += COLUMN_WEIGHTS[column] * tf * (BM25_K1 + 1) / (tf + norm)
+        book.rank = -score
+    books.sort(key=lambda book: (book.rank, book.id))
+    books = books[:limit]
+    for book in books:
+        book.snippet = highlight(snippet(book.description, patterns))
+    return books
+
+
+def snippet(text, patterns):
+    """About SNIPPET_WORDS words of ``text`` from just before its first match, matches marked.
+
+    Returns "" when no word of ``text`` matches.
+    """
+    if not text:
+        return ""
+    folded = fold(text)
+    if len(folded) == len(text):
+        # Folding kept every character in place, so matches can be found in one pass each
+        spans = sorted(match.span() for pattern in patterns for match in pattern.finditer(folded))
+    else:
+        spans = [word.span() for word in _TOKEN.finditer(text)
+                 if any(pattern.match(fold(word.group())) for pattern in patterns)]
+    if not spans:
+        return ""
+    # Start two words before the first match
+    before = [word.start() for word in _TOKEN.finditer(text, 0, spans[0][0])][-2:]
+    start = before[0] if before else spans[0][0]
+    end = _WINDOW.match(text, start).end()
+    parts = ["…" if _TOKEN.search(text, 0, start) else text[:start]]
+    position = start
+    for span_start, span_end in spans:
+        if span_start >= end:
+            break
+        if span_start < position:
+            continue  # the same word, matched by two terms
+        parts += [text[position:span_start], _OPEN, text[span_start:span_end], _CLOSE]
+        position = span_end
+    parts.append(text[position:end])
+    parts.append("…" if _TOKEN.search(text, end) else text[end:])
+    return "".join(parts)
+
+
+def highlight(snippet):
+    # Only worth showing when the description itself matched
+    if not snippet or _OPEN not in snippet:
+        return ""
+    return html.escape(snippet).replace(_OPEN, "<mark>").replace(_CLOSE, "</mark>")
+
+
+def fold(text):
+    # Lowercase and strip accents, so "Márquez" and "marquez" compare equal
+    if text.isascii():
+        return text.lower()
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def trigrams(text):
+    text = " ".join(text.split())
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def similarity(query_grams, text):
+    """Dice similarity of trigram sets against the whole text or its best word."""
+    folded = fold(text or "")
+    best = 0.0
+    for candidate in [folded] + folded.split():
+        grams = trigrams(candidate)
+        if grams:
+            best = max(best, 2 * len(query_grams & grams) / (len(query_grams) + len(grams)))
+    return best
+
+
+def _posting_count(conn, gram, limit):
+    return conn.execute(
+        "SELECT COUNT(*) FROM (SELECT 1 FROM books_trigram WHERE books_trigram MATCH ? LIMIT ?)",
+        (f'"{gram}"', limit),
+    ).fetchone()[0]
+
+
+def fuzzy_candidates(conn, query):
+    """Return ``(query trigrams, candidate book ids)`` for a fuzzy lookup."""
+    grams = {gram for gram in trigrams(query.lower()) if '"' not in gram}
+    ranked = []
+    for gram in sorted(grams):
+        count = _posting_count(conn, gram, FUZZY_RARITY_LIMIT)
+        # Trigrams no book contains (usually the typo itself) cannot be shared
+        if count:
+            # Trigrams spanning a space depend on word order and spacing,
+            # so ones inside a word are preferred
+            ranked.append((" " in gram, count, gram))
+    probes = [f'"{gram}"' for _, _, gram in sorted(ranked)[:FUZZY_PROBES]]
+    if not probes:
+        return set(), []
+    ids = {}
+    for shared in range(len(probes), min(FUZZY_MIN_SHARED, len(probes)) - 1, -1):
+        match = " OR ".join(f"({' AND '.join(group)})" for group in itertools.combinations(probes, shared))
+        rows = conn.execute(
+            "SELECT rowid FROM books_trigram WHERE books_trigram MATCH ? LIMIT ?",
+            (match, FUZZY_CANDIDATES),
+        ).fetchall()
+        ids.update(dict.fromkeys(row[0] for row in rows))
+        if len(ids) >= FUZZY_CANDIDATES:
+            break
+    return trigrams(fold(query)), list(ids)[:FUZZY_CANDIDATES]
+
+
+if __name__ == "__main__":
+    # python search.py rebuild  -- (re)index an existing library.db
+    import db
+
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("usage: python search.py rebuild")
+    with db.get_connection() as conn:
+        create_search_index(conn)
+        rebuild_search_index(conn)
+    print("Search index rebuilt.")
@@ -0,0 +1,87 @@
+"""Background search execution for the Search view.
+
+Queries run on a shared thread pool instead of the Streamlit script thread.
+The Search view waits briefly for each one and then polls it, so a newer
+query can replace a slow one. A replaced query is dropped if it has not
+started, and stopped with ``sqlite3.Connection.interrupt()`` if it has.
+Each query runs once: results are ranked over a capped candidate set, so
+there is no cheaper first page to publish ahead of them.
+"""
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+
+WORKERS = int(os.environ.get("LIBRARY_SEARCH_WORKERS", "4"))
+
+
+class SearchTicket:
+    def __init__(self, query, limit, fuzzy=False):
+        self.query = query
+        self.limit = limit
+        self.fuzzy = fuzzy
+        self.results = None
+        self.error = None
+        self.cancelled = False
+        self.started = time.monotonic()
+        self._conn = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            if self._conn is not None:
+                self._conn.interrupt()
+        self._done.set()
+
+    def wait(self, timeout=None):
+        self._done.wait(timeout)
+        return self.results
+
+    def _run(self):
+        with db.get_connection() as conn:
+            with self._lock:
+                if self.cancelled:
+                    return None
+                self._conn = conn
+            try:
+                return db.run_search(conn, self.query, self.limit, self.fuzzy)
+            finally:
+                with self._lock:
+                    self._conn = None
+
+
+class SearchWorker:
+    def __init__(self, workers=WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="search")
+
+    def submit(self, query, limit=db.SEARCH_LIMIT, fuzzy=False):
+        """Start a search and return its ticket; cancel the ticket to abandon it."""
+        ticket = SearchTicket(query, limit, fuzzy)
+        self._executor.submit(self._search, ticket)
+        return ticket
+
+    def _search(self, ticket):
+        try:
+            if ticket.cancelled:
+                return
+            ticket.results = ticket._run()
+        except sqlite3.OperationalError as e:
+            if not ticket.cancelled:
+                ticket.error = e
+        except Exception as e:
+            ticket.error = e
+        finally:
+            ticket._done.set()
+
+
+# Shared by every session in the process
+search_worker = SearchWorker()
@@ -0,0 +1,321 @@
+"""Several branch libraries, each in its own database file, queried as one.
+
+    LIBRARY_SHARDS="central=central.db,north=north.db,harbour=harbour.db"
+
+    python shards.py split library.db --branches 4 [--out branches]
+    python shards.py search "tolkien" [--fuzzy]
+    python shards.py stats
+    python shards.py bench library.db "tolkien" [--runs 50]
+
+Every branch database has the full schema and is used on its own exactly
+like library.db (point LIBRARY_DB at it). A Federation holds one connection
+pool and one write queue per branch and answers catalog-wide reads by
+running the same query on every branch at once, on a thread pool with one
+worker per branch; SQLite releases the GIL while a query runs, so the
+branches are searched in parallel. Each branch returns its results already
+ordered, and they are combined with a k-way merge on the sort key:
+
+  search      the top ``limit`` of each branch, merged on rank (or on
+              trigram similarity for fuzzy search); each branch ranks its
+              own candidates, which is close to, not exactly, the ranking
+              one combined index would give
+  browse      keyset pages, merged on (sort key, branch, id); the cursor
+              carries the branch, since ids are only unique per branch
+  stats       counts added up; authors are counted once across branches
+  genres      the sorted union
+
+Books read through a Federation have ``branch`` set to the branch name.
+The JSON API serves the federation in place of the one database when it is
+started with --shards or LIBRARY_SHARDS set (see db.configure_shards).
+"""
+import argparse
+import heapq
+import os
+import sqlite3
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby, islice
+
+import db
+import perf
+from migrations import migrate
+from stats import read_stats
+from writer import WriteQueue
+
+SHARDS = os.environ.get("LIBRARY_SHARDS", "")
+MAX_ID = 2 ** 63 - 1
+
+
+def parse_shards(spec):
+    """``"name=path,name=path"`` -> {name: path}; a bare path is named after its file."""
+    shards = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, path = item.rpartition("=")
+        name = name or os.path.splitext(os.path.basename(path))[0]
+        if name in shards:
+            raise ValueError(f"Branch {name!r} is listed twice")
+        shards[name] = path
+    return shards
+
+
+class Shard:
+    def __init__(self, name, path, pool_size=db.POOL_SIZE, on_commit=None):
+        self.name = name
+        self.path = path
+        self.pool = db.ConnectionPool(path=path, size=pool_size)
+        self.writer = WriteQueue(lambda: self.pool._connect(), on_commit=on_commit)
+
+    def close(self):
+        self.writer.close()
+        self.pool.close()
+
+
+def _sort_value(value):
+    # SQLite sorts NULL before everything else; Python can't compare None
+    return (value is not None, value)
+
+
+class Federation:
+    def __init__(self, shards, pool_size=db.POOL_SIZE, on_commit=None):
+        if not shards:
+            raise ValueError("A federation needs at least one branch")
+        # Branch order is the tie-break between equal sort keys, so keep it stable
+        self.shards = [Shard(name, shards[name], pool_size, on_commit) for name in sorted(shards)]
+        self._index = {shard.name: i for i, shard in enumerate(self.shards)}
+        self._executor = ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix="shard")
+
+    def close(self):
+        self._executor.shutdown()
+        for shard in self.shards:
+            shard.close()
+
+    @property
+    def branches(self):
+        return [shard.name for shard in self.shards]
+
+    def shard(self, name):
+        try:
+            return self.shards[self._index[name]]
+        except KeyError:
+            raise ValueError(f"Unknown branch {name!r}") from None
+
+    def _fan_out(self, fn):
+        """Run ``fn(conn, branch index)`` on every branch in parallel; results in branch order."""
+        def run(i):
+            shard = self.shards[i]
+            with shard.pool.connection() as conn:
+                result = fn(conn, i)
+            if isinstance(result, list):
+                for item in result:
+                    if isinstance(item, db.Book):
+                        item.branch = shard.name
+            return result
+
+        return list(self._executor.map(run, range(len(self.shards))))
+
+    def init(self):
+        """Bring every branch's schema up to date. Branches are not seeded with sample books."""
+        self._fan_out(lambda conn, i: migrate(conn))
+
+    def catalog_version(self):
+        """Every branch's stored catalog version, which triggers bump on each change to its books."""
+        return tuple(self._fan_out(lambda conn, i: conn.execute("SELECT version FROM catalog_meta").fetchone()[0]))
+
+    # Reads
+
+    @perf.instrument("shards.get_book")
+    def get_book(self, branch, id):
+        with self.shard(branch).pool.connection() as conn:
+            book = next(db._books(conn, f"SELECT {', '.join(db.BOOK_COLUMNS)} FROM books WHERE id = ?", (id,)), None)
+        if book is not None:
+            book.branch = branch
+        return book
+
+    @perf.instrument("shards.search_books")
+    def search_books(self, query, limit=db.SEARCH_LIMIT, fuzzy=False):
+        results = self._fan_out(lambda conn, i: db.run_search(conn, query, limit, fuzzy))
+        if fuzzy:
+            key = lambda book: (-book.similarity, book.title)
+        else:
+            key = lambda book: book.rank
+        return list(islice(heapq.merge(*results, key=key), limit))
+
+    @perf.instrument("shards.get_books_page")
+    def get_books_page(self, sort="Title (A-Z)", genre=None, after=None, limit=db.PAGE_SIZE):
+        """One page of books across all branches, and the cursor for the next.
+
+        ``after`` is ``(sort key, branch, id)``. Branches before the cursor's
+        branch resume after the key, the cursor's branch after (key, id), and
+        later branches at the key itself, which is the order the merge uses.
+        """
+        column, descending = db.SORT_ORDERS[sort]
+        at = self._index[self.shard(after[1]).name] if after is not None else None
+
+        def page(conn, i):
+            shard_after = None
+            if after is not None:
+                shard_after = (after[0], after[2] if i == at else 0 if i > at else MAX_ID)
+            sql, params = db.build_book_query(genre, sort, limit + 1, after=shard_after)
+            return list(db._books(conn, sql, params))
+
+        key = lambda book: (_sort_value(getattr(book, column)), self._index[book.branch], book.id)
+        books = list(islice(heapq.merge(*self._fan_out(page), key=key, reverse=descending), limit + 1))
+
+        next_cursor = None
+        if len(books) > limit:
+            books = books[:limit]
+            last = books[-1]
+            next_cursor = (getattr(last, column), last.branch, last.id)
+        return books, next_cursor
+
+    @perf.instrument("shards.get_genres")
+    def get_genres(self):
+        results = self._fan_out(lambda conn, i: [row[0] for row in conn.execute(
+            "SELECT DISTINCT genre FROM books WHERE genre IS NOT NULL ORDER BY genre")])
+        return [genre for genre, _ in groupby(heapq.merge(*results))]
+
+    @perf.instrument("shards.get_stats")
+    def get_stats(self):
+        def branch_stats(conn, i):
+            with db.snapshot(conn):
+                authors = {row[0] for row in conn.execute("SELECT author FROM author_counts")}
+                return read_stats(conn), authors
+
+        results = self._fan_out(branch_stats)
+        genres, years, authors = Counter(), Counter(), set()
+        for stats, branch_authors in results:
+            genres.update(dict(stats["genre_data"]))
+            years.update(dict(stats["year_data"]))
+            authors |= branch_authors
+        return {
+            "total_books": sum(stats["total_books"] for stats, _ in results),
+            "total_authors": len(authors),
+            "genre_data": sorted(genres.items(), key=lambda item: -item[1]),
+            "year_data": sorted(years.items(), key=lambda item: _sort_value(item[0])),
+            "branches": {shard.name: stats["total_books"] for shard, (stats, _) in zip(self.shards, results)},
+        }
+
+    # Writes go to one branch, through that branch's write queue
+
+    def add_book(self, branch, title, author, genre, year, isbn, description):
+        return self.shard(branch).writer.run(db._insert_book, title, author, genre, year, isbn, description)
+
+    def update_book(self, branch, id, title, author, genre, year, isbn, description, expected_version=None):
+        return self.shard(branch).writer.run(db._update_book, id, title, author, genre, year, isbn, description,
+                                             expected_version)
+
+    def delete_book(self, branch, id, expected_version=None):
+        self.shard(branch).writer.run(db._delete_book, id, expected_version)
+
+
+def split_catalog(source, branches, out_dir):
+    """Deal the books of ``source`` out into ``branches`` new branch databases by id.
+
+    Ids are kept, so they stay unique across the branches. Returns {name: path}.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    conn = sqlite3.connect(source)
+    try:
+        migrate(conn)  # so it has every column the branches have
+    finally:
+        conn.close()
+    shards = {}
+    columns = ", ".join(db.BOOK_COLUMNS + ["isbn13"])
+    for i in range(branches):
+        name = f"branch-{i + 1}"
+        path = os.path.join(out_dir, f"{name}.db")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        conn = sqlite3.connect(path)
+        try:
+            migrate(conn)
+            conn.execute("ATTACH DATABASE ? AS source", (source,))
+            # Triggers fill each branch's search index and summary tables
+            conn.execute(f"INSERT INTO books ({columns}) SELECT {columns} FROM source.books WHERE id % ? = ?",
+                         (branches, i))
+            conn.commit()
+            conn.execute("DETACH DATABASE source")
+        finally:
+            conn.close()
+        shards[name] = path
+    return shards
+
+
+def bench(single_path, federation, query, runs=50, fuzzy=False):
+    """Time the same search against one database and across the federation."""
+    single = db.ConnectionPool(path=single_path, size=1)
+    cases = {
+        "single": lambda: _search_single(single, query, fuzzy),
+        f"federated x{len(federation.shards)}": lambda: federation.search_books(query, fuzzy=fuzzy),
+    }
+    results = {}
+    for name, fn in cases.items():
+        fn()  # warm the page cache
+        samples = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            rows = len(fn())
+            samples.append(time.perf_counter() - start)
+        results[name] = {**perf.percentile_summary(samples), "rows": rows}
+    single.close()
+    return results
+
+
+def _search_single(pool, query, fuzzy):
+    with pool.connection() as conn:
+        return db.run_search(conn, query, fuzzy=fuzzy)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query several branch databases as one catalog.")
+    parser.add_argument("--shards", default=SHARDS,
+                        help="branches as name=path,name=path (default: LIBRARY_SHARDS)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser("split", help="split one database into branch databases")
+    command.add_argument("source")
+    command.add_argument("--branches", type=int, default=4)
+    command.add_argument("--out", default="branches")
+    command = commands.add_parser("search")
+    command.add_argument("query")
+    command.add_argument("--fuzzy", action="store_true")
+    command.add_argument("--limit", type=int, default=20)
+    commands.add_parser("stats")
+    command = commands.add_parser("bench", help="compare search latency with a single database")
+    command.add_argument("single", help="the unsplit database")
+    command.add_argument("query")
+    command.add_argument("--fuzzy", action="store_true")
+    command.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    if args.command == "split":
+        shards = split_catalog(args.source, args.branches, args.out)
+        print(f"Split {args.source} into {len(shards)} branches. Use them with:")
+        print(f"LIBRARY_SHARDS={','.join(f'{name}={path}' for name, path in shards.items())}")
+        return
+
+    try:
+        federation = Federation(parse_shards(args.shards))
+    except ValueError as e:
+        sys.exit(f"{e}; set LIBRARY_SHARDS or pass --shards")
+    try:
+        federation.init()
+        if args.command == "search":
+            for book in federation.search_books(args.query, args.limit, args.fuzzy):
+                print(f"{book.branch:<12} {book.id:>8}  {book.title} - {book.author}")
+        elif args.command == "stats":
+            stats = federation.get_stats()
+            for name, count in stats["branches"].items():
+                print(f"{name:<12} {count:>10,} books")
+            print(f"{'total':<12} {stats['total_books']:>10,} books, {stats['total_authors']:,} authors")
+        else:
+            for name, row in bench(args.single, federation, args.query, args.runs, args.fuzzy).items():
+                print(f"{name:<16} p50 {row['p50_ms']:8.2f} ms   p95 {row['p95_ms']:8.2f} ms   {row['rows']} rows")
+    finally:
+        federation.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Cold-start support for the Streamlit app, and a timing report.
+
+main.py reruns top to bottom on every interaction, and the first run of a
+new session pays for everything at its top level at once. The work that
+only needs doing once is kept to once per process: the schema check runs
+through db.ensure_db, pandas is imported only by the views that chart or
+tabulate, and the stylesheet is served as a static file instead of being
+sent inline with every run. Startup durations are recorded for the
+Performance view and the Prometheus export:
+
+    startup.imports       importing the app's modules, first run in a process
+    startup.cold_paint    first complete script run in a process
+    startup.first_paint   first complete script run of each session
+
+"Paint" is measured on the server: the script has finished and every
+element has been sent to the browser.
+
+    python startup.py report [--runs 5] [--output coldstart.json]
+
+starts a fresh interpreter for each run and reports how long importing
+Streamlit, the first run of main.py and a warm rerun took, and whether
+pandas got imported along the way.
+"""
+import argparse
+import functools
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+
+import perf
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+STYLESHEET = os.path.join(APP_DIR, "static", "library.css")
+STYLESHEET_URL = "app/static/library.css"  # where Streamlit serves ./static
+
+_once_lock = threading.Lock()
+_recorded = set()
+
+
+def record_once(name, seconds):
+    # Process-level timings only count the first time they happen
+    with _once_lock:
+        if name in _recorded:
+            return
+        _recorded.add(name)
+    perf.observe(name, seconds)
+
+
+def stylesheet_html(static_serving):
+    """Markup that loads the app stylesheet.
+
+    With static serving on this is a short <link> the browser fetches once
+    and caches; otherwise the stylesheet is inlined, as it used to be.
+    """
+    if static_serving:
+        return f'<link rel="stylesheet" href="{STYLESHEET_URL}">'
+    return f"<style>\n{_stylesheet_text()}</style>"
+
+
+@functools.cache
+def _stylesheet_text():
+    with open(STYLESHEET, encoding="utf-8") as f:
+        return f.read()
+
+
+def script_finished(session_state, seconds):
+    record_once("startup.cold_paint", seconds)
+    if not session_state.get("_first_paint_recorded"):
+        session_state["_first_paint_recorded"] = True
+        perf.observe("startup.first_paint", seconds)
+
+
+# Runs in a fresh interpreter for each measurement
+_PROBE = r'''
+import json, sys, time
+started = time.perf_counter()
+import streamlit
+imported = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+import perf
+
+app = AppTest.from_file(sys.argv[1], default_timeout=120)
+first = time.perf_counter()
+app.run()
+first_done = time.perf_counter()
+pandas_loaded = "pandas" in sys.modules
+app.run()
+rerun_done = time.perf_counter()
+if app.exception:
+    sys.exit(str(app.exception))
+metrics = {row["name"]: row["max_ms"] for row in perf.recorder.snapshot()}
+print(json.dumps({
+    "streamlit_import_ms": (imported - started) * 1000,
+    "app_imports_ms": metrics.get("startup.imports"),
+    "first_run_ms": (first_done - first) * 1000,
+    "rerun_ms": (rerun_done - first_done) * 1000,
+    "pandas_loaded": pandas_loaded,
+}))
+'''
+
+
+def _probe(db_path):
+    env = {**os.environ, "LIBRARY_DB": db_path, "PYTHONPATH": APP_DIR}
+    out = subprocess.run([sys.executable, "-c", _PROBE, os.path.join(APP_DIR, "main.py")],
+                         cwd=APP_DIR, env=env, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr.strip() or out.stdout.strip())
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def report(runs=5, db_path=None):
+    """Measure cold starts of main.py against a scratch copy of the database."""
+    source = db_path or os.environ.get("LIBRARY_DB", os.path.join(APP_DIR, "library.db"))
+    with tempfile.TemporaryDirectory() as scratch:
+        path = os.path.join(scratch, "library.db")
+        if os.path.exists(source):
+            shutil.copyfile(source, path)
+        _probe(path)  # applies any pending migrations, so they aren't timed
+        samples = [_probe(path) for _ in range(runs)]
+
+    summary = {}
+    for key in ("streamlit_import_ms", "app_imports_ms", "first_run_ms", "rerun_ms"):
+        values = [sample[key] for sample in samples if sample[key] is not None]
+        if values:
+            summary[key] = {"p50": statistics.median(values), "max": max(values)}
+    summary["pandas_loaded"] = any(sample["pandas_loaded"] for sample in samples)
+    return {"runs": runs, "summary": summary, "samples": samples}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report cold-start timings for the Streamlit app.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser("report")
+    command.add_argument("--runs", type=int, default=5, help="fresh interpreters to measure")
+    command.add_argument("--db", help="database to copy for the runs (default: LIBRARY_DB or library.db)")
+    command.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    result = report(args.runs, args.db)
+    for key, row in result["summary"].items():
+        if key == "pandas_loaded":
+            print(f"{'pandas imported on first run':<28} {'yes' if row else 'no'}")
+        else:
+            print(f"{key:<28} p50 {row['p50']:8.1f} ms   max {row['max']:8.1f} ms")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import sys
+
+# Summary tables behind the Statistics tab. Triggers on books keep one row
+# per genre, year and author with its current book count, so the tab reads
+# O(#groups) rows instead of aggregating the whole catalog. Groups whose
+# count drops to zero are removed, which makes COUNT(*) on author_counts the
+# number of distinct authors.
+SUMMARIES = {
+    "genre_counts": ("genre", "TEXT"),
+    "year_counts": ("year", "INTEGER"),
+    "author_counts": ("author", "TEXT"),
+}
+
+
+def _schema():
+    statements = []
+    for table, (column, type_) in SUMMARIES.items():
+        # `IS` rather than `=` so a NULL genre or year is a group of its own,
+        # just like GROUP BY treats it.
+        add = f'''
+            UPDATE {table} SET count = count + 1 WHERE {column} IS new.{column};
+            INSERT INTO {table} ({column}, count)
+            SELECT new.{column}, 1 WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE {column} IS new.{column});'''
+        remove = f'''
+            UPDATE {table} SET count = count - 1 WHERE {column} IS old.{column};
+            DELETE FROM {table} WHERE {column} IS old.{column} AND count <= 0;'''
+        statements.append(f'''
+        CREATE TABLE IF NOT EXISTS {table} ({column} {type_}, count INTEGER NOT NULL);
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_{column} ON {table}({column});
+
+        CREATE TRIGGER IF NOT EXISTS {table}_insert AFTER INSERT ON books BEGIN{add}
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS {table}_delete AFTER DELETE ON books BEGIN{remove}
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS {table}_update AFTER UPDATE OF {column} ON books
+        WHEN old.{column} IS NOT new.{column} BEGIN{remove}{add}
+        END;
+        ''')
+    return "".join(statements)
+
+
+SCHEMA = _schema()
+
+# Book counts per (genre, year, month added) for the analytics dashboard,
+# kept by triggers like the tables above. Every chart on the dashboard is an
+# aggregate of it, so the dashboard reads O(#cells) rows too.
+CUBE_COLUMNS = {"genre": "{row}.genre", "year": "{row}.year", "month": "substr({row}.added_date, 1, 7)"}
+CUBE_SELECT = "SELECT genre, year, substr(added_date, 1, 7), COUNT(*) FROM books GROUP BY 1, 2, 3"
+
+
+CUBE_TABLE = '''
+    CREATE TABLE IF NOT EXISTS catalog_cube (genre TEXT, year INTEGER, month TEXT, count INTEGER NOT NULL);
+    CREATE INDEX IF NOT EXISTS idx_catalog_cube ON catalog_cube(genre, year, month);
+'''
+CUBE_TRIGGER_NAMES = ["catalog_cube_insert", "catalog_cube_delete", "catalog_cube_update"]
+
+
+def cube_triggers(backfilling=False):
+    """The CREATE TRIGGER statements that keep catalog_cube in step with books.
+
+    While migration 8 is filling the cube they only follow books the
+    backfill has already counted, up to catalog_cube_backfill.done.
+    """
+    def match(row):
+        return " AND ".join(f"{name} IS {expr.format(row=row)}" for name, expr in CUBE_COLUMNS.items())
+
+    def counted(row):
+        return f"{row}.id <= (SELECT done FROM catalog_cube_backfill)" if backfilling else ""
+
+    def when(*conditions):
+        conditions = [condition for condition in conditions if condition]
+        return f" WHEN {' AND '.join(conditions)}" if conditions else ""
+
+    values = ", ".join(expr.format(row="new") for expr in CUBE_COLUMNS.values())
+    add = f'''
+            UPDATE catalog_cube SET count = count + 1 WHERE {match("new")};
+            INSERT INTO catalog_cube (genre, year, month, count)
+            SELECT {values}, 1 WHERE NOT EXISTS (SELECT 1 FROM catalog_cube WHERE {match("new")});'''
+    remove = f'''
+            UPDATE catalog_cube SET count = count - 1 WHERE {match("old")};
+            DELETE FROM catalog_cube WHERE {match("old")} AND count <= 0;'''
+    changed = "old.genre IS NOT new.genre OR old.year IS NOT new.year OR old.added_date IS NOT new.added_date"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS catalog_cube_insert AFTER INSERT ON books{when(counted('new'))} BEGIN{add}\n    END",
+        f"CREATE TRIGGER IF NOT EXISTS catalog_cube_delete AFTER DELETE ON books{when(counted('old'))} BEGIN{remove}\n    END",
+        f"CREATE TRIGGER IF NOT EXISTS catalog_cube_update AFTER UPDATE OF genre, year, added_date ON books"
+        f"{when(f'({changed})', counted('old'))} BEGIN{remove}{add}\n    END",
+    ]
+
+
+# Add the books with ids in (?, ?] to the cube: bump the cells it already
+# has, then add the rest
+_CUBE_RANGE = ("SELECT genre, year, substr(added_date, 1, 7) AS month, COUNT(*) AS count FROM books "
+               "WHERE id > ? AND id <= ? GROUP BY 1, 2, 3")
+_CUBE_MATCH = "catalog_cube.genre IS b.genre AND catalog_cube.year IS b.year AND catalog_cube.month IS b.month"
+CUBE_ADD_RANGE = [
+    f"UPDATE catalog_cube SET count = catalog_cube.count + b.count FROM ({_CUBE_RANGE}) AS b WHERE {_CUBE_MATCH}",
+    f"INSERT INTO catalog_cube (genre, year, month, count) SELECT * FROM ({_CUBE_RANGE}) AS b "
+    f"WHERE NOT EXISTS (SELECT 1 FROM catalog_cube WHERE {_CUBE_MATCH})",
+]
+
+
+def create_stats_tables(conn):
+    """Create the summary tables and triggers, filling them if they are new."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'genre_counts'"
+    ).fetchone()
+    conn.executescript(SCHEMA)
+    if not exists:
+        rebuild_stats(conn)
+
+
+def rebuild_stats(conn):
+    with conn:
+        for table, (column, _) in SUMMARIES.items():
+            conn.execute(f"DELETE FROM {table}")
+            conn.execute(f"INSERT INTO {table} ({column}, count) SELECT {column}, COUNT(*) FROM books GROUP BY {column}")
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'catalog_cube'").fetchone():
+        rebuild_cube(conn)
+
+
+def rebuild_cube(conn):
+    with conn:
+        conn.execute("DELETE FROM catalog_cube")
+        conn.execute(f"INSERT INTO catalog_cube (genre, year, month, count) {CUBE_SELECT}")
+
+
+def check_stats(conn):
+    """Compare the summary tables with a fresh aggregate; return the differences."""
+    problems = []
+    for table, (column, _) in SUMMARIES.items():
+        stored = dict(conn.execute(f"SELECT {column}, count FROM {table}").fetchall())
+        actual = dict(conn.execute(f"SELECT {column}, COUNT(*) FROM books GROUP BY {column}").fetchall())
+        for key in stored.keys() | actual.keys():
+            if stored.get(key) != actual.get(key):
+                problems.append(f"{table}: {key!r} has {stored.get(key, 0)}, expected {actual.get(key, 0)}")
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'catalog_cube'").fetchone():
+        stored = {row[:3]: row[3] for row in conn.execute("SELECT genre, year, month, count FROM catalog_cube")}
+        actual = {row[:3]: row[3] for row in conn.execute(CUBE_SELECT)}
+        for key in stored.keys() | actual.keys():
+            if stored.get(key) != actual.get(key):
+                problems.append(f"catalog_cube: {key!r} has {stored.get(key, 0)}, expected {actual.get(key, 0)}")
+    return problems
+
+
+def read_stats(conn):
+    c = conn.cursor()
+    total_books = c.execute("SELECT COALESCE(SUM(count), 0) FROM genre_counts").fetchone()[0]
+    total_authors = c.execute("SELECT COUNT(*) FROM author_counts").fetchone()[0]
+    genre_data = c.execute("SELECT genre, count FROM genre_counts ORDER BY count DESC").fetchall()
+    year_data = c.execute("SELECT year, count FROM year_counts ORDER BY year").fetchall()
+    return {
+        "total_books": total_books,
+        "total_authors": total_authors,
+        "genre_data": genre_data,
+        "year_data": year_data
+    }
+
+
+if __name__ == "__main__":
+    # python stats.py check|rebuild
+    import db
+
+    if sys.argv[1:] not in (["check"], ["rebuild"]):
+        sys.exit("usage: python stats.py check|rebuild")
+    db.init_db()
+    with db.get_connection() as conn:
+        if sys.argv[1] == "rebuild":
+            rebuild_stats(conn)
+            print("Statistics rebuilt.")
+        else:
+            problems = check_stats(conn)
+            for problem in problems:
+                print(problem)
+            print("Statistics are consistent." if not problems else f"{len(problems)} inconsistencies found.")
+            sys.exit(1 if problems else 0)
@@ -0,0 +1,32 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+
+class RetryingWriter:
+    """Runs each write twice and rolls the first attempt back, as WriteQueue does when the lock is busy."""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, isolation_level=None)
+
+    def run(self, fn, *args, notify=True):
+        for attempt in range(2):
+            self.conn.execute("BEGIN IMMEDIATE")
+            result = fn(self.conn, *args)
+            self.conn.execute("ROLLBACK" if attempt == 0 else "COMMIT")
+        return result
+
+
+@pytest.fixture
+def retrying_writer(monkeypatch):
+    """Send db.get_writer() writes through a RetryingWriter on the current pool's database."""
+    writer = RetryingWriter(db.get_pool().path)
+    monkeypatch.setattr(db, "get_writer", lambda: writer)
+    yield writer
+    writer.conn.close()
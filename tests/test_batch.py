@@ -0,0 +1,63 @@
+"""Batch edits and their undo."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+from batch import batch_delete, batch_update, undo_batch  # noqa: E402
+
+
+@pytest.fixture
+def books(tmp_path):
+    db.configure_pool(path=str(tmp_path / "catalog.db"))
+    db.init_db()
+    yield [db.add_book(f"Book {i}", "Author", "Fiction", 2000 + i, "", "") for i in range(4)]
+    db.configure_pool(path=db.DB_PATH)
+
+
+def test_retried_undo_is_counted_once(books, retrying_writer):
+    batch_id = batch_update(books, {"genre": "History"}).batch_id
+    result = undo_batch(batch_id)
+    assert (result.changed, result.skipped) == (len(books), [])
+    assert {book.genre for book in db.get_books(books)} == {"Fiction"}
+
+
+def test_undo_update_restores_the_changed_fields(books):
+    batch_id = batch_update(books, {"genre": "History"}).batch_id
+    result = undo_batch(batch_id)
+    assert (result.matched, result.changed, result.skipped) == (len(books), len(books), [])
+    assert [book.genre for book in db.get_books(books)] == ["Fiction"] * len(books)
+
+
+def test_undo_skips_books_edited_since(books):
+    batch_id = batch_update(books, {"genre": "History"}).batch_id
+    edited = db.get_book(books[0])
+    db.update_book(edited.id, edited.title, edited.author, "Poetry", edited.year, edited.isbn, edited.description)
+    result = undo_batch(batch_id)
+    assert (result.changed, result.skipped) == (len(books) - 1, [books[0]])
+    assert [book.genre for book in db.get_books(books)] == ["Poetry"] + ["Fiction"] * (len(books) - 1)
+
+
+def test_undo_delete_brings_the_books_back(books):
+    batch_id = batch_delete(books[:2]).batch_id
+    assert db.get_books(books)[0].id == books[2]
+    assert undo_batch(batch_id).changed == 2
+    assert [book.title for book in db.get_books(books)] == [f"Book {i}" for i in range(4)]
+
+
+def test_dry_run_is_not_undoable(books):
+    result = batch_update(books, {"genre": "History"}, dry_run=True)
+    assert result.batch_id is None
+    assert {book.genre for book in db.get_books(books)} == {"Fiction"}
+
+
+def test_a_batch_is_undone_once(books):
+    batch_id = batch_update(books, {"genre": "History"}).batch_id
+    undo_batch(batch_id)
+    with pytest.raises(ValueError):
+        undo_batch(batch_id)
+    with pytest.raises(ValueError):
+        undo_batch(batch_id + 1)
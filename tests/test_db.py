@@ -0,0 +1,91 @@
+"""Single-book writes: duplicate ISBNs and version conflicts."""
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+import importer  # noqa: E402
+from isbn import InvalidISBN  # noqa: E402
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    db.configure_pool(path=str(tmp_path / "catalog.db"))
+    db.init_db()
+    yield
+    db.configure_pool(path=db.DB_PATH)
+
+
+@pytest.fixture
+def dune(catalog):
+    return db.add_book("Dune", "Frank Herbert", "Science Fiction", 1965, "0-306-40615-2", "")
+
+
+def test_isbn_is_stored_normalized(dune):
+    assert db.get_book_by_isbn("ISBN 978 0 306 40615 7").id == dune
+    with db.get_connection() as conn:
+        assert conn.execute("SELECT isbn, isbn13 FROM books WHERE id = ?", (dune,)).fetchone() == (
+            "0-306-40615-2", "9780306406157")
+
+
+@pytest.mark.parametrize("isbn", ["0306406152", "978-0-306-40615-7"])
+def test_duplicate_isbn_is_refused(dune, isbn):
+    with pytest.raises(db.DuplicateISBNError) as caught:
+        db.add_book("Dune again", "Frank Herbert", "Science Fiction", 1965, isbn, "")
+    assert caught.value.book_id == dune
+
+
+def test_update_cannot_take_another_books_isbn(dune):
+    emma = db.add_book("Emma", "Jane Austen", "Fiction", 1815, "", "")
+    with pytest.raises(db.DuplicateISBNError):
+        db.update_book(emma, "Emma", "Jane Austen", "Fiction", 1815, "9780306406157", "")
+    # Rewriting a book's own ISBN in another form is not a duplicate
+    db.update_book(dune, "Dune", "Frank Herbert", "Science Fiction", 1965, "978-0-306-40615-7", "")
+
+
+def test_invalid_isbn_is_refused(catalog):
+    with pytest.raises(InvalidISBN):
+        db.add_book("Dune", "Frank Herbert", "Science Fiction", 1965, "0-306-40615-3", "")
+
+
+def test_import_skips_isbns_already_in_the_catalog(dune):
+    data = b"title,author,year,isbn\nDune,Frank Herbert,1965,9780306406157\nEmma,Jane Austen,1815,\n"
+    stats = importer.import_books(io.BytesIO(data), "csv", "books.csv")
+    assert (stats.inserted, stats.duplicates) == (1, 1)
+
+
+def test_update_with_the_current_version(dune):
+    version = db.get_book(dune).version
+    assert db.update_book(dune, "Dune", "Frank Herbert", "Classics", 1965, "0-306-40615-2", "",
+                          expected_version=version) > version
+    assert db.get_book(dune).genre == "Classics"
+
+
+def test_stale_update_is_a_conflict(dune):
+    version = db.get_book(dune).version
+    db.update_book(dune, "Dune", "Frank Herbert", "Classics", 1965, "0-306-40615-2", "")
+    with pytest.raises(db.ConflictError) as caught:
+        db.update_book(dune, "Dune", "Frank Herbert", "Fantasy", 1965, "0-306-40615-2", "",
+                       expected_version=version)
+    assert caught.value.current.genre == "Classics"
+    assert db.get_book(dune).genre == "Classics"
+
+
+def test_stale_delete_is_a_conflict(dune):
+    version = db.get_book(dune).version
+    db.update_book(dune, "Dune", "Frank Herbert", "Classics", 1965, "0-306-40615-2", "")
+    with pytest.raises(db.ConflictError):
+        db.delete_book(dune, expected_version=version)
+    assert db.get_book(dune) is not None
+
+
+def test_missing_book_is_not_a_conflict(dune):
+    db.delete_book(dune)
+    with pytest.raises(db.BookNotFoundError):
+        db.update_book(dune, "Dune", "Frank Herbert", "Classics", 1965, "", "", expected_version=1)
+    with pytest.raises(db.BookNotFoundError):
+        db.delete_book(dune, expected_version=1)
@@ -0,0 +1,46 @@
+"""Importing books: counts, duplicate ISBNs and rejected records."""
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+import importer  # noqa: E402
+
+ROWS = [
+    ("Dune", "Frank Herbert", "0-306-40615-2"),
+    ("Dune again", "Frank Herbert", "978-0-306-40615-7"),  # the same book as ISBN-13
+    ("Emma", "Jane Austen", ""),
+    ("Bad check digit", "Nobody", "0-306-40615-3"),
+    ("Persuasion", "Jane Austen", "9780141439686"),
+]
+
+
+def csv_bytes(rows):
+    lines = ["title,author,year,isbn"] + [f"{title},{author},1990,{isbn}" for title, author, isbn in rows]
+    return "\n".join(lines).encode()
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    db.configure_pool(path=str(tmp_path / "catalog.db"))
+    db.init_db()
+    yield
+    db.configure_pool(path=db.DB_PATH)
+
+
+def test_counts_and_rejections(catalog):
+    stats = importer.import_books(io.BytesIO(csv_bytes(ROWS)), "csv", "books.csv")
+    assert (stats.read, stats.inserted, stats.duplicates, stats.rejected) == (5, 3, 1, 1)
+    assert stats.errors[0].startswith("record 4:")
+
+
+def test_retried_batches_are_counted_once(catalog, retrying_writer):
+    stats = importer.import_books(io.BytesIO(csv_bytes(ROWS)), "csv", "books.csv", batch_size=2)
+    assert (stats.inserted, stats.duplicates, stats.rejected) == (3, 1, 1)
+    with db.get_connection() as conn:
+        titles = [row[0] for row in conn.execute("SELECT title FROM books WHERE title IN ('Dune', 'Emma', 'Persuasion')")]
+    assert sorted(titles) == ["Dune", "Emma", "Persuasion"]
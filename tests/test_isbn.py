@@ -0,0 +1,49 @@
+"""ISBN-10/13 validation and normalization to 13 bare digits."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from isbn import InvalidISBN, isbn13_or_none, to_isbn13  # noqa: E402
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("9780306406157", "9780306406157"),
+    ("978-0-306-40615-7", "9780306406157"),
+    ("978 0 306 40615 7", "9780306406157"),
+    ("ISBN-13: 978-0-306-40615-7", "9780306406157"),
+    ("isbn 0-306-40615-2", "9780306406157"),  # ISBN-10, converted with a new check digit
+    ("0306406152", "9780306406157"),
+    ("080442957X", "9780804429573"),  # ISBN-10 whose check digit is X
+    ("0-8044-2957-x", "9780804429573"),
+    ("979-10-90636-07-1", "9791090636071"),
+    ("978030640615790000", "9780306406157"),  # scanned with a 5-digit add-on
+    ("97803064061575", None),  # 14 digits is not a barcode with an add-on
+])
+def test_valid_isbns_become_13_digits(text, expected):
+    if expected is None:
+        with pytest.raises(InvalidISBN):
+            to_isbn13(text)
+    else:
+        assert to_isbn13(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "978-0-306-40615-8",  # wrong ISBN-13 check digit
+    "0-306-40615-3",  # wrong ISBN-10 check digit
+    "0804429573",  # X written as a digit
+    "1234567890128",  # an EAN-13 that isn't an ISBN
+    "030640615",
+    "ISBN 978-0-306-4O615-7",  # letter O for a zero
+])
+def test_invalid_isbns_are_rejected(text):
+    with pytest.raises(InvalidISBN):
+        to_isbn13(text)
+    assert isbn13_or_none(text) is None
+
+
+@pytest.mark.parametrize("text", [None, "", "   ", "ISBN:"])
+def test_blank_is_no_isbn(text):
+    assert to_isbn13(text) is None
@@ -0,0 +1,108 @@
+"""Keyset paging over a sort column with NULLs (books without a year)."""
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+from migrations import migrate  # noqa: E402
+from shards import Federation  # noqa: E402
+
+YEARS = [None, 1990, None, 2001, 1990, None, 1850, 2001, None, 1975, None]
+
+
+def make_catalog(path, years):
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    conn.executemany(
+        "INSERT INTO books (title, author, genre, year, isbn, description, added_date) VALUES (?, ?, ?, ?, '', '', '')",
+        [(f"Book {i}", f"Author {i % 3}", "Fiction" if i % 2 else "History", year) for i, year in enumerate(years)],
+    )
+    conn.commit()
+    conn.close()
+
+
+def expected_order(books, sort):
+    column, descending = db.SORT_ORDERS[sort]
+    # SQLite puts NULL before every other value
+    key = lambda book: ((getattr(book, column) is not None, getattr(book, column)), book.id)
+    return [book.id for book in sorted(books, key=key, reverse=descending)]
+
+
+def walk(get_page, sort, genre=None, limit=2):
+    ids, cursor = [], None
+    while True:
+        books, cursor = get_page(sort, genre, after=cursor, limit=limit)
+        ids.extend(book.id for book in books)
+        if cursor is None:
+            return ids
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    path = str(tmp_path / "catalog.db")
+    make_catalog(path, YEARS)
+    db.configure_pool(path=path)
+    yield path
+    db.configure_pool(path=db.DB_PATH)
+
+
+@pytest.mark.parametrize("sort", list(db.SORT_ORDERS))
+@pytest.mark.parametrize("genre", [None, "Fiction"])
+@pytest.mark.parametrize("limit", [1, 2, 3, 20])
+def test_pages_cover_every_book_once(catalog, sort, genre, limit):
+    everything = db.list_books(genre, sort)
+    assert [book.id for book in everything] == expected_order(everything, sort)
+    assert walk(db.get_books_page, sort, genre, limit) == [book.id for book in everything]
+
+
+@pytest.mark.parametrize("sort", ["Year (Newest)", "Year (Oldest)"])
+def test_cursor_on_a_null_year(catalog, sort):
+    everything = [book.id for book in db.list_books(sort=sort)]
+    for i, book_id in enumerate(everything):
+        book = db.get_book(book_id)
+        if book.year is None:
+            books, _ = db.get_books_page(sort, after=(None, book.id), limit=len(everything))
+            assert [b.id for b in books] == everything[i + 1:]
+
+
+@pytest.mark.parametrize("sort", list(db.SORT_ORDERS))
+def test_federation_pages_with_null_years(tmp_path, sort):
+    shards = {}
+    for name, years in [("east", YEARS), ("west", YEARS[::-1])]:
+        shards[name] = str(tmp_path / f"{name}.db")
+        make_catalog(shards[name], years)
+    federation = Federation(shards)
+    try:
+        column, descending = db.SORT_ORDERS[sort]
+        ids, cursor = [], None
+        while True:
+            books, cursor = federation.get_books_page(sort, after=cursor, limit=3)
+            ids.extend((book.branch, book.id) for book in books)
+            if cursor is None:
+                break
+        everything = []
+        for name in sorted(shards):
+            db.configure_pool(path=shards[name])
+            for book in db.list_books():
+                book.branch = name
+                everything.append(book)
+        db.configure_pool(path=db.DB_PATH)
+        key = lambda book: ((getattr(book, column) is not None, getattr(book, column)),
+                            sorted(shards).index(book.branch), book.id)
+        assert ids == [(book.branch, book.id) for book in sorted(everything, key=key, reverse=descending)]
+    finally:
+        federation.close()
+
+
+@pytest.mark.parametrize("sort", list(db.SORT_ORDERS))
+@pytest.mark.parametrize("genre", [None, "Fiction"])
+def test_first_page_walks_an_index(catalog, sort, genre):
+    # Sorting the whole genre to show one page costs as much as the genre is big
+    sql, params = db.build_book_query(genre, sort, db.PAGE_SIZE + 1)
+    with db.get_connection() as conn:
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+    assert not any("TEMP B-TREE" in step for step in plan), plan
@@ -0,0 +1,48 @@
+"""Full-text search candidates: title and author matches are never crowded out."""
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+from migrations import migrate  # noqa: E402
+from search import SEARCH_CANDIDATES  # noqa: E402
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    path = str(tmp_path / "catalog.db")
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    # Many earlier books mention the word only in their description
+    conn.executemany(
+        "INSERT INTO books (title, author, genre, year, isbn, description, added_date) VALUES (?, ?, ?, ?, '', ?, '')",
+        [(f"Book {i}", "Someone", "Fantasy", 2000, "a dragon appears") for i in range(SEARCH_CANDIDATES * 5)],
+    )
+    conn.executemany(
+        "INSERT INTO books (title, author, genre, year, isbn, description, added_date) VALUES (?, ?, ?, ?, '', '', '')",
+        [("Dragon", "Ann Author", "Fantasy", 2001), ("The Keep", "Ben Dragonetti", "Fantasy", 1990)],
+    )
+    conn.commit()
+    conn.close()
+    db.configure_pool(path=path)
+    yield path
+    db.configure_pool(path=db.DB_PATH)
+
+
+@pytest.mark.parametrize("query", ["dragon", "dragon ", "drag", "Dragon ann"])
+def test_title_and_author_matches_rank_first(catalog, query):
+    books = db.search_books(query, limit=100)
+    assert books[0].title == "Dragon"
+
+
+def test_author_match_is_a_candidate(catalog):
+    titles = [book.title for book in db.search_books("dragon", limit=100)]
+    assert titles[:2] == ["Dragon", "The Keep"]
+
+
+def test_description_matches_fill_the_rest(catalog):
+    assert len(db.search_books("dragon ", limit=100)) == 100
@@ -0,0 +1,140 @@
+"""Single-writer queue for database writes.
+
+SQLite allows one writer at a time. When several sessions commit on their
+own connections, they queue on the file lock, and a transaction that read
+before it wrote can fail outright with "database is locked". Instead, every
+write in the process is handed to one background thread with its own
+connection. It takes whatever writes are waiting, runs them in a single
+BEGIN IMMEDIATE transaction with one SAVEPOINT each, and commits once, so a
+burst of edits costs one commit rather than one per edit. An operation that
+raises is rolled back to its savepoint and its caller gets the exception.
+The rest of the group still commits. If another process holds the lock,
+the whole group is retried with a short backoff. ``on_commit`` runs after a
+commit that included at least one successful write submitted with
+``notify=True``, the default.
+"""
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+MAX_GROUP = 64  # writes committed together at most
+RETRIES = 5
+RETRY_DELAY = 0.05  # seconds, doubled on each retry
+
+
+def _is_busy(error):
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+
+class WriteQueue:
+    def __init__(self, connect, on_commit=None, max_group=MAX_GROUP):
+        self._connect = connect
+        self.on_commit = on_commit
+        self.max_group = max_group
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.writes = 0
+        self.groups = 0
+        self.failed = 0
+        self.retries = 0
+
+    def submit(self, fn, *args, notify=True):
+        """Queue ``fn(conn, *args)`` and return a Future for its result."""
+        future = Future()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+            self._queue.put((fn, args, future, notify))
+        return future
+
+    def run(self, fn, *args, timeout=None, notify=True):
+        return self.submit(fn, *args, notify=notify).result(timeout)
+
+    def close(self):
+        # Writes already queued are committed before the thread exits
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is not None:
+                self._queue.put(None)
+        if thread is not None:
+            thread.join()
+
+    def stats(self):
+        return {
+            "writes": self.writes,
+            "groups": self.groups,
+            "writes_per_group": self.writes / self.groups if self.groups else 0.0,
+            "failed": self.failed,
+            "retries": self.retries,
+            "queued": self._queue.qsize(),
+        }
+
+    def _run(self):
+        conn = self._connect()
+        conn.isolation_level = None  # transactions are managed here
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                group = [item]
+                while len(group) < self.max_group:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        self._queue.put(None)
+                        break
+                    group.append(item)
+                self._commit(conn, [entry for entry in group if entry[2].set_running_or_notify_cancel()])
+        finally:
+            conn.close()
+
+    def _commit(self, conn, group):
+        if not group:
+            return
+        delay = RETRY_DELAY
+        for attempt in range(RETRIES):
+            outcomes = []
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for fn, args, future, _ in group:
+                    conn.execute("SAVEPOINT write")
+                    try:
+                        outcomes.append((future, fn(conn, *args), None))
+                    except Exception as e:
+                        if isinstance(e, sqlite3.OperationalError) and _is_busy(e):
+                            raise
+                        conn.execute("ROLLBACK TO write")
+                        outcomes.append((future, None, e))
+                    conn.execute("RELEASE write")
+                conn.execute("COMMIT")
+                break
+            except sqlite3.OperationalError as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                if _is_busy(e) and attempt < RETRIES - 1:
+                    self.retries += 1
+                    time.sleep(delay)
+                    delay *= 2
+                    continue
+                outcomes = [(future, None, e) for _, _, future, _ in group]
+                break
+
+        self.groups += 1
+        self.writes += len(group)
+        self.failed += sum(1 for _, _, error in outcomes if error is not None)
+        # Caches are invalidated before any caller sees its result
+        if self.on_commit and any(error is None and entry[3] for (_, _, error), entry in zip(outcomes, group)):
+            self.on_commit()
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)